@@ -0,0 +1,203 @@
+"""
+bookstore_analytics.py
+- Sales rollups for the admin analytics page:
+    sales_daily_book    (day, b_id)   units / revenue per book per day
+    sales_monthly_book  (month, b_id) same per calendar month, with genre
+    customer_sales      (c_id)        lifetime purchases / units / revenue
+    book_velocity       (b_id)        units/day moving average (bookstore_reorder)
+- The purchase service calls record_sales() inside the purchase transaction
+  (the write-behind ledger worker calls record_sales_many() in the
+  transaction that writes its Reports batch), so the rollups are always
+  exactly in step with Reports and nothing ever has to re-aggregate the
+  raw table. rebuild_rollups() is the one-off backfill used by the schema
+  migration.
+- Refunds (bookstore_returns) call record_refunds(): units and revenue are
+  net, taken off on the day of the refund, and returned_units / refunds
+  keep what came back.
+- The dashboard queries read only rollup rows, so their cost depends on
+  the catalog size and date range, not on how big Reports is.
+"""
+
+from datetime import date, timedelta
+
+from bookstore_db import get_connection
+from bookstore_metrics import pass_through
+from bookstore_reorder import record_velocity
+
+UPSERT_DAILY = (
+    "INSERT INTO sales_daily_book (day, b_id, genre, units, revenue) VALUES (%s,%s,%s,%s,%s) "
+    "ON DUPLICATE KEY UPDATE units = units + VALUES(units), revenue = revenue + VALUES(revenue)"
+)
+UPSERT_MONTHLY = (
+    "INSERT INTO sales_monthly_book (month, b_id, genre, units, revenue) VALUES (%s,%s,%s,%s,%s) "
+    "ON DUPLICATE KEY UPDATE units = units + VALUES(units), revenue = revenue + VALUES(revenue)"
+)
+UPSERT_CUSTOMER = (
+    "INSERT INTO customer_sales (c_id, purchases, units, revenue, last_purchase) VALUES (%s,%s,%s,%s,%s) "
+    "ON DUPLICATE KEY UPDATE purchases = purchases + VALUES(purchases), units = units + VALUES(units), "
+    "revenue = revenue + VALUES(revenue), last_purchase = GREATEST(last_purchase, VALUES(last_purchase))"
+)
+# refunds: units / revenue go down, returned_units / refunds up
+_REFUND_UPDATE = ("ON DUPLICATE KEY UPDATE units = units + VALUES(units), revenue = revenue + VALUES(revenue), "
+                  "returned_units = returned_units + VALUES(returned_units), refunds = refunds + VALUES(refunds)")
+REFUND_DAILY = ("INSERT INTO sales_daily_book (day, b_id, genre, units, revenue, returned_units, refunds) "
+                "VALUES (%s,%s,%s,%s,%s,%s,%s) " + _REFUND_UPDATE)
+REFUND_MONTHLY = ("INSERT INTO sales_monthly_book (month, b_id, genre, units, revenue, returned_units, refunds) "
+                  "VALUES (%s,%s,%s,%s,%s,%s,%s) " + _REFUND_UPDATE)
+REFUND_CUSTOMER = ("INSERT INTO customer_sales (c_id, purchases, units, revenue, last_purchase, returned_units, "
+                   "refunds) VALUES (%s,0,%s,%s,%s,%s,%s) " + _REFUND_UPDATE)
+
+
+def record_sales(cur, day, c_id, lines):
+    """
+    Add one purchase (one or more Reports rows) to the rollups. lines: [(b_id, genre, qty, total), ...]
+    in b_id order. Must run on the cursor of the transaction that writes
+    the Reports rows.
+    """
+    month = day.replace(day=1)
+    cur.executemany(UPSERT_DAILY, [(day, b_id, genre, qty, total) for b_id, genre, qty, total in lines])
+    cur.executemany(UPSERT_MONTHLY, [(month, b_id, genre, qty, total) for b_id, genre, qty, total in lines])
+    if c_id is not None:
+        cur.execute(UPSERT_CUSTOMER, (c_id, len(lines), sum(l[2] for l in lines), sum(l[3] for l in lines), day))
+    record_velocity(cur, [(day, b_id, qty) for b_id, _, qty, _ in lines])
+
+
+def record_sales_many(cur, sales):
+    """
+    Add many purchases at once. sales: [(day, c_id, b_id, genre, qty, total), ...],
+    one entry per Reports row / purchase. Rows are pre-aggregated so every
+    rollup row is upserted once per call.
+    """
+    daily, monthly, customers = {}, {}, {}
+    for day, c_id, b_id, genre, qty, total in sales:
+        for rollup, key in ((daily, (day, b_id)), (monthly, (day.replace(day=1), b_id))):
+            prev = rollup.get(key, (genre, 0, 0))
+            rollup[key] = (genre, prev[1] + qty, prev[2] + total)
+        if c_id is not None:
+            purchases, units, revenue, last = customers.get(c_id, (0, 0, 0, day))
+            customers[c_id] = (purchases + 1, units + qty, revenue + total, max(last, day))
+    # sorted keys: concurrent writers lock rollup rows in the same order
+    cur.executemany(UPSERT_DAILY, [(d, b, g, u, r) for (d, b), (g, u, r) in sorted(daily.items())])
+    cur.executemany(UPSERT_MONTHLY, [(m, b, g, u, r) for (m, b), (g, u, r) in sorted(monthly.items())])
+    cur.executemany(UPSERT_CUSTOMER, [(c, p, u, r, last) for c, (p, u, r, last) in sorted(customers.items())])
+    record_velocity(cur, [(d, b, u) for (d, b), (_, u, _) in sorted(daily.items())])
+
+
+def record_refunds(cur, day, c_id, lines):
+    """
+    Take refunds off the rollups, on the cursor of the transaction that
+    writes them. lines: [(b_id, genre, qty, amount), ...]; b_id None (a
+    deleted title) only counts against the customer.
+    """
+    books = [(b_id, genre, qty, amount) for b_id, genre, qty, amount in lines if b_id is not None]
+    cur.executemany(REFUND_DAILY, [(day, b_id, genre, -qty, -amount, qty, amount)
+                                   for b_id, genre, qty, amount in books])
+    cur.executemany(REFUND_MONTHLY, [(day.replace(day=1), b_id, genre, -qty, -amount, qty, amount)
+                                     for b_id, genre, qty, amount in books])
+    if c_id is not None:
+        units, amount = sum(l[2] for l in lines), sum(l[3] for l in lines)
+        cur.execute(REFUND_CUSTOMER, (c_id, -units, -amount, day, units, amount))
+
+
+def rebuild_rollups(cur, refunds=True):
+    """
+    Recompute every rollup from Reports and refunds (backfill / repair; not
+    used on the hot path). Each rollup is one INSERT ... SELECT, so the rows
+    never leave the database and memory stays flat however big Reports is.
+    refunds=False: Reports only, for schemas older than the refunds table.
+    """
+    for table in ("sales_daily_book", "sales_monthly_book", "customer_sales"):
+        cur.execute(f"DELETE FROM {table}")
+    if refunds:
+        _rebuild_net_rollups(cur)
+        return
+    cur.execute(
+        "INSERT INTO sales_daily_book (day, b_id, genre, units, revenue) "
+        "SELECT r.date_of_purchase, r.b_id, COALESCE(MIN(b.genre), ''), SUM(r.quantity), SUM(r.price) "
+        "FROM Reports r LEFT JOIN Books b ON b.b_id = r.b_id "
+        "WHERE r.b_id IS NOT NULL GROUP BY r.date_of_purchase, r.b_id")
+    cur.execute(
+        "INSERT INTO sales_monthly_book (month, b_id, genre, units, revenue) "
+        "SELECT DATE_FORMAT(day, '%Y-%m-01'), b_id, MIN(genre), SUM(units), SUM(revenue) "
+        "FROM sales_daily_book GROUP BY DATE_FORMAT(day, '%Y-%m-01'), b_id")
+    cur.execute(
+        "INSERT INTO customer_sales (c_id, purchases, units, revenue, last_purchase) "
+        "SELECT c_id, COUNT(*), SUM(quantity), SUM(price), MAX(date_of_purchase) "
+        "FROM Reports WHERE c_id IS NOT NULL GROUP BY c_id")
+
+
+def _rebuild_net_rollups(cur):
+    # purchases and refunds in one GROUP BY: a refund counts on the day it was made
+    cur.execute(
+        "INSERT INTO sales_daily_book (day, b_id, genre, units, revenue, returned_units, refunds) "
+        "SELECT x.day, x.b_id, COALESCE(MIN(b.genre), ''), SUM(x.units), SUM(x.revenue), SUM(x.returned), "
+        "SUM(x.refunded) FROM (SELECT date_of_purchase AS day, b_id, quantity AS units, price AS revenue, "
+        "0 AS returned, 0 AS refunded FROM Reports "
+        "UNION ALL SELECT day, b_id, -quantity, -amount, quantity, amount FROM refunds) x "
+        "LEFT JOIN Books b ON b.b_id = x.b_id WHERE x.b_id IS NOT NULL GROUP BY x.day, x.b_id")
+    cur.execute(
+        "INSERT INTO sales_monthly_book (month, b_id, genre, units, revenue, returned_units, refunds) "
+        "SELECT DATE_FORMAT(day, '%Y-%m-01'), b_id, MIN(genre), SUM(units), SUM(revenue), SUM(returned_units), "
+        "SUM(refunds) FROM sales_daily_book GROUP BY DATE_FORMAT(day, '%Y-%m-01'), b_id")
+    cur.execute(
+        "INSERT INTO customer_sales (c_id, purchases, units, revenue, last_purchase, returned_units, refunds) "
+        "SELECT x.c_id, SUM(x.purchases), SUM(x.units), SUM(x.revenue), MAX(x.last_purchase), SUM(x.returned), "
+        "SUM(x.refunded) FROM (SELECT c_id, 1 AS purchases, quantity AS units, price AS revenue, "
+        "date_of_purchase AS last_purchase, 0 AS returned, 0 AS refunded FROM Reports "
+        "UNION ALL SELECT c_id, 0, -quantity, -amount, NULL, quantity, amount FROM refunds) x "
+        "WHERE x.c_id IS NOT NULL GROUP BY x.c_id")
+
+
+@pass_through
+def _query(sql, params=(), connect=get_connection):
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        columns = [d[0] for d in cur.description]
+        return columns, cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def top_books(days=30, n=10, today=None, connect=get_connection):
+    since = (today or date.today()) - timedelta(days=days - 1)
+    return _query(
+        "SELECT s.b_id, b.b_name, SUM(s.units) AS units, SUM(s.revenue) AS revenue "
+        "FROM sales_daily_book s LEFT JOIN Books b ON b.b_id = s.b_id "
+        "WHERE s.day >= %s GROUP BY s.b_id, b.b_name ORDER BY revenue DESC, s.b_id LIMIT %s",
+        (since, n), connect)
+
+
+def daily_revenue(days=30, today=None, connect=get_connection):
+    since = (today or date.today()) - timedelta(days=days - 1)
+    return _query(
+        "SELECT day, SUM(units) AS units, SUM(revenue) AS revenue FROM sales_daily_book "
+        "WHERE day >= %s GROUP BY day ORDER BY day", (since,), connect)
+
+
+def monthly_revenue(months=12, today=None, connect=get_connection):
+    since = _months_back(today or date.today(), months - 1)
+    return _query(
+        "SELECT month, SUM(units) AS units, SUM(revenue) AS revenue FROM sales_monthly_book "
+        "WHERE month >= %s GROUP BY month ORDER BY month", (since,), connect)
+
+
+def genre_totals(months=12, today=None, connect=get_connection):
+    since = _months_back(today or date.today(), months - 1)
+    return _query(
+        "SELECT genre, SUM(units) AS units, SUM(revenue) AS revenue FROM sales_monthly_book "
+        "WHERE month >= %s GROUP BY genre ORDER BY revenue DESC", (since,), connect)
+
+
+def top_customers(n=10, connect=get_connection):
+    return _query(
+        "SELECT s.c_id, c.c_name, s.purchases, s.units, s.revenue, s.last_purchase "
+        "FROM customer_sales s LEFT JOIN Customer c ON c.cust_id = s.c_id "
+        "ORDER BY s.revenue DESC LIMIT %s", (n,), connect)
+
+
+def _months_back(day, months):
+    y, m = divmod(day.year * 12 + day.month - 1 - months, 12)
+    return date(y, m + 1, 1)
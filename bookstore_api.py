@@ -0,0 +1,844 @@
+"""
+bookstore_api.py
+- Async HTTP server for the bookstore: the Jinja pages in templates/ (login,
+  dashboards, manage books/authors/staff/customers, reports, browse/buy,
+  purchase history) and a JSON API under /api for the same operations as
+  streamlit_app.py.
+- Starlette on uvicorn (ASGI). Handlers are coroutines; every database call
+  is handed to a thread pool the size of the connection pool (bookstore_db),
+  so the event loop never blocks on a query and at most POOL_SIZE queries
+  are in flight. That keeps one data layer - the same pool, backends,
+  purchase retries, catalog cache and search index - instead of a second,
+  async-only driver stack.
+- Sessions are signed cookies (BOOKSTORE_API_SECRET) carrying a
+  bookstore_auth session token; each request resolves it in memory.
+Usage:
+    python bookstore_bootstrap.py api [--host 127.0.0.1] [--port 8000]
+
+JSON API (session cookie from POST /api/login):
+    POST   /api/login                 {"login_id", "password"}
+    POST   /api/logout
+    GET    /api/books?after=&limit=&q=
+    GET    /api/authors/{a_id}/books?after=&limit=                    in-stock titles by one author
+    POST   /api/purchase              {"b_id", "quantity"}            customer
+    POST   /api/checkout              {"items": {"<b_id>": qty, ...}}  customer
+    GET    /api/history?after=&limit=                                 customer
+    POST   /api/history/{r_no}/return {"quantity", "reason"}          customer
+    GET    /api/reports?after=&limit=                                 admin
+    GET    /api/reports/summary                                       admin
+    GET    /api/refunds?after=&limit=                                 admin
+    POST   /api/refunds               {"r_no", "quantity", "reason"}  admin
+    GET    /api/analytics?days=&n=                                    admin
+    GET    /api/reorder      (POST: also create restock orders)       admin
+    GET    /api/promotions?after=&limit=&state=                       admin
+    POST   /api/promotions  {"name", "kind", "amount", "starts_at", "ends_at", "b_id" | "genre"}  admin
+    POST   /api/promotions/{promo_id}/end                             admin
+    POST   /api/books/{b_id}/price    {"price"}  list price           admin
+    GET    /api/books/{b_id}/prices?after=&limit=  price history      admin
+    GET    /api/restock      open restock orders                      admin
+    POST   /api/restock/{o_id}/receive                                admin
+    GET    /api/{books,authors,staff,customers}?after=&limit=         admin
+    POST   /api/{books,authors,staff,customers}                       admin
+    DELETE /api/{books,authors,staff,customers}/{id}                  admin
+
+Metrics (Prometheus text format; admin session or "Authorization: Bearer
+$BOOKSTORE_METRICS_TOKEN"):
+    GET    /metrics                   query latency histograms, rows, pool
+"""
+
+import asyncio
+import json
+import os
+import secrets
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from functools import partial, wraps
+
+import numpy as np
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse
+from starlette.routing import Route
+
+from bookstore_auth import create_login, login as auth_login, logout as logout_session, session, sessions
+from bookstore_analytics import daily_revenue, genre_totals, monthly_revenue, top_books, top_customers
+from bookstore_authors import author_map, books_by_author, books_page, join_authors, link_authors
+from bookstore_catalog import author_deleted, book_added, book_deleted
+from bookstore_db import DB_ERRORS, POOL_SIZE, fetch_page, get_connection, get_pool
+from bookstore_import import IMPORT_SPECS, split_row, stored_columns, validate_row
+from bookstore_inventory import open_stock, shutdown as shutdown_inventory, start_compactor
+from bookstore_ledger import buy, shutdown as shutdown_ledger
+from bookstore_metrics import pass_through, prometheus_text
+from bookstore_pricing import (PricingError, add_promotion, end_promotion, price_history, promotions_page, reprice,
+                               set_price, shutdown as shutdown_pricing, start_price_clock)
+from bookstore_purchase import PurchaseError, checkout_cart
+from bookstore_reorder import check_stock, open_orders, receive_restock
+from bookstore_reporting import sales_report
+from bookstore_returns import RefundError, refund_purchase, refunds_page, return_purchase
+from bookstore_search import search_books
+
+API_SECRET = os.environ.get("BOOKSTORE_API_SECRET") or secrets.token_hex(32)
+METRICS_TOKEN = os.environ.get("BOOKSTORE_METRICS_TOKEN")     # bearer token for scraping /metrics
+API_PAGE_SIZE = 50
+API_MAX_PAGE = 500
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="bookstore-db")
+
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking database call on the DB thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+
+# ---------- data access (blocking; always called through run_db) ----------
+@pass_through
+def _query(sql, params=()):
+    conn = get_connection()
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute(sql, params)
+        return cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+
+@pass_through
+def _execute(statements):
+    """Run [(sql, params)] in one transaction; returns the last statement's rowcount."""
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        for sql, params in statements:
+            cur.execute(sql, params)
+        conn.commit()
+        return cur.rowcount
+    finally:
+        cur.close()
+        conn.close()
+
+
+@pass_through
+def _page(table, key, after, limit, where=None, params=()):
+    columns, rows, next_after = fetch_page(table, key, after, limit, where, params)
+    return [dict(zip(columns, r)) for r in rows], next_after
+
+
+@pass_through
+def _books(fetch, *args, **kwargs):
+    """A books_page / books_by_author page as (dicts with "authors", next_after)."""
+    columns, rows, next_after = fetch(*args, **kwargs)
+    return [dict(zip(columns, r)) for r in rows], next_after
+
+
+def open_session(login_id, password):
+    """Log in; returns the session fields to store in the cookie, or None."""
+    result = auth_login(login_id, password)
+    if result is None:
+        return None
+    token, user = result
+    fields = {"token": token, "user_type": user["role"], "user_id": user["login_id"]}
+    if user["cust_id"] is not None:
+        fields["cust_id"] = user["cust_id"]
+    return fields
+
+
+def reports_page(after, limit, cust_id=None):
+    """Reports joined with customer and book names, keyset-paged on r_no."""
+    where, params = "r.r_no > %s", [after or 0]
+    if cust_id is not None:
+        where += " AND r.c_id = %s"
+        params.append(cust_id)
+    rows = _query(
+        "SELECT r.r_no, r.date_of_purchase AS p_date, r.c_id, c.c_name, r.b_id, b.b_name, r.quantity, r.returned, "
+        "r.price "
+        "FROM Reports r LEFT JOIN Customer c ON c.cust_id = r.c_id LEFT JOIN Books b ON b.b_id = r.b_id "
+        f"WHERE {where} ORDER BY r.r_no LIMIT %s", (*params, limit + 1))
+    next_after = rows[limit - 1]["r_no"] if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+# kind -> (primary key, list query); add / delete go through IMPORT_SPECS
+MANAGED = {
+    "books": ("b_id", None),
+    "authors": ("a_id", None),
+    "staff": ("s_id", None),
+    # the templates call the phone column "phone"
+    "customers": ("cust_id", "cust_id, c_name, address, phoneno AS phone, login_id"),
+}
+
+
+def create_record(kind, fields):
+    """
+    Validate and INSERT one books/authors/staff/customers record (customers
+    may bring a password; a book's a_name may list several authors with ";").
+    """
+    table, columns = IMPORT_SPECS[kind]
+    row, authors = split_row(validate_row(kind, fields), columns)
+    names = [name for name, _, _ in stored_columns(columns)]
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        if kind == "customers" and fields.get("password"):
+            if not fields.get("login_id"):
+                raise ValueError("login_id: required with a password")
+            create_login(cur, fields["login_id"], str(fields["password"]))
+        cur.execute(f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join(['%s'] * len(names))})", row)
+        if authors is not None:
+            link_authors(cur, [(row[0], authors)])
+        if table == "Books":
+            open_stock(cur, [row[0]])
+            reprice(cur, [row[0]])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    record = dict(zip(names, row))
+    if table == "Books":
+        record["authors"] = join_authors(authors)
+        book_added(record["b_id"], record["b_name"], record["authors"], record["genre"])
+    elif table == "Author":
+        author_map.added(*row)
+    return record
+
+
+def delete_record(kind, key_value):
+    table, _ = IMPORT_SPECS[kind]
+    key, _ = MANAGED[kind]
+    login_id = None
+    if table == "Customer":
+        rows = _query("SELECT login_id FROM Customer WHERE cust_id = %s", (key_value,))
+        login_id = rows[0]["login_id"] if rows else None
+    deleted = _execute([(f"DELETE FROM {table} WHERE {key} = %s", (key_value,))])
+    if table == "Books" and deleted:
+        book_deleted(key_value)
+    elif table == "Author" and deleted:
+        author_deleted(key_value)
+    if login_id is not None:
+        sessions.revoke_user(login_id)      # their open sessions still carry the old cust_id
+    return deleted
+
+
+def list_records(kind, after, limit):
+    table, _ = IMPORT_SPECS[kind]
+    key, select = MANAGED[kind]
+    if table == "Books":
+        return _books(books_page, after, limit)
+    if select is None:
+        return _page(table, key, after, limit)
+    where, params = (f"{key} > %s", (after,)) if after is not None else ("1 = 1", ())
+    rows = _query(f"SELECT {select} FROM {table} WHERE {where} ORDER BY {key} LIMIT %s", (*params, limit + 1))
+    return rows[:limit], (rows[limit - 1][key] if len(rows) > limit else None)
+
+
+def report_summary():
+    report = sales_report()
+    ltv = report.lifetime_value().head(20)
+    return {
+        "totals": report.totals(),
+        "daily": [{"day": d, **row} for d, row in report.daily().tail(30).to_dict("index").items()],
+        "top_customers": [{"c_id": int(c), **row} for c, row in ltv.to_dict("index").items()],
+    }
+
+
+def analytics(days, n):
+    def rows(result):
+        columns, data = result
+        return [dict(zip(columns, r)) for r in data]
+    return {
+        "daily_revenue": rows(daily_revenue(days)),
+        "top_books": rows(top_books(days, n)),
+        "genre_totals": rows(genre_totals(max(1, days // 30))),
+        "monthly_revenue": rows(monthly_revenue(12)),
+        "top_customers": rows(top_customers(n)),
+    }
+
+
+# ---------- responses ----------
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if hasattr(value, "item"):         # numpy / pandas scalars
+        return value.item()
+    if hasattr(value, "isoformat"):    # pandas Timestamp
+        return value.isoformat()
+    raise TypeError(f"not JSON serializable: {type(value).__name__}")
+
+
+class JSON(JSONResponse):
+    def render(self, content):
+        return json.dumps(content, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+
+def error(status, message):
+    return JSON({"error": message}, status_code=status)
+
+
+class _TxtLoader(FileSystemLoader):
+    """Templates are stored as name.html.txt but extend / include each other as name.html."""
+
+    def get_source(self, environment, template):
+        return super().get_source(environment, template + ".txt")
+
+
+templates = Environment(loader=_TxtLoader(TEMPLATE_DIR), autoescape=select_autoescape(["html"]))
+
+
+def flash(request, message, category="info"):
+    request.session.setdefault("_flashes", []).append([category, message])
+
+
+def _flashed(request, with_categories=False):
+    messages = request.session.pop("_flashes", [])
+    return [tuple(m) for m in messages] if with_categories else [m[1] for m in messages]
+
+
+def render(request, name, **context):
+    """Render a template with the Flask-style globals they were written for."""
+    html = templates.get_template(name).render(
+        session=request.session,
+        url_for=lambda endpoint, **params: request.app.url_path_for(endpoint, **params),
+        get_flashed_messages=partial(_flashed, request),
+        **context)
+    return HTMLResponse(html)
+
+
+def redirect(request, endpoint, **params):
+    return RedirectResponse(request.app.url_path_for(endpoint, **params), status_code=303)
+
+
+def _int_arg(request, name, default=None, maximum=None):
+    raw = request.query_params.get(name)
+    try:
+        value = int(raw) if raw not in (None, "") else default
+    except ValueError:
+        raise ValueError(f"{name}: not a number")
+    return min(value, maximum) if maximum and value is not None else value
+
+
+def requires(role, api=False):
+    """
+    Only let sessions of `role` through; pages redirect to the login form, the
+    API answers 401/403. The cookie's token is checked against the in-memory
+    session cache, so logouts and revoked sessions end here without a query.
+    """
+    def decorate(handler):
+        @wraps(handler)
+        async def endpoint(request):
+            user = session(request.session.get("token"))
+            if user is None:
+                request.session.clear()
+            user_type = user["role"] if user else None
+            if user_type != role:
+                if api:
+                    return error(401 if user_type is None else 403, "login required" if user_type is None
+                                 else f"{role} only")
+                flash(request, "Please log in first.", "warning")
+                return redirect(request, "login")
+            return await handler(request)
+        return endpoint
+    return decorate
+
+
+def _page_args(request):
+    return _int_arg(request, "after"), _int_arg(request, "limit", API_PAGE_SIZE, API_MAX_PAGE)
+
+
+# ---------- HTML pages ----------
+async def home(request):
+    user_type = request.session.get("user_type")
+    if user_type == "admin":
+        return redirect(request, "admin_dashboard")
+    if user_type == "customer":
+        return redirect(request, "customer_dashboard")
+    return redirect(request, "login")
+
+
+async def login(request):
+    if request.method == "POST":
+        form = await request.form()
+        user = await run_db(open_session, form.get("login_id", ""), form.get("password", ""))
+        if user is None:
+            flash(request, "Invalid credentials.", "danger")
+        else:
+            request.session.clear()
+            request.session.update(user)
+            flash(request, f"Welcome, {user['user_id']}!", "success")
+            return redirect(request, "home")
+    return render(request, "login.html")
+
+
+async def logout(request):
+    logout_session(request.session.get("token"))
+    request.session.clear()
+    flash(request, "Logged out.", "info")
+    return redirect(request, "login")
+
+
+@requires("admin")
+async def admin_dashboard(request):
+    return render(request, "admin_dashboard.html")
+
+
+def _manage_page(kind, template, context_name):
+    @requires("admin")
+    async def page(request):
+        after = _int_arg(request, "after")
+        rows, next_after = await run_db(list_records, kind, after, API_MAX_PAGE)
+        return render(request, template, **{context_name: rows}, next_after=next_after)
+    return page
+
+
+def _add_form(kind, label, back):
+    @requires("admin")
+    async def add(request):
+        fields = dict(await request.form())
+        if kind == "customers":
+            fields.setdefault("phoneno", fields.pop("phone", ""))
+            fields.setdefault("address", fields.get("address") or "-")
+        try:
+            await run_db(create_record, kind, fields)
+            flash(request, f"{label} added.", "success")
+        except ValueError as e:
+            flash(request, f"Could not add {label.lower()}: {e}", "danger")
+        except DB_ERRORS as e:
+            flash(request, f"Could not add {label.lower()}: {e}", "danger")
+        return redirect(request, back)
+    return add
+
+
+def _delete_form(kind, label, param, back):
+    @requires("admin")
+    async def delete(request):
+        try:
+            deleted = await run_db(delete_record, kind, request.path_params[param])
+            if deleted:
+                flash(request, f"{label} deleted.", "success")
+            else:
+                flash(request, f"{label} not found.", "warning")
+        except DB_ERRORS as e:
+            flash(request, f"Could not delete {label.lower()}: {e}", "danger")
+        return redirect(request, back)
+    return delete
+
+
+@requires("admin")
+async def admin_view_reports(request):
+    rows, next_after = await run_db(reports_page, _int_arg(request, "after"), API_MAX_PAGE)
+    return render(request, "admin_view_reports.html", reports=rows, next_after=next_after)
+
+
+@requires("customer")
+async def customer_dashboard(request):
+    return render(request, "customer_dashboard.html")
+
+
+@requires("customer")
+async def customer_view_books(request):
+    """Books in stock; ?author=<a_id> browses one author's titles, ?author_name= finds authors."""
+    after, a_id = _int_arg(request, "after"), _int_arg(request, "author")
+    author_name = request.query_params.get("author_name", "").strip()
+    matches = await run_db(author_map.matching, author_name) if author_name else None
+    if a_id is not None:
+        rows, next_after = await run_db(_books, books_by_author, a_id, after, API_MAX_PAGE, in_stock_only=True)
+    else:
+        rows, next_after = await run_db(_books, books_page, after, API_MAX_PAGE, "quantity > 0")
+    author = (await run_db(author_map.names, [a_id])).get(a_id) if a_id is not None else None
+    return render(request, "customer_view_books.html", books=rows, next_after=next_after, author=author,
+                  author_id=a_id, author_name=author_name, matches=matches)
+
+
+@requires("customer")
+async def customer_buy_book(request):
+    form = await request.form()
+    try:
+        b_id, qty = int(form.get("b_id", "")), int(form.get("quantity", "1"))
+        _, total = await run_db(buy, b_id, request.session["cust_id"], qty)
+        flash(request, f"Purchase successful! Total: Rs. {float(total):.2f}", "success")
+    except ValueError:
+        flash(request, "Invalid book or quantity.", "danger")
+    except PurchaseError as e:
+        flash(request, str(e), "danger")
+    return redirect(request, "customer_view_books")
+
+
+@requires("customer")
+async def customer_purchase_history(request):
+    rows, next_after = await run_db(reports_page, _int_arg(request, "after"), API_MAX_PAGE,
+                                    request.session["cust_id"])
+    return render(request, "customer_history.html", history=rows, next_after=next_after)
+
+
+@requires("customer")
+async def customer_return(request):
+    form = await request.form()
+    try:
+        qty = int(form.get("quantity", "1"))
+        _, amount = await run_db(return_purchase, request.path_params["r_no"], qty, request.session["cust_id"],
+                                 request.session["user_id"], form.get("reason") or None)
+        flash(request, f"Return accepted. Refund: Rs. {float(amount):.2f}", "success")
+    except ValueError:
+        flash(request, "Invalid quantity.", "danger")
+    except RefundError as e:
+        flash(request, str(e), "danger")
+    return redirect(request, "customer_purchase_history")
+
+
+# ---------- JSON API ----------
+async def _body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise ValueError("body must be JSON")
+    if not isinstance(body, dict):
+        raise ValueError("body must be a JSON object")
+    return body
+
+
+def api_errors(handler):
+    """Map the services' exceptions to JSON error responses."""
+    @wraps(handler)
+    async def endpoint(request):
+        try:
+            return await handler(request)
+        except (ValueError, PricingError) as e:
+            return error(400, str(e))
+        except (PurchaseError, RefundError) as e:
+            return error(409, str(e))
+        except DB_ERRORS as e:
+            return error(409, str(e))
+    return endpoint
+
+
+@api_errors
+async def api_login(request):
+    body = await _body(request)
+    user = await run_db(open_session, str(body.get("login_id", "")), str(body.get("password", "")))
+    if user is None:
+        return error(401, "invalid credentials")
+    request.session.clear()
+    request.session.update(user)
+    return JSON({k: v for k, v in user.items() if k != "token"})
+
+
+async def api_logout(request):
+    logout_session(request.session.get("token"))
+    request.session.clear()
+    return JSON({"ok": True})
+
+
+@api_errors
+async def api_books(request):
+    query = request.query_params.get("q", "").strip()
+    if query:
+        limit = _int_arg(request, "limit", 20, API_MAX_PAGE)
+        columns, rows = await run_db(search_books, query, limit)
+        return JSON({"books": [dict(zip(columns, r)) for r in rows], "next_after": None})
+    after, limit = _page_args(request)
+    rows, next_after = await run_db(_books, books_page, after, limit, "quantity > 0")
+    return JSON({"books": rows, "next_after": next_after})
+
+
+@api_errors
+async def api_author_books(request):
+    after, limit = _page_args(request)
+    rows, next_after = await run_db(_books, books_by_author, request.path_params["a_id"], after, limit,
+                                    in_stock_only=True)
+    return JSON({"books": rows, "next_after": next_after})
+
+
+@requires("customer", api=True)
+@api_errors
+async def api_purchase(request):
+    body = await _body(request)
+    try:
+        b_id, qty = int(body["b_id"]), int(body.get("quantity", 1))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("b_id and quantity must be numbers")
+    r_no, total = await run_db(buy, b_id, request.session["cust_id"], qty)
+    return JSON({"r_no": r_no, "queued": r_no is None, "total": total})
+
+
+@requires("customer", api=True)
+@api_errors
+async def api_checkout(request):
+    body = await _body(request)
+    try:
+        cart = {int(b): int(q) for b, q in dict(body.get("items") or {}).items()}
+    except (TypeError, ValueError):
+        raise ValueError('items must be {"<b_id>": quantity, ...}')
+    lines, total = await run_db(checkout_cart, cart, request.session["cust_id"])
+    return JSON({"lines": [{"b_id": b, "quantity": q, "total": t} for b, q, t in lines], "total": total})
+
+
+@requires("customer", api=True)
+@api_errors
+async def api_history(request):
+    after, limit = _page_args(request)
+    rows, next_after = await run_db(reports_page, after, limit, request.session["cust_id"])
+    return JSON({"history": rows, "next_after": next_after})
+
+
+def _refund_args(body):
+    try:
+        return int(body.get("quantity", 1)), (str(body["reason"]) if body.get("reason") else None)
+    except (TypeError, ValueError):
+        raise ValueError("quantity must be a number")
+
+
+@requires("customer", api=True)
+@api_errors
+async def api_return(request):
+    qty, reason = _refund_args(await _body(request))
+    rf_no, amount = await run_db(return_purchase, request.path_params["r_no"], qty, request.session["cust_id"],
+                                 request.session["user_id"], reason)
+    return JSON({"rf_no": rf_no, "amount": amount})
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_refunds(request):
+    """GET: refunds, keyset-paged; POST: refund part or all of any purchase."""
+    if request.method == "POST":
+        body = await _body(request)
+        try:
+            r_no = int(body["r_no"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("r_no must be a number")
+        qty, reason = _refund_args(body)
+        rf_no, amount = await run_db(refund_purchase, r_no, qty, reason, request.session["user_id"])
+        return JSON({"rf_no": rf_no, "amount": amount}, status_code=201)
+    after, limit = _page_args(request)
+    columns, rows, next_after = await run_db(refunds_page, after, limit)
+    return JSON({"refunds": [dict(zip(columns, r)) for r in rows], "next_after": next_after})
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_reports(request):
+    after, limit = _page_args(request)
+    rows, next_after = await run_db(reports_page, after, limit)
+    return JSON({"reports": rows, "next_after": next_after})
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_report_summary(request):
+    return JSON(await run_db(report_summary))
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_analytics(request):
+    days, n = _int_arg(request, "days", 30, 3650), _int_arg(request, "n", 10, 100)
+    return JSON(await run_db(analytics, days, n))
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_reorder(request):
+    """GET: titles about to run out; POST: also file restock orders for them."""
+    suggestions, created = await run_db(check_stock, request.method == "POST")
+    return JSON({"suggestions": suggestions.replace({np.inf: None}).to_dict("records"), "created": created})
+
+
+def _when(body, name):
+    try:
+        return datetime.fromisoformat(str(body[name]))
+    except (KeyError, ValueError):
+        raise ValueError(f"{name} must be an ISO date and time")
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_promotions(request):
+    """GET: promotions, keyset-paged (?state=scheduled|active|ended); POST: schedule one."""
+    if request.method == "POST":
+        body = await _body(request)
+        try:
+            b_id = int(body["b_id"]) if body.get("b_id") is not None else None
+            amount = Decimal(str(body["amount"]))
+        except (KeyError, TypeError, ArithmeticError, ValueError):
+            raise ValueError("amount (and b_id, if given) must be numbers")
+        promo_id = await run_db(add_promotion, str(body.get("name") or "promotion"), body.get("kind"), amount,
+                                _when(body, "starts_at"), _when(body, "ends_at"), b_id, body.get("genre"),
+                                request.session["user_id"])
+        return JSON({"promo_id": promo_id}, status_code=201)
+    after, limit = _page_args(request)
+    columns, rows, next_after = await run_db(promotions_page, after, limit, request.query_params.get("state"))
+    return JSON({"promotions": [dict(zip(columns, r)) for r in rows], "next_after": next_after})
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_end_promotion(request):
+    if not await run_db(end_promotion, request.path_params["promo_id"]):
+        return error(404, "no such running or scheduled promotion")
+    return JSON({"ended": request.path_params["promo_id"]})
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_set_price(request):
+    body = await _body(request)
+    try:
+        price = Decimal(str(body["price"]))
+    except (KeyError, ArithmeticError):
+        raise ValueError("price must be a number")
+    effective = await run_db(set_price, request.path_params["b_id"], price)
+    return JSON({"b_id": request.path_params["b_id"], "price": price, "effective_price": effective})
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_price_history(request):
+    after, limit = _page_args(request)
+    columns, rows, next_after = await run_db(price_history, request.path_params["b_id"], after, limit)
+    return JSON({"prices": [dict(zip(columns, r)) for r in rows], "next_after": next_after})
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_restock_orders(request):
+    columns, rows = await run_db(open_orders)
+    return JSON({"orders": [dict(zip(columns, r)) for r in rows]})
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_receive_restock(request):
+    if not await run_db(receive_restock, request.path_params["o_id"]):
+        return error(404, "no such open order")
+    return JSON({"received": request.path_params["o_id"]})
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_records(request):
+    kind = request.path_params["kind"]
+    if kind not in MANAGED:
+        return error(404, f"no such kind: {kind}")
+    if request.method == "POST":
+        return JSON(await run_db(create_record, kind, await _body(request)), status_code=201)
+    after, limit = _page_args(request)
+    rows, next_after = await run_db(list_records, kind, after, limit)
+    return JSON({kind: rows, "next_after": next_after})
+
+
+@requires("admin", api=True)
+@api_errors
+async def api_delete_record(request):
+    kind = request.path_params["kind"]
+    if kind not in MANAGED:
+        return error(404, f"no such kind: {kind}")
+    if not await run_db(delete_record, kind, request.path_params["key"]):
+        return error(404, "not found")
+    return JSON({"deleted": request.path_params["key"]})
+
+
+async def metrics(request):
+    auth = request.headers.get("authorization", "")
+    token_ok = METRICS_TOKEN and secrets.compare_digest(auth, f"Bearer {METRICS_TOKEN}")
+    user = session(request.session.get("token"))
+    if not token_ok and (user is None or user["role"] != "admin"):
+        return PlainTextResponse("admin or metrics token required\n", status_code=401)
+    return PlainTextResponse(prometheus_text(pool=get_pool()), media_type="text/plain; version=0.0.4")
+
+
+_KINDS = "{kind:str}"
+
+routes = [
+    Route("/", home, name="home"),
+    Route("/login", login, methods=["GET", "POST"], name="login"),
+    Route("/logout", logout, name="logout"),
+    Route("/admin", admin_dashboard, name="admin_dashboard"),
+    Route("/admin/books", _manage_page("books", "admin_manage_books.html", "books"), name="admin_manage_books"),
+    Route("/admin/books/add", _add_form("books", "Book", "admin_manage_books"), methods=["POST"],
+          name="admin_add_book"),
+    Route("/admin/books/{book_id:int}/delete", _delete_form("books", "Book", "book_id", "admin_manage_books"),
+          methods=["POST"], name="admin_delete_book"),
+    Route("/admin/authors", _manage_page("authors", "admin_manage_authors.html", "authors"),
+          name="admin_manage_authors"),
+    Route("/admin/authors/add", _add_form("authors", "Author", "admin_manage_authors"), methods=["POST"],
+          name="admin_add_author"),
+    Route("/admin/authors/{author_id:int}/delete",
+          _delete_form("authors", "Author", "author_id", "admin_manage_authors"),
+          methods=["POST"], name="admin_delete_author"),
+    Route("/admin/staff", _manage_page("staff", "admin_manage_staff.html", "staff_list"), name="admin_manage_staff"),
+    Route("/admin/staff/add", _add_form("staff", "Staff member", "admin_manage_staff"), methods=["POST"],
+          name="admin_add_staff"),
+    Route("/admin/staff/{staff_id:int}/delete",
+          _delete_form("staff", "Staff member", "staff_id", "admin_manage_staff"),
+          methods=["POST"], name="admin_delete_staff"),
+    Route("/admin/customers", _manage_page("customers", "admin_manage_customers.html", "customers"),
+          name="admin_manage_customers"),
+    Route("/admin/customers/add", _add_form("customers", "Customer", "admin_manage_customers"), methods=["POST"],
+          name="admin_add_customer"),
+    Route("/admin/customers/{customer_id:int}/delete",
+          _delete_form("customers", "Customer", "customer_id", "admin_manage_customers"),
+          methods=["POST"], name="admin_delete_customer"),
+    Route("/admin/reports", admin_view_reports, name="admin_view_reports"),
+    Route("/customer", customer_dashboard, name="customer_dashboard"),
+    Route("/customer/books", customer_view_books, name="customer_view_books"),
+    Route("/customer/buy", customer_buy_book, methods=["POST"], name="customer_buy_book"),
+    Route("/customer/history", customer_purchase_history, name="customer_purchase_history"),
+    Route("/customer/history/{r_no:int}/return", customer_return, methods=["POST"], name="customer_return"),
+
+    Route("/metrics", metrics),
+
+    Route("/api/login", api_login, methods=["POST"]),
+    Route("/api/logout", api_logout, methods=["POST"]),
+    Route("/api/books", api_books),
+    Route("/api/authors/{a_id:int}/books", api_author_books),
+    Route("/api/purchase", api_purchase, methods=["POST"]),
+    Route("/api/checkout", api_checkout, methods=["POST"]),
+    Route("/api/history", api_history),
+    Route("/api/history/{r_no:int}/return", api_return, methods=["POST"]),
+    Route("/api/refunds", api_refunds, methods=["GET", "POST"]),
+    Route("/api/reports", api_reports),
+    Route("/api/reports/summary", api_report_summary),
+    Route("/api/analytics", api_analytics),
+    Route("/api/reorder", api_reorder, methods=["GET", "POST"]),
+    Route("/api/restock", api_restock_orders),
+    Route("/api/restock/{o_id:int}/receive", api_receive_restock, methods=["POST"]),
+    Route("/api/promotions", api_promotions, methods=["GET", "POST"]),
+    Route("/api/promotions/{promo_id:int}/end", api_end_promotion, methods=["POST"]),
+    Route("/api/books/{b_id:int}/price", api_set_price, methods=["POST"]),
+    Route("/api/books/{b_id:int}/prices", api_price_history),
+    Route("/api/{kind:str}", api_records, methods=["GET", "POST"]),
+    Route("/api/{kind:str}/{key:int}", api_delete_record, methods=["DELETE"]),
+]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    start_compactor()
+    start_price_clock()
+    yield
+    # flush queued write-behind purchases before the process goes away
+    await run_db(shutdown_ledger)
+    await run_db(shutdown_inventory)
+    await run_db(shutdown_pricing)
+
+
+def create_app(secret=API_SECRET):
+    return Starlette(routes=routes, lifespan=lifespan,
+                     middleware=[Middleware(SessionMiddleware, secret_key=secret, session_cookie="bookstore_session")])
+
+
+app = create_app()
+
+
+def serve(host="127.0.0.1", port=8000):
+    import uvicorn
+    uvicorn.run(app, host=host, port=port, log_level="warning", access_log=False)
@@ -0,0 +1,218 @@
+"""
+bookstore_auth.py
+- Password hashing, roles and login sessions for the CLI, Streamlit and the API.
+- Passwords are stored as salted scrypt hashes ("scrypt$n$r$p$salt$hash"):
+  deliberately slow and memory-hard, so a leaked Authentication table is
+  expensive to brute-force. Rows still holding a plaintext password (created
+  before migration 7) are accepted once and re-hashed on that login; the
+  same happens when the cost parameters are raised.
+- The role (admin / customer) is a column of Authentication, read together
+  with the customer id in the single query login needs.
+- A successful login returns a signed session token. The token resolves to
+  the user in memory (SessionCache), so requests after login never touch
+  Authentication or Customer again and only the login pays for the hash.
+  Forged or expired tokens are rejected by their HMAC / expiry before any
+  lookup. Sessions are per process; sessions.revoke_user() ends all of a
+  user's sessions, e.g. when their customer account is removed.
+Usage:
+    token, user = login("smera", "1234")        # None on bad credentials
+    user = session(token)                       # {"login_id", "role", "cust_id"} or None
+    logout(token)
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from bookstore_db import get_connection
+
+ROLES = ("admin", "customer")
+
+# scrypt cost: n=2**14, r=8 -> 16 MB and roughly 50-100 ms per hash
+SCRYPT_N = int(os.environ.get("BOOKSTORE_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+
+SESSION_SECRET = (os.environ.get("BOOKSTORE_SESSION_SECRET") or secrets.token_hex(32)).encode()
+SESSION_TTL = int(os.environ.get("BOOKSTORE_SESSION_TTL", str(8 * 3600)))   # seconds
+MAX_SESSIONS = 100000
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 2 ** 20,
+                          dklen=32)
+
+
+def hash_password(password):
+    """Salted scrypt hash of `password` in the stored "scrypt$n$r$p$salt$hash" form."""
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored):
+    return stored.startswith("scrypt$")
+
+
+def verify_password(password, stored):
+    """Returns (ok, needs_rehash). Plaintext legacy values verify once and ask to be re-hashed."""
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8")), True
+    try:
+        _, n, r, p, salt, digest = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        ok = hmac.compare_digest(_scrypt(password, _unb64(salt), n, r, p), _unb64(digest))
+    except ValueError:
+        return False, False
+    return ok, ok and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+_dummy_hash = None
+
+
+def _burn(password):
+    # unknown login ids cost as much as wrong passwords, so timing doesn't reveal which ids exist
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_hex(8))
+    verify_password(password, _dummy_hash)
+
+
+def hash_stored_passwords(cur):
+    """Migration step: replace every plaintext password with its hash."""
+    cur.execute("SELECT login_id, password FROM Authentication")
+    plain = [(hash_password(pw), login_id) for login_id, pw in cur.fetchall() if not is_hashed(pw)]
+    if plain:
+        cur.executemany("UPDATE Authentication SET password = %s WHERE login_id = %s", plain)
+
+
+def create_login(cur, login_id, password, role="customer"):
+    """INSERT a new login with a hashed password, in the caller's transaction."""
+    if role not in ROLES:
+        raise ValueError(f"role: expected one of {', '.join(ROLES)}")
+    cur.execute("INSERT INTO Authentication (login_id, password, role) VALUES (%s, %s, %s)",
+                (login_id, hash_password(password), role))
+
+
+def authenticate(login_id, password, connect=get_connection):
+    """
+    Check credentials with one query. Returns {"login_id", "role", "cust_id"}
+    (cust_id None for admins) or None.
+    """
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT a.password, a.role, c.cust_id FROM Authentication a "
+                    "LEFT JOIN Customer c ON c.login_id = a.login_id WHERE a.login_id = %s", (login_id,))
+        row = cur.fetchone()
+        if row is None:
+            _burn(password)
+            return None
+        stored, role, cust_id = row
+        ok, rehash = verify_password(password, stored)
+        if not ok or (role == "customer" and cust_id is None):
+            return None
+        if rehash:
+            cur.execute("UPDATE Authentication SET password = %s WHERE login_id = %s",
+                        (hash_password(password), login_id))
+            conn.commit()
+        return {"login_id": login_id, "role": role, "cust_id": cust_id}
+    finally:
+        cur.close()
+        conn.close()
+
+
+class SessionCache:
+    """Verified logins by signed token, in memory, with a TTL and an LRU bound."""
+
+    def __init__(self, secret=SESSION_SECRET, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.secret = secret
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()      # session id -> (user, expires)
+        self._lock = threading.Lock()
+
+    def _sign(self, payload):
+        return _b64(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest()[:16])
+
+    def issue(self, user):
+        sid = secrets.token_urlsafe(16)
+        expires = int(time.time()) + self.ttl
+        payload = f"{sid}.{expires}"
+        with self._lock:
+            self._sessions[sid] = (dict(user), expires)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return f"{payload}.{self._sign(payload)}"
+
+    def _session_id(self, token):
+        # signature and expiry first: garbage or forged tokens never reach the table
+        try:
+            sid, expires, sig = token.split(".")
+            expires = int(expires)
+        except (AttributeError, ValueError):
+            return None
+        if not hmac.compare_digest(sig, self._sign(f"{sid}.{expires}")) or expires < time.time():
+            return None
+        return sid
+
+    def get(self, token):
+        """The user for a live token, or None."""
+        sid = self._session_id(token)
+        if sid is None:
+            return None
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            self._sessions.move_to_end(sid)
+        return dict(entry[0])
+
+    def revoke(self, token):
+        sid = self._session_id(token)
+        if sid is not None:
+            with self._lock:
+                self._sessions.pop(sid, None)
+
+    def revoke_user(self, login_id):
+        with self._lock:
+            for sid in [s for s, (user, _) in self._sessions.items() if user["login_id"] == login_id]:
+                del self._sessions[sid]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+sessions = SessionCache()
+
+
+def login(login_id, password, connect=get_connection):
+    """Authenticate and open a session. Returns (token, user) or None."""
+    user = authenticate(login_id, password, connect)
+    if user is None:
+        return None
+    return sessions.issue(user), user
+
+
+def session(token):
+    """The logged-in user for `token` ({"login_id", "role", "cust_id"}) or None; never queries the database."""
+    return sessions.get(token) if token else None
+
+
+def logout(token):
+    if token:
+        sessions.revoke(token)
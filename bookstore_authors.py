@@ -0,0 +1,291 @@
+"""
+bookstore_authors.py
+- Authors are normalized: Author holds each name once and BookAuthor links a
+  title to one or more authors. Books has no author column of its own.
+- author_map is a process-wide a_id -> a_name map, loaded with one query on
+  first use. Book lists get their author names from it (one BookAuthor IN
+  query per page) instead of joining Author row by row; ids it has not seen
+  yet - authors added by another process - are fetched once and kept.
+- Browsing by author is an index range on BookAuthor (a_id, b_id) joined to
+  Books by primary key, keyset-paged on b_id like fetch_page.
+- Forms and CSV files name several authors in one field, separated by ";".
+  Names are matched ignoring case (LOWER(a_name), indexed); names that have
+  no Author row yet get one, its a_id from AUTO_INCREMENT.
+"""
+
+import os
+import threading
+import time
+
+from bookstore_db import fetch_page, get_backend, get_connection
+from bookstore_metrics import pass_through
+
+AUTHOR_SEPARATOR = ";"
+AUTHOR_MAP_TTL = float(os.environ.get("BOOKSTORE_AUTHOR_MAP_TTL", "300"))     # name search reloads after this
+IN_CHUNK = 1000
+
+
+def split_authors(text):
+    """'A; B;a' -> ['A', 'B']: stripped, empty parts and repeats (ignoring case) dropped."""
+    names, seen = [], set()
+    for part in str(text or "").split(AUTHOR_SEPARATOR):
+        name = " ".join(part.split())
+        if name and name.casefold() not in seen:
+            seen.add(name.casefold())
+            names.append(name)
+    return names
+
+
+def join_authors(names):
+    return f"{AUTHOR_SEPARATOR} ".join(names)
+
+
+def _in_chunks(cur, sql, values, mark="%s"):
+    """Run sql (with one "{}" for the IN list of `mark`s) over values IN_CHUNK at a time; all rows."""
+    rows = []
+    for i in range(0, len(values), IN_CHUNK):
+        part = values[i:i + IN_CHUNK]
+        cur.execute(sql.format(",".join([mark] * len(part))), part)
+        rows.extend(cur.fetchall())
+    return rows
+
+
+class AuthorMap:
+    """a_id -> a_name for every author, loaded in one query and then kept current by id."""
+
+    def __init__(self):
+        self._names = {}            # a_id -> a_name
+        self._lock = threading.Lock()
+        self.loaded_at = None
+        self.lookups = 0
+        self.misses = 0             # ids that had to be fetched after the initial load
+
+    def __len__(self):
+        return len(self._names)
+
+    @pass_through
+    def load(self, connect=get_connection):
+        conn = connect()
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT a_id, a_name FROM Author")
+            names = dict(cur.fetchall())
+        finally:
+            cur.close()
+            conn.close()
+        with self._lock:
+            self._names = names
+            self.loaded_at = time.monotonic()
+
+    @pass_through
+    def names(self, a_ids, connect=get_connection):
+        """{a_id: a_name} for a_ids; ids with no Author row are left out."""
+        a_ids = list(a_ids)
+        if self.loaded_at is None:
+            self.load(connect)
+        names = self._names
+        missing = list({a for a in a_ids if a not in names})
+        if missing:
+            conn = connect()
+            cur = conn.cursor()
+            try:
+                found = _in_chunks(cur, "SELECT a_id, a_name FROM Author WHERE a_id IN ({})", missing)
+            finally:
+                cur.close()
+                conn.close()
+            with self._lock:
+                self._names.update(found)
+                self.misses += len(found)
+            names = self._names
+        self.lookups += 1
+        return {a: names[a] for a in a_ids if a in names}
+
+    def matching(self, text, limit=50, connect=get_connection):
+        """[(a_id, a_name)] whose name contains text (ignoring case), by name."""
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > AUTHOR_MAP_TTL:
+            self.load(connect)
+        needle = " ".join(str(text).split()).casefold()
+        found = [(a, n) for a, n in list(self._names.items()) if needle in n.casefold()]
+        found.sort(key=lambda item: (item[1].casefold(), item[0]))
+        return found[:limit]
+
+    def added(self, a_id, a_name):
+        with self._lock:
+            if self.loaded_at is not None:
+                self._names[a_id] = a_name
+
+    def removed(self, a_id):
+        with self._lock:
+            self._names.pop(a_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._names, self.loaded_at = {}, None
+
+    def stats(self):
+        return {"authors": len(self._names), "lookups": self.lookups, "misses": self.misses,
+                "loaded": self.loaded_at is not None}
+
+
+author_map = AuthorMap()
+
+
+# ---------- writes (caller's cursor and transaction) ----------
+def resolve_authors(cur, names):
+    """
+    {name: a_id} for names, creating Author rows for the ones that don't exist
+    yet. Matching ignores case, so "jane austen" finds "Jane Austen" (the
+    database's LOWER(): on SQLite that folds ASCII letters only).
+    """
+    first = {}
+    for n in names:
+        first.setdefault(n.casefold(), n)
+    wanted = list(first.values())
+    ids = {}
+    # lowest a_id first, so names entered twice before this matched resolve to the older row
+    for a_id, a_name in _in_chunks(cur, "SELECT a_id, a_name FROM Author WHERE LOWER(a_name) IN ({}) ORDER BY a_id",
+                                   wanted, "LOWER(%s)"):
+        ids.setdefault(a_name.casefold(), a_id)
+    for n in wanted:
+        if n.casefold() not in ids:
+            # AUTO_INCREMENT: concurrent writers never pick the same id
+            cur.execute("INSERT INTO Author (a_name) VALUES (%s)", (n,))
+            ids[n.casefold()] = cur.lastrowid
+    return {n: ids[n.casefold()] for n in names}
+
+
+def link_authors(cur, books):
+    """Make [(b_id, [author names])] the complete author list of each title."""
+    if not books:
+        return
+    ids = resolve_authors(cur, [n for _, names in books for n in names])
+    b_ids = [b for b, _ in books]
+    for i in range(0, len(b_ids), IN_CHUNK):
+        part = b_ids[i:i + IN_CHUNK]
+        cur.execute(f"DELETE FROM BookAuthor WHERE b_id IN ({','.join(['%s'] * len(part))})", part)
+    pairs = {(b, ids[n]) for b, names in books for n in names}
+    cur.executemany("INSERT INTO BookAuthor (b_id, a_id) VALUES (%s, %s)", sorted(pairs))
+
+
+def backfill_book_authors(cur):
+    """
+    Schema migration 9, before Books.a_name is dropped: link every title
+    with no BookAuthor row to the author(s) named in its a_name.
+    """
+    cur.execute("SELECT b.b_id, b.a_name FROM Books b "
+                "WHERE NOT EXISTS (SELECT 1 FROM BookAuthor ba WHERE ba.b_id = b.b_id)")
+    books = [(b_id, split_authors(a_name)) for b_id, a_name in cur.fetchall()]
+    link_authors(cur, [(b_id, names) for b_id, names in books if names])
+
+
+# name -> a_id for forms and imports: WHERE LOWER(a_name) IN (...)
+AUTHOR_NAME_INDEX = "CREATE INDEX idx_author_name_ci ON Author ((LOWER(a_name)))"
+
+
+def author_ids_auto_increment(cur):
+    """
+    Schema migration 14: Author.a_id becomes AUTO_INCREMENT, so new authors
+    no longer take MAX(a_id) + 1, which two writers could read at once, and
+    the name index is replaced by one on LOWER(a_name).
+    """
+    if get_backend().name == "mysql":
+        cur.execute("DROP INDEX idx_author_name ON Author")
+        # BookAuthor's foreign key refers to a_id; only the column's default changes
+        cur.execute("SET FOREIGN_KEY_CHECKS = 0")
+        try:
+            cur.execute("ALTER TABLE Author MODIFY a_id INT NOT NULL AUTO_INCREMENT")
+        finally:
+            cur.execute("SET FOREIGN_KEY_CHECKS = 1")
+        cur.execute(AUTHOR_NAME_INDEX)
+        return
+    cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'Author'")
+    if "AUTOINCREMENT" in cur.fetchone()[0].upper():
+        return      # already rebuilt, new index and all
+    # SQLite can't change a key column in place: copy the rows into a new table.
+    # Foreign keys go off first, or dropping the old table would cascade into BookAuthor.
+    cur.execute("PRAGMA foreign_keys = OFF")
+    cur.execute("PRAGMA foreign_keys")
+    if cur.fetchone()[0]:
+        raise RuntimeError("migration 14 has to start outside a transaction on SQLite")
+    # The pragma only changes outside a transaction, so the rebuild ends in its own
+    # commit. Both indexes change inside it (the old one goes with the old table),
+    # which leaves a failed run either untouched or fully rebuilt, and a rerun
+    # after the latter only records the version.
+    try:
+        cur.execute("BEGIN")
+        cur.execute("CREATE TABLE Author_new (a_id INT AUTO_INCREMENT PRIMARY KEY, a_name VARCHAR(100) NOT NULL)")
+        cur.execute("INSERT INTO Author_new (a_id, a_name) SELECT a_id, a_name FROM Author")
+        cur.execute("DROP TABLE Author")
+        cur.execute("ALTER TABLE Author_new RENAME TO Author")
+        cur.execute(AUTHOR_NAME_INDEX)
+        cur.connection.commit()
+    except Exception:
+        cur.connection.rollback()
+        raise
+    finally:
+        cur.execute("PRAGMA foreign_keys = ON")
+
+
+# ---------- reads ----------
+def book_author_ids(cur, b_ids):
+    """{b_id: [a_id, ...]} from BookAuthor, one IN query per IN_CHUNK titles."""
+    found = {}
+    for b_id, a_id in _in_chunks(cur, "SELECT b_id, a_id FROM BookAuthor WHERE b_id IN ({}) ORDER BY b_id, a_id",
+                                 list(dict.fromkeys(b_ids))):
+        found.setdefault(b_id, []).append(a_id)
+    return found
+
+
+def authors_text(author_ids, connect=get_connection):
+    """{b_id: [a_id]} -> {b_id: "Name; Name"} through author_map."""
+    names = author_map.names({a for ids in author_ids.values() for a in ids}, connect)
+    return {b: join_authors(names[a] for a in ids if a in names) for b, ids in author_ids.items()}
+
+
+@pass_through
+def with_authors(columns, rows, connect=get_connection):
+    """Add an "authors" column ("Name; Name") to Books rows. Returns (columns, rows)."""
+    if not rows:
+        return [*columns, "authors"], rows
+    key = columns.index("b_id")
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        ids = book_author_ids(cur, [r[key] for r in rows])
+    finally:
+        cur.close()
+        conn.close()
+    text = authors_text(ids, connect)
+    return [*columns, "authors"], [(*r, text.get(r[key], "")) for r in rows]
+
+
+def books_page(after=None, page_size=50, where=None, params=(), connect=get_connection):
+    """fetch_page over Books with the "authors" column added."""
+    columns, rows, next_after = fetch_page("Books", "b_id", after, page_size, where, params, connect)
+    columns, rows = with_authors(columns, rows, connect)
+    return columns, rows, next_after
+
+
+@pass_through
+def books_by_author(a_id, after=None, page_size=50, in_stock_only=False, connect=get_connection):
+    """
+    Keyset page of one author's titles, ordered by b_id: an index range on
+    BookAuthor (a_id, b_id) plus a primary key lookup per title. Returns
+    (columns, rows, next_after) like fetch_page, with the "authors" column.
+    """
+    sql = "SELECT b.* FROM BookAuthor ba JOIN Books b ON b.b_id = ba.b_id WHERE ba.a_id = %s AND ba.b_id > %s"
+    if in_stock_only:
+        sql += " AND b.quantity > 0"
+    sql += " ORDER BY ba.b_id LIMIT %s"
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, (a_id, after or 0, page_size + 1))
+        columns = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+    next_after = rows[page_size - 1][columns.index("b_id")] if len(rows) > page_size else None
+    columns, rows = with_authors(columns, rows[:page_size], connect)
+    return columns, rows, next_after
@@ -0,0 +1,1893 @@
+"""
+bookstore_bench.py
+- Micro-benchmarks for the bookstore data layer.
+Usage:
+    python bookstore_bench.py pool              # SQLite stand-in
+    python bookstore_bench.py pool --mysql      # against the MySQL in bookstore_db.DB_CONFIG
+    python bookstore_bench.py purchase          # concurrent buyers on one title, checks for oversells
+    python bookstore_bench.py cart              # N sequential purchases vs one N-line cart checkout
+    python bookstore_bench.py cache             # catalog queries per session with and without the cache
+    python bookstore_bench.py paging --rows 1000000   # keyset pages vs full load of a big Reports table
+    python bookstore_bench.py search --books 500000   # search latency percentiles (budget: p99 < 20 ms)
+    python bookstore_bench.py analytics --rows 1000000  # rollup queries vs raw Reports as Reports grows
+    python bookstore_bench.py reporting --rows 10000000 # vectorized report vs. a row-by-row loop
+    python bookstore_bench.py export --rows 1000000     # export peak memory stays flat as Reports grows
+    python bookstore_bench.py import --rows 200000      # CSV import rows/sec at several batch sizes
+    python bookstore_bench.py startup [--mysql]         # bootstrap time (schema + seed) per storage backend
+    python bookstore_bench.py ledger                    # synchronous vs. write-behind purchases, crash replay
+    python bookstore_bench.py inventory                 # hot-title sales written through vs. logged first,
+                                                        # racing views, compaction lag, verify / rebuild
+    python bookstore_bench.py shards --threads 64       # one bestseller: write-through vs. log-first vs. K slots
+    python bookstore_bench.py returns --rows 1000000    # racing refunds of one purchase (never refunded twice),
+                                                        # refunds/s, net totals from rollups vs. joining refunds
+    python bookstore_bench.py pricing --books 100000    # ~1k running promotions: incremental refresh per window
+                                                        # boundary vs. a full re-resolve; prices read off Books
+                                                        # vs. evaluating the promotions per row
+    python bookstore_bench.py api --threads 64          # HTTP load test of bookstore_api: req/s, p50/p99 per route
+    python bookstore_bench.py auth                      # hashed logins/s and per-request session check cost
+    python bookstore_bench.py reorder --books 100000    # velocity accuracy on synthetic histories, reorder checks
+    python bookstore_bench.py indexes [--mysql]         # every hot query planned onto an index (EXPLAIN / EXPLAIN
+                                                        # QUERY PLAN); a dropped index must be caught
+    python bookstore_bench.py profiler                  # per-query cost of profiling; caller attribution, slow log
+    python bookstore_bench.py authors --books 500000    # author names per page and browse by author:
+                                                        # cached map + BookAuthor index vs join / string scan
+    python bookstore_bench.py streamlit                 # AppTest walk through the app: statements per interaction
+    python bookstore_bench.py suite --books 1000000 --rows 50000000 --data bench.db --json results.json
+                                                        # generated data + browse/search/buy/history/admin scenarios,
+                                                        # JSON results; --compare old.json diffs two runs
+"""
+
+import argparse
+import asyncio
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import platform
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+
+from bookstore_analytics import rebuild_rollups, top_books, daily_revenue, genre_totals, top_customers
+from bookstore_authors import author_map, books_by_author, books_page
+from bookstore_catalog import catalog_cache, available_books
+from bookstore_datagen import (CLEARED_TABLES, DEFAULT_SIZES, GEN_CHUNK, GEN_END, GENRES, GEN_SEED, SURNAMES, WORDS,
+                               author_names, book_rows, generate, synthetic_titles)
+from bookstore_db import (ConnectionPool, MySQLBackend, SQLiteBackend, connect_raw, fetch_page, get_pool,
+                          set_backend)
+from bookstore_export import export_reports
+from bookstore_import import import_csv
+from bookstore_inventory import (StockError, StockView, fold_stock, rebuild, record_event, replay, shard_stock,
+                                 stock_history, stock_view, verify)
+from bookstore_ledger import LedgerWorker, ReportsJournal, apply_batch, purchase_book_deferred
+from bookstore_metrics import profiler, prometheus_text, write_prometheus
+from bookstore_pricing import rebuild as rebuild_prices, refresh_promotions, start_price_clock
+from bookstore_purchase import purchase_book, checkout_cart, reserve_stock, PurchaseError
+from bookstore_reporting import MOVING_AVERAGE_DAYS, ReportAccumulator, customer_report, frame_from_rows, sales_report
+from bookstore_returns import RefundError, refund_purchase, return_purchase
+from bookstore_schema import HOT_QUERIES, explain_hot_queries, migrate
+from bookstore_search import SEARCH_REFRESH, SearchIndex, refresh_index, search_books, search_index
+
+
+def sqlite_standin(n_books=1000, n_customers=5000):
+    """
+    A throwaway SQLite file with the schema bookstore_schema.migrate() builds,
+    the seed catalog replaced by titles 1..n_books (97 authors) and customers
+    1..n_customers. It becomes the process's backend; returns its connect().
+    """
+    fd, path = tempfile.mkstemp(suffix=".db", prefix="bookstore_bench_")
+    os.close(fd)
+    backend = SQLiteBackend(path)
+    set_backend(backend)
+    migrate(backend.connect, verbose=False)
+    cnx = backend.connect()
+    cur = cnx.cursor()
+    for table in CLEARED_TABLES:
+        cur.execute(f"DELETE FROM {table}")
+    cur.executemany("INSERT INTO Books (b_id, b_name, genre, quantity, price) VALUES (%s,%s,%s,%s,%s)",
+                    [(i, f"Book {i}", f"Genre {i % 13}", 100, Decimal("9.99")) for i in range(1, n_books + 1)])
+    cur.executemany("INSERT INTO Author (a_id, a_name) VALUES (%s,%s)", [(a, f"Author {a - 1}") for a in range(1, 98)])
+    cur.executemany("INSERT INTO BookAuthor (b_id, a_id) VALUES (%s,%s)",
+                    [(i, i % 97 + 1) for i in range(1, n_books + 1)])
+    cur.executemany("INSERT INTO Customer (cust_id, c_name, address, phoneno) VALUES (%s,%s,%s,%s)",
+                    [(c, f"Customer {c}", "Bench Street", "0000000000") for c in range(1, n_customers + 1)])
+    cnx.commit()
+    cur.close()
+    cnx.close()
+    return backend.connect
+
+
+REPORTS_START = date(2020, 1, 1)
+REPORTS_DAYS = 1500
+
+
+def fill_reports(connect, rows, batch=50000, first=0):
+    """Append synthetic purchases number first..rows-1 to Reports in large batches."""
+    conn = connect()
+    cur = conn.cursor()
+    start = REPORTS_START
+    for lo in range(first, rows, batch):
+        cur.executemany(
+            "INSERT INTO Reports (b_id, c_id, date_of_purchase, quantity, price) VALUES (%s,%s,%s,%s,%s)",
+            [(i % 1000 + 1, i % 5000 + 1, start + timedelta(days=i % REPORTS_DAYS), i % 3 + 1, 9.99 * (i % 3 + 1))
+             for i in range(lo, min(lo + batch, rows))])
+        conn.commit()
+    cur.close()
+    conn.close()
+
+
+def set_stock(cur, stock, b_id=None):
+    """Put every title (or one) back to `stock` copies, unsharded, with an empty event log; the caller commits."""
+    where, params = (" WHERE b_id = %s", (b_id,)) if b_id else ("", ())
+    cur.execute("DELETE FROM inventory_events" + where, params)
+    cur.execute("DELETE FROM stock_slots" + where, params)
+    cur.execute("UPDATE Books SET quantity = %s, stock_seq = 0, slots = 0" + where, (stock, *params))
+    stock_view.clear()
+
+
+def measure(fn):
+    """Run fn(); return (result, seconds, peak traced memory in MB)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def run_threads(threads, per_thread, fn):
+    """Call fn(i) per_thread times on each of `threads` threads; return requests/sec."""
+    def worker():
+        for i in range(per_thread):
+            fn(i)
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return threads * per_thread / elapsed
+
+
+# ---------- scenarios ----------
+def bench_pool(args, connect):
+    query = "SELECT quantity, price FROM Books WHERE b_id = %s"
+
+    def request(conn, i):
+        cur = conn.cursor()
+        cur.execute(query, (i % 1000 + 1,))
+        cur.fetchall()
+        cur.close()
+
+    def unpooled(i):
+        conn = connect()
+        request(conn, i)
+        conn.close()
+
+    pool = ConnectionPool(connect, size=args.pool_size)
+
+    def pooled(i):
+        conn = pool.get()
+        request(conn, i)
+        conn.close()
+
+    before = run_threads(args.threads, args.requests, unpooled)
+    after = run_threads(args.threads, args.requests, pooled)
+    print(f"connect per request : {before:10.1f} req/s")
+    print(f"pooled (size={args.pool_size:<3})  : {after:10.1f} req/s  ({after / before:.1f}x)")
+    print("pool stats:", pool.stats())
+    pool.close_all()
+
+
+def bench_purchase(args, connect):
+    """Many threads buy one title at once; stock must end at exactly zero, never below."""
+    hot_id, stock = 1, args.stock
+    setup = connect()
+    cur = setup.cursor()
+    set_stock(cur, stock, hot_id)
+    cur.execute("DELETE FROM Reports WHERE b_id = %s", (hot_id,))
+    setup.commit()
+
+    pool = ConnectionPool(connect, size=args.pool_size)
+    results = {"ok": 0, "rejected": 0}
+    lock = threading.Lock()
+
+    def buy(i):
+        try:
+            purchase_book(hot_id, 1, 1, connect=pool.get)
+            key = "ok"
+        except PurchaseError:
+            key = "rejected"
+        with lock:
+            results[key] += 1
+
+    rate = run_threads(args.threads, args.requests, buy)
+    stock_view.compact(connect)
+    cur.execute("SELECT quantity FROM Books WHERE b_id = %s", (hot_id,))
+    left = cur.fetchone()[0]
+    cur.execute("SELECT COALESCE(SUM(quantity), 0) FROM Reports WHERE b_id = %s", (hot_id,))
+    sold = cur.fetchone()[0]
+    cur.close()
+    setup.close()
+    pool.close_all()
+
+    print(f"attempts: {args.threads * args.requests}  sold: {results['ok']}  rejected: {results['rejected']}")
+    print(f"stock left: {left}  Reports qty: {sold}  throughput: {rate:.1f} purchases/s")
+    oversold = sold - stock
+    assert left >= 0 and oversold <= 0 and sold == results["ok"] == stock - left, "oversell detected"
+    print("oversells: 0")
+
+
+def bench_cart(args, connect):
+    """Latency of buying N titles one by one vs. one cart checkout, for growing N."""
+    pool = ConnectionPool(connect, size=1)
+    conn = pool.get()
+    cur = conn.cursor()
+    set_stock(cur, 10 ** 9)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    reps = args.requests
+    print(f"{'N':>4} {'sequential ms':>14} {'cart ms':>10} {'speedup':>8}")
+    for n in (1, 5, 10, 25, 50, 100):
+        ids = list(range(1, n + 1))
+        start = time.perf_counter()
+        for _ in range(reps):
+            for b_id in ids:
+                purchase_book(b_id, 1, 1, connect=pool.get)
+        seq_ms = (time.perf_counter() - start) * 1000 / reps
+        start = time.perf_counter()
+        for _ in range(reps):
+            checkout_cart({b_id: 1 for b_id in ids}, 1, connect=pool.get)
+        cart_ms = (time.perf_counter() - start) * 1000 / reps
+        print(f"{n:>4} {seq_ms:>14.2f} {cart_ms:>10.2f} {seq_ms / cart_ms:>7.1f}x")
+
+    # one short title fails the whole cart; a cart mixing a sharded title with bulk-updated ones logs every sale
+    conn = connect()
+    cur = conn.cursor()
+    set_stock(cur, 10)
+    conn.commit()
+    shard_stock(3, 4, connect)
+    try:
+        checkout_cart({1: 2, 2: 11, 3: 1}, 1, connect=pool.get)
+        raise AssertionError("a cart over the stock went through")
+    except PurchaseError as e:
+        refused = str(e)
+    checkout_cart({1: 2, 2: 3, 3: 1}, 1, connect=pool.get)
+    stock_view.compact(connect)
+    cur.execute("SELECT b_id, quantity FROM Books WHERE b_id <= 3 ORDER BY b_id")
+    left = cur.fetchall()
+    conn.commit()
+    assert "book 2" in refused and left == [(1, 8), (2, 7), (3, 9)] and verify(connect) == [], (refused, left)
+    shard_stock(3, 0, connect)
+    cur.close()
+    conn.close()
+    print(f"cart over the stock refused ({refused}); mixed cart left {left}, log verified")
+    pool.close_all()
+
+
+def bench_cache(args, connect):
+    """A session of Streamlit reruns over the catalog, with a purchase (and compaction) every 20 reruns."""
+    pool = ConnectionPool(connect, size=1)
+    checkouts = lambda: pool.stats()["checkouts"]
+    reruns = args.requests
+
+    def session(read):
+        before, start = checkouts(), time.perf_counter()
+        for i in range(reruns):
+            read()
+            if i % 20 == 19:
+                purchase_book(i % 1000 + 1, 1, 1, connect=pool.get)
+                stock_view.compact(pool.get)        # the compactor's next pass, which invalidates the catalog
+        return checkouts() - before, time.perf_counter() - start
+
+    def uncached():
+        conn = pool.get()
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM Books WHERE quantity > 0")
+        cur.fetchall()
+        cur.close()
+        conn.close()
+
+    catalog_cache.clear()
+    q_plain, t_plain = session(uncached)
+    q_cached, t_cached = session(lambda: available_books(connect=pool.get))
+    print(f"reruns: {reruns}  (purchases: {reruns // 20})")
+    print(f"uncached: {q_plain:6d} DB checkouts  {t_plain * 1000:8.1f} ms")
+    print(f"cached  : {q_cached:6d} DB checkouts  {t_cached * 1000:8.1f} ms")
+    print("cache stats:", catalog_cache.stats())
+    pool.close_all()
+
+
+def bench_paging(args, connect):
+    """Full-table load vs keyset pages on a Reports table of --rows rows."""
+    fill_reports(connect, args.rows)
+    size = 100
+
+    def full_load():
+        conn = connect()
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM Reports")
+        n = len(cur.fetchall())
+        cur.close()
+        conn.close()
+        return n
+
+    def offset_deep():
+        conn = connect()
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM Reports ORDER BY r_no LIMIT %s OFFSET %s", (size, args.rows - size * 2))
+        n = len(cur.fetchall())
+        cur.close()
+        conn.close()
+        return n
+
+    def scroll(pages):
+        after = None
+        for _ in range(pages):
+            _, rows, after = fetch_page("Reports", "r_no", after, size, connect=connect)
+        return after
+
+    print(f"Reports rows: {args.rows}  page size: {size}")
+    for label, fn in [
+        ("full load (SELECT *)", full_load),
+        ("keyset: first page", lambda: fetch_page("Reports", "r_no", None, size, connect=connect)),
+        ("keyset: deep page", lambda: fetch_page("Reports", "r_no", args.rows - size * 2, size, connect=connect)),
+        ("OFFSET: deep page", offset_deep),
+        ("keyset: scroll 100 pages", lambda: scroll(100)),
+    ]:
+        _, secs, peak = measure(fn)
+        print(f"{label:<26} {secs * 1000:9.1f} ms   peak {peak:8.2f} MB")
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def bench_search(args, connect):
+    """Build the search index over --books synthetic titles and time random queries."""
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.build(synthetic_titles(args.books))
+    print(f"indexed {len(index)} titles in {time.perf_counter() - start:.1f} s")
+
+    rnd = random.Random(7)
+    queries = []
+    for _ in range(args.requests):
+        terms = [rnd.choice(WORDS + SURNAMES)[:rnd.randint(3, 7)].lower() for _ in range(rnd.randint(1, 3))]
+        queries.append(" ".join(terms))
+    timings = []
+    for q in queries:
+        t = time.perf_counter()
+        index.search(q)
+        timings.append((time.perf_counter() - t) * 1000)
+    p50, p99 = percentile(timings, 50), percentile(timings, 99)
+    print(f"queries: {len(queries)}  p50: {p50:.2f} ms  p99: {p99:.2f} ms  max: {max(timings):.2f} ms")
+    print("within budget (p99 < 20 ms)" if p99 < 20 else "OVER BUDGET (p99 >= 20 ms)")
+    if not args.mysql:
+        check_search(connect)
+
+
+def check_search(connect, limit=5):
+    """
+    On the stand-in: sold-out best matches don't shrink the result, and the
+    periodic refresh picks up a title inserted under a low b_id and drops a
+    deleted one.
+    """
+    search_index.built_at = None
+    _, rows = search_books("book", limit, connect=connect)
+    sold_out = [r[0] for r in rows] + [b for b, _ in search_index.search("book", limit * 8)]
+    conn = connect()
+    cur = conn.cursor()
+    cur.executemany("UPDATE Books SET quantity = 0 WHERE b_id = %s", [(b,) for b in set(sold_out)])
+    conn.commit()
+    columns, rows = search_books("book", limit, connect=connect)
+    stock = columns.index("quantity")
+    assert len(rows) == limit and all(r[stock] > 0 for r in rows), rows
+    print(f"best {len(set(sold_out))} matches sold out: still {len(rows)} in-stock results")
+
+    cur.execute("INSERT INTO Books (b_id, b_name, genre, quantity, price) VALUES (%s,%s,%s,%s,%s)",
+                (0, "Zanzibar Lighthouse", "Travel", 3, Decimal("9.99")))
+    gone = rows[0][0]
+    cur.execute("DELETE FROM BookAuthor WHERE b_id = %s", (gone,))
+    cur.execute("DELETE FROM Books WHERE b_id = %s", (gone,))
+    conn.commit()
+    cur.close()
+    conn.close()
+    search_index.built_at -= SEARCH_REFRESH + 1
+    refresh_index(connect)
+    assert [b for b, _ in search_index.search("zanzibar")] == [0], "title under a low b_id not indexed"
+    assert gone not in search_index.ids(), "deleted title still indexed"
+    print(f"refresh: indexed b_id 0, dropped b_id {gone}")
+
+
+def bench_analytics(args, connect):
+    """Dashboard queries from the rollups vs. the same aggregates over raw Reports."""
+    today = REPORTS_START + timedelta(days=REPORTS_DAYS - 1)
+    since = today - timedelta(days=29)
+    raw_queries = [
+        ("top books 30d", "SELECT b_id, SUM(quantity), SUM(price) AS rev FROM Reports "
+                          "WHERE date_of_purchase >= %s GROUP BY b_id ORDER BY rev DESC LIMIT 10", (since,)),
+        ("revenue by day", "SELECT date_of_purchase, SUM(price) FROM Reports "
+                           "WHERE date_of_purchase >= %s GROUP BY date_of_purchase", (since,)),
+        ("genre totals", "SELECT b.genre, SUM(r.price) FROM Reports r JOIN Books b ON b.b_id = r.b_id "
+                         "WHERE r.date_of_purchase >= %s GROUP BY b.genre", (since,)),
+        ("top customers", "SELECT c_id, SUM(price) AS rev FROM Reports GROUP BY c_id ORDER BY rev DESC LIMIT 10", ()),
+    ]
+    rollup_queries = [
+        ("top books 30d", lambda: top_books(30, 10, today, connect)),
+        ("revenue by day", lambda: daily_revenue(30, today, connect)),
+        ("genre totals", lambda: genre_totals(1, today, connect)),
+        ("top customers", lambda: top_customers(10, connect)),
+    ]
+
+    def raw(sql, params):
+        conn = connect()
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        cur.fetchall()
+        cur.close()
+        conn.close()
+
+    def timed(fn, reps=5):
+        start = time.perf_counter()
+        for _ in range(reps):
+            fn()
+        return (time.perf_counter() - start) * 1000 / reps
+
+    print(f"{'Reports rows':>12}  {'query':<16} {'raw ms':>9} {'rollup ms':>10}")
+    filled = 0
+    for size in sorted({args.rows // 100, args.rows // 10, args.rows}):
+        fill_reports(connect, size, first=filled)
+        filled = size
+        conn = connect()
+        cur = conn.cursor()
+        rebuild_rollups(cur)
+        conn.commit()
+        cur.close()
+        conn.close()
+        for (name, sql, params), (_, rollup) in zip(raw_queries, rollup_queries):
+            print(f"{size:>12}  {name:<16} {timed(lambda: raw(sql, params)):9.2f} {timed(rollup):10.2f}")
+
+
+def report_row_chunks(rows, chunk=1000000, seed=3):
+    """Synthetic fetchall()-style Reports chunks: (r_no, b_id, c_id, date, quantity, paise)."""
+    rnd = random.Random(seed)
+    days = [REPORTS_START + timedelta(days=d) for d in range(REPORTS_DAYS)]
+    for lo in range(0, rows, chunk):
+        yield [(r, rnd.randrange(1, 100000), rnd.randrange(1, 50000), days[(r - 1) * REPORTS_DAYS // rows],
+                q, q * rnd.randrange(9900, 99900, 100))
+               for r in range(lo + 1, min(lo + chunk, rows) + 1) for q in (rnd.randint(1, 3),)]
+
+
+def naive_report(chunks):
+    """The row-by-row loop the vectorized path replaces."""
+    purchases = units = paise = 0
+    daily, customers = {}, {}
+    for rows in chunks:
+        for r_no, b_id, c_id, day, qty, amount in rows:
+            purchases += 1
+            units += qty
+            paise += amount
+            daily[day] = daily.get(day, 0) + amount
+            c = customers.get(c_id)
+            if c is None:
+                customers[c_id] = [1, qty, amount, day, day]
+            else:
+                c[0] += 1
+                c[1] += qty
+                c[2] += amount
+                c[3] = min(c[3], day)
+                c[4] = max(c[4], day)
+    ordered = sorted(daily)
+    moving, window = [], []
+    for day in ordered:
+        window.append(daily[day])
+        window = window[-MOVING_AVERAGE_DAYS:]
+        moving.append(sum(window) / len(window) / 100)
+    top = sorted(customers.items(), key=lambda kv: -kv[1][2])[:10]
+    return {"purchases": purchases, "units": units, "revenue": paise / 100}, moving, top
+
+
+def bench_reporting(args, connect):
+    """Totals, daily moving average and customer LTV over --rows synthetic Reports rows."""
+    chunks = list(report_row_chunks(args.rows)) if args.rows <= 2000000 else None
+    source = (lambda: iter(chunks)) if chunks else (lambda: report_row_chunks(args.rows))
+
+    start = time.perf_counter()
+    totals, _, top = naive_report(source())
+    naive_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    acc = ReportAccumulator()
+    for rows in source():
+        acc.add(frame_from_rows(rows))
+    daily, ltv = acc.daily(), acc.lifetime_value()
+    vector_s = time.perf_counter() - start
+
+    vt = acc.totals()
+    assert (vt["purchases"], vt["units"], round(vt["revenue"], 2)) == \
+        (totals["purchases"], totals["units"], round(totals["revenue"], 2)), "totals differ"
+    assert list(ltv["revenue"][:10]) == [c[2] / 100 for _, c in top], "lifetime value ranking differs"
+    print(f"rows: {args.rows}  days: {len(daily)}  customers: {len(ltv)}")
+    note = "" if chunks else "  (chunk generation included in both timings)"
+    print(f"row-by-row loop : {naive_s:8.2f} s")
+    print(f"vectorized      : {vector_s:8.2f} s  ({naive_s / vector_s:.1f}x){note}")
+
+
+def bench_export(args, connect):
+    """Peak traced memory of a streamed export at growing Reports sizes; must not grow with rows."""
+    out = tempfile.mkdtemp(prefix="bookstore_export_")
+    batch = max(100, args.rows // 100)     # both sizes span at least 10 batches
+    peaks = {}
+    filled = 0
+    print(f"{'rows':>10}  {'format':<12} {'seconds':>8} {'peak MB':>8}")
+    for size in sorted({args.rows // 10, args.rows}):
+        fill_reports(connect, size, first=filled)
+        filled = size
+        for fmt, compression in (("csv", "gzip"), ("parquet", "zstd")):
+            path = os.path.join(out, f"reports_{size}.{fmt}")
+            count, secs, peak = measure(lambda: export_reports(path, fmt, compression, batch, connect))
+            assert count == size
+            peaks.setdefault(fmt, []).append(peak)
+            print(f"{size:>10}  {fmt + '/' + compression:<12} {secs:8.1f} {peak:8.2f}")
+    for fmt, (small, big) in peaks.items():
+        # 10x the rows must not mean noticeably more memory
+        assert big < small * 1.5 + 1, f"{fmt} export memory grows with row count"
+    print("peak memory flat across sizes")
+
+
+def write_catalog_csv(path, n, bad_every=1000):
+    """Synthetic supplier catalog; every bad_every-th row is broken in some way."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["b_id", "b_name", "a_name", "genre", "quantity", "price"])
+        for b_id, b_name, a_name, genre in synthetic_titles(n):
+            row = [b_id, b_name, a_name, genre, b_id % 50, f"{(b_id % 900) / 3 + 99:.2f}"]
+            if b_id % bad_every == 0:
+                broken, value = [(4, "x"), (5, "-1"), (1, "")][(b_id // bad_every) % 3]
+                row[broken] = value
+            writer.writerow(row)
+
+
+def bench_import(args, connect):
+    """Bulk CSV import of --rows titles into an empty Books table at several batch sizes."""
+    fd, path = tempfile.mkstemp(suffix=".csv", prefix="bookstore_import_")
+    os.close(fd)
+    write_catalog_csv(path, args.rows)
+    expected_bad = args.rows // 1000
+    print(f"{'batch':>7} {'seconds':>8} {'rows/s':>10} {'imported':>10} {'rejected':>9}")
+    for batch in (100, 1000, 5000, 20000):
+        fresh = connect if args.mysql else sqlite_standin(0)
+        result = import_csv("books", path, batch=batch, connect=fresh)
+        assert len(result["rejected"]) == expected_bad, result["rejected"][:3]
+        assert result["imported"] == args.rows - expected_bad
+        print(f"{batch:>7} {result['seconds']:8.1f} {result['rows'] / result['seconds']:10.0f} "
+              f"{result['imported']:>10} {len(result['rejected']):>9}")
+    os.remove(path)
+
+
+def bench_startup(args, connect):
+    """bookstore_bootstrap.initialize() cold (empty database) and warm on each backend; warm must be < 50 ms."""
+    import bookstore_bootstrap as boot
+    fd, path = tempfile.mkstemp(suffix=".db", prefix="bookstore_startup_")
+    os.close(fd)
+    os.remove(path)
+    backends = [("sqlite file", SQLiteBackend(path)), ("sqlite :memory:", SQLiteBackend(":memory:"))]
+    if args.mysql:
+        backends.append(("mysql", MySQLBackend()))
+
+    def startup(backend):
+        # like a fresh process: nothing pooled yet
+        set_backend(backend)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            phases = boot.initialize()
+        return time.perf_counter() - start, phases
+
+    print(f"{'backend':<16} {'cold':>9} {'warm':>9}  warm phases")
+    for label, backend in backends:
+        cold, _ = startup(backend)
+        warm, phases = startup(backend)
+        print(f"{label:<16} {cold * 1000:6.1f} ms {warm * 1000:6.1f} ms  "
+              + ", ".join(f"{name} {seconds * 1000:.2f} ms" for name, seconds in phases))
+        assert warm < 0.05, f"{label}: warm startup {warm * 1000:.1f} ms (budget 50 ms)"
+        cur = connect_raw().cursor()
+        cur.execute("SELECT COUNT(*) FROM Books")
+        assert cur.fetchone()[0] >= 10, f"{label}: seed data missing"
+    set_backend(None)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _reset_sales(connect, stock):
+    conn = connect()
+    cur = conn.cursor()
+    set_stock(cur, stock)
+    for table in ("Reports", "sales_daily_book", "sales_monthly_book", "customer_sales", "ledger_applied",
+                  "book_velocity"):
+        cur.execute(f"DELETE FROM {table}")
+    conn.commit()
+    conn.close()
+
+
+def _sales_totals(connect):
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(quantity), 0) FROM Reports")
+    rows, units = cur.fetchone()
+    cur.execute("SELECT COALESCE(SUM(units), 0) FROM sales_daily_book")
+    daily = cur.fetchone()[0]
+    cur.execute("SELECT COALESCE(SUM(purchases), 0) FROM customer_sales")
+    purchases = cur.fetchone()[0]
+    conn.close()
+    return rows, units, daily, purchases
+
+
+def bench_ledger(args, connect):
+    """Purchases/s with the Reports write in the request vs. queued to the write-behind journal."""
+    total = args.threads * args.requests
+    pool = ConnectionPool(connect, size=args.pool_size)
+    folder = tempfile.mkdtemp(prefix="bookstore_ledger_")
+
+    def title(i):
+        return (i * 7919) % 1000 + 1
+
+    _reset_sales(connect, total)
+    sync_rate = run_threads(args.threads, args.requests,
+                            lambda i: purchase_book(title(i), i % 50 + 1, 1, connect=pool.get))
+    assert _sales_totals(connect) == (total, total, total, total)
+
+    _reset_sales(connect, total)
+    journal = ReportsJournal(os.path.join(folder, "ledger.db"))
+    worker = LedgerWorker(journal, connect=pool.get).start()
+    behind_rate = run_threads(args.threads, args.requests,
+                              lambda i: purchase_book_deferred(title(i), i % 50 + 1, 1, journal, connect=pool.get))
+    start = time.perf_counter()
+    worker.stop()
+    drain = time.perf_counter() - start
+    assert _sales_totals(connect) == (total, total, total, total), "write-behind lost or duplicated rows"
+    print(f"synchronous  : {sync_rate:9.1f} purchases/s")
+    print(f"write-behind : {behind_rate:9.1f} purchases/s  ({behind_rate / sync_rate:.1f}x; "
+          f"backlog flushed {drain * 1000:.0f} ms after the last buyer, {worker.batches} batches)")
+
+    # crash recovery: entries queued but never applied, then a crash between
+    # a batch commit and the journal trim; a fresh worker must apply each once
+    _reset_sales(connect, total)
+    for i in range(1000):
+        purchase_book_deferred(title(i), 1, 1, journal, connect=pool.get)
+    journal.trim = lambda upto: None          # "crash" right after the first commit
+    apply_batch(journal, pool.get, limit=300)
+    journal.close()
+    reopened = ReportsJournal(os.path.join(folder, "ledger.db"))
+    replayed = LedgerWorker(reopened, connect=pool.get).drain()
+    assert replayed == 700 and _sales_totals(connect) == (1000, 1000, 1000, 1000), "replay not exactly-once"
+    assert reopened.depth() == 0
+    print(f"crash replay : 300 applied before the crash, {replayed} replayed, 0 duplicates")
+    reopened.close()
+    pool.close_all()
+
+
+@contextlib.contextmanager
+def log_first(on=True):
+    """Run the block with this process's sales logged first (BOOKSTORE_STOCK_LOG_FIRST=1) or written through."""
+    was, stock_view.log_first = stock_view.log_first, on
+    stock_view.clear()
+    try:
+        yield
+    finally:
+        stock_view.log_first = was
+        stock_view.clear()
+
+
+def bench_inventory(args, connect):
+    """
+    Hot-title sales written through to Books.quantity (the default) vs.
+    logged first, Books.quantity current after a sale by default and lagging
+    until compaction log-first, two processes' views racing for the last
+    copies, replay / verify / rebuild, and a page of stock history.
+    """
+    hot_id, total = 1, args.threads * args.requests
+    pool = ConnectionPool(connect, size=args.pool_size)
+    conn = connect()
+    cur = conn.cursor()
+
+    def reset(stock):
+        set_stock(cur, stock)
+        for table in ("Reports", "sales_daily_book", "sales_monthly_book", "customer_sales"):
+            cur.execute(f"DELETE FROM {table}")
+        conn.commit()
+
+    def quantity():
+        cur.execute("SELECT quantity, stock_seq FROM Books WHERE b_id = %s", (hot_id,))
+        row = cur.fetchone()
+        conn.commit()
+        return row
+
+    print(f"{args.threads} buyers x {args.requests} on one title:")
+    buy = lambda i: purchase_book(hot_id, i % 50 + 1, 1, connect=pool.get)
+    reserve = lambda i: reserve_stock(hot_id, 1, connect=pool.get)
+    for name, log, fn in (("purchase, write-through", False, buy), ("purchase, log-first", True, buy),
+                          ("stock only, write-through", False, reserve), ("stock only, log-first", True, reserve)):
+        reset(total)
+        with log_first(log):
+            rate = run_threads(args.threads, args.requests, fn)
+            stock_view.compact(connect)
+        assert quantity()[0] == 0, f"{name}: stock left over"
+        print(f"  {name:<27}: {rate:9.1f}/s")
+
+    # by default Books.quantity is the stock as soon as the sale commits, and the log has the sale
+    reset(total)
+    for i in range(100):
+        purchase_book(hot_id, 1, 1, connect=pool.get)
+    assert quantity() == (total - 100, 100) and verify(connect) == [], "Books.quantity or the log behind the sales"
+    print(f"write-through: Books.quantity {quantity()[0]} and 100 sell events right after 100 sales")
+
+    # log-first, sales land in the log at once, Books.quantity only when compacted
+    reset(total)
+    with log_first():
+        for i in range(100):
+            purchase_book(hot_id, 1, 1, connect=pool.get)
+        lagging = quantity()
+        start = time.perf_counter()
+        folded = stock_view.compact(connect)
+        compact_ms = (time.perf_counter() - start) * 1000
+        logged = stock_view.level(hot_id)
+    assert lagging == (total, 0) and quantity() == (total - 100, 100)
+    print(f"log-first: snapshot before compaction {lagging[0]} (log: {logged}); "
+          f"compacted {folded} title in {compact_ms:.2f} ms -> {quantity()[0]}")
+
+    # two processes, each with its own view, sell the last copies; the log decides
+    copies = min(args.stock, total // 2)
+    reset(copies)
+    views = [StockView(log_first=True), StockView(log_first=True)]
+    sold = [0]
+    lock = threading.Lock()
+
+    def sell(i):
+        c = pool.get()
+        k = c.cursor()
+        try:
+            with views[i % 2].changing([hot_id]) as change:
+                change.take(k, hot_id, 1, "race")
+                c.commit()
+            with lock:
+                sold[0] += 1
+        except StockError:
+            c.rollback()
+        finally:
+            k.close()
+            c.close()
+
+    with log_first():
+        run_threads(args.threads, args.requests, sell)
+        fold_stock(connect=connect)
+    assert sold[0] == copies and quantity() == (0, copies) and verify(connect) == [], "oversold across views"
+    print(f"two views racing for {copies} copies: {sold[0]} sold, 0 oversold, "
+          f"{sum(v.reloads for v in views)} appends re-read a stale view")
+
+    # replay, corruption, rebuild
+    reset(10 ** 6)
+    c = connect()
+    k = c.cursor()
+    with log_first():
+        for b_id in range(1, 201):
+            for n in range(50):
+                record_event(k, b_id, "sell", -1, "bench")
+            c.commit()
+    _, seconds, _ = measure(lambda: replay(connect))
+    cur.execute("UPDATE Books SET quantity = quantity + 3 WHERE b_id = 7")
+    conn.commit()
+    problems = verify(connect)
+    assert [p[0] for p in problems] == [7], problems
+    fixed = rebuild(connect)
+    assert fixed == 1 and verify(connect) == []
+    print(f"replay of 10000 events: {seconds * 1000:.1f} ms; verify caught a corrupted snapshot ({problems[0][2]}), "
+          f"rebuild fixed {fixed} title")
+
+    # written-through receive / adjust / return / sell events chain onto the ones logged first
+    for b_id in range(1, 11):
+        record_event(k, b_id, "receive", 5, "bench")
+        record_event(k, b_id, "adjust", -2, "bench")
+        record_event(k, b_id, "return", 1, "bench")
+        c.commit()
+        purchase_book(b_id, 1, 2, connect=pool.get)
+    assert verify(connect) == [] and quantity() == (10 ** 6 - 48, 54), "write-through events out of line"
+    # a sale logged first and not compacted yet: writing through must refuse rather than fork the log
+    with log_first():
+        purchase_book(hot_id, 1, 1, connect=pool.get)
+    try:
+        purchase_book(hot_id, 1, 1, connect=pool.get, retries=0)
+        raise AssertionError("wrote through past an unfolded event")
+    except PurchaseError:
+        pass
+    fold_stock([hot_id], connect)
+    purchase_book(hot_id, 1, 1, connect=pool.get)
+    k.close()
+    c.close()
+    assert verify(connect) == [] and quantity() == (10 ** 6 - 50, 56)
+    print("write-through: receive, adjust, return and sell events verify; refused past an unfolded event")
+
+    samples = []
+    for i in range(200):
+        start = time.perf_counter()
+        stock_history(i % 200 + 1, after=i % 25, page_size=20, connect=pool.get)
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"history page (20 events): p50 {percentile(samples, 50):.2f} ms  p99 {percentile(samples, 99):.2f} ms")
+    cur.close()
+    conn.close()
+    pool.close_all()
+
+
+def bench_shards(args, connect):
+    """
+    Buyers of one bestseller (run it with --threads 64): the single-row
+    UPDATE written through (the default), log-first, and sharded stock at several slot
+    counts. Half the attempts find the title sold out; every mode must sell
+    exactly the stock it started with.
+    """
+    from bookstore_reorder import stock_outlook
+    hot_id, total = 1, args.threads * args.requests
+    stock = total // 2
+    pool = ConnectionPool(connect, size=max(args.pool_size, args.threads))
+    conn = connect()
+    cur = conn.cursor()
+
+    def buy(i):
+        try:
+            purchase_book(hot_id, i % 50 + 1, 1, connect=pool.get)
+        except PurchaseError:
+            pass
+
+    print(f"{args.threads} buyers x {args.requests}, {stock} copies of one title")
+    print(f"{'mode':<14} {'purchases/s':>12} {'p50 ms':>8} {'p99 ms':>8} {'rebalances':>11}")
+    for mode, log, slots in (("write-through", False, 0), ("log-first", True, 0), ("4 slots", False, 4),
+                             ("16 slots", False, 16), ("64 slots", False, 64)):
+        set_stock(cur, stock, hot_id)
+        for table in ("Reports", "sales_daily_book", "sales_monthly_book", "customer_sales"):
+            cur.execute(f"DELETE FROM {table}")
+        conn.commit()
+        if slots:
+            shard_stock(hot_id, slots, connect)
+        samples = []
+
+        def timed(i):
+            start = time.perf_counter()
+            buy(i)
+            samples.append((time.perf_counter() - start) * 1000)
+
+        rebalances = stock_view.rebalances
+        with log_first(log):
+            rate = run_threads(args.threads, args.requests, timed)
+            stock_view.compact(connect)
+        cur.execute("SELECT quantity FROM Books WHERE b_id = %s", (hot_id,))
+        left = cur.fetchone()[0]
+        cur.execute("SELECT COALESCE(SUM(quantity), 0) FROM Reports WHERE b_id = %s", (hot_id,))
+        sold = cur.fetchone()[0]
+        conn.commit()
+        assert left == 0 and sold == stock, f"{mode}: sold {sold} of {stock}, {left} left"
+        assert verify(connect) == [], f"{mode}: log and stock disagree"
+        print(f"{mode:<14} {rate:12.1f} {percentile(samples, 50):8.2f} {percentile(samples, 99):8.2f} "
+              f"{stock_view.rebalances - rebalances:11d}")
+    print("oversells: 0, stock slots and log verified after every mode")
+
+    # a sharded title's Books.quantity stays at the last fold; the view and the reorder outlook read the slots
+    set_stock(cur, 100, hot_id)
+    conn.commit()
+    shard_stock(hot_id, 4, connect)
+    for i in range(10):
+        buy(i)
+    cur.execute("SELECT quantity FROM Books WHERE b_id = %s", (hot_id,))
+    stale = cur.fetchone()[0]
+    conn.commit()
+    outlook = stock_outlook(connect=connect)
+    seen = int(outlook.loc[outlook["b_id"] == hot_id, "quantity"].iloc[0])
+    level = stock_view.level(hot_id, connect)
+    stock_view.compact(connect)
+    cur.execute("SELECT quantity FROM Books WHERE b_id = %s", (hot_id,))
+    folded = cur.fetchone()[0]
+    conn.commit()
+    assert (stale, level, seen, folded) == (100, 90, 90, 90), (stale, level, seen, folded)
+    shard_stock(hot_id, 0, connect)
+    print(f"4 slots, 10 sold: Books.quantity {stale} until compacted, then {folded}; "
+          f"stock view and reorder outlook {level}")
+    cur.close()
+    conn.close()
+    pool.close_all()
+
+
+def bench_returns(args, connect):
+    """
+    Refunds: --threads customers and staff racing to refund the same
+    purchase (whole, then copy by copy) must never refund more than was
+    bought; then refunds/s, stock and rollups checked against Reports, and
+    net totals over --rows purchases read from the rollups vs. computed by
+    joining refunds to Reports.
+    """
+    purchases, copies = 200, 3
+    pool = ConnectionPool(connect, size=max(args.pool_size, args.threads))
+    conn = connect()
+    cur = conn.cursor()
+    set_stock(cur, args.stock)
+    for table in ("refunds", "Reports", "sales_daily_book", "sales_monthly_book", "customer_sales"):
+        cur.execute(f"DELETE FROM {table}")
+    conn.commit()
+    bought = [purchase_book(i % 20 + 1, i % 50 + 1, copies, connect=pool.get)[0] for i in range(purchases)]
+    stock_view.compact(connect)
+
+    def race(r_no, qty):
+        """--threads refunds of r_no at once, half by its customer and half by staff; returns how many got through."""
+        cur.execute("SELECT c_id FROM Reports WHERE r_no = %s", (r_no,))
+        c_id = cur.fetchone()[0]
+        conn.commit()
+        start, won = threading.Barrier(args.threads), []
+
+        def attempt(i):
+            start.wait()
+            try:
+                if i % 2:
+                    return_purchase(r_no, qty, c_id, "bench", connect=pool.get)
+                else:
+                    refund_purchase(r_no, qty, "bench", "staff", connect=pool.get)
+                won.append(i)
+            except RefundError:
+                pass
+
+        ts = [threading.Thread(target=attempt, args=(i,)) for i in range(args.threads)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        return len(won)
+
+    whole = [race(r_no, copies) for r_no in bought[:20]]
+    single = [race(r_no, 1) for r_no in bought[20:40]]
+    print(f"{args.threads} refunds racing per purchase: whole purchase refunded {sorted(set(whole))} time(s); "
+          f"copy by copy, {sorted(set(single))} of {copies} copies refunded")
+    assert whole == [1] * 20 and single == [copies] * 20, "a purchase was refunded twice"
+
+    samples = []
+
+    def timed(i):
+        begin = time.perf_counter()
+        refund_purchase(bought[40 + i], 1, "bench", "staff", connect=pool.get)
+        samples.append((time.perf_counter() - begin) * 1000)
+
+    per_thread = (purchases - 40) // args.threads
+    rate = run_threads(args.threads, per_thread, lambda i, n=iter(range(purchases - 40)): timed(next(n)))
+    print(f"refunds/s ({args.threads} threads): {rate:.1f}  p50 {percentile(samples, 50):.2f} ms  "
+          f"p99 {percentile(samples, 99):.2f} ms")
+
+    stock_view.compact(connect)
+    cur.execute("SELECT r_no, price FROM Reports WHERE returned = quantity")
+    full = dict(cur.fetchall())
+    cur.execute("SELECT r_no, SUM(amount) FROM refunds GROUP BY r_no")
+    paid = dict(cur.fetchall())
+    # SUM() has no declared type on SQLite and comes back as a float
+    assert all(round(Decimal(str(paid[r_no])), 2) == price for r_no, price in full.items()), "refunds != price paid"
+    cur.execute("SELECT b.b_id FROM Books b JOIN (SELECT b_id, SUM(quantity - returned) AS net FROM Reports "
+                "GROUP BY b_id) r ON r.b_id = b.b_id WHERE b.quantity != %s - r.net", (args.stock,))
+    assert cur.fetchall() == [] and verify(connect) == [], "stock and Reports disagree after refunds"
+    cur.execute("SELECT c_id, units, ROUND(revenue, 2), returned_units, ROUND(refunds, 2) FROM customer_sales "
+                "ORDER BY c_id")
+    incremental = cur.fetchall()
+    rebuild_rollups(cur)
+    cur.execute("SELECT c_id, units, ROUND(revenue, 2), returned_units, ROUND(refunds, 2) FROM customer_sales "
+                "ORDER BY c_id")
+    assert cur.fetchall() == incremental, "incremental rollups drifted from a rebuild"
+    conn.commit()
+    print(f"{len(full)} purchases fully refunded for exactly their price; stock, log and rollups match Reports")
+
+    # net totals over a big Reports table; one customer in ten returned a copy of everything they bought
+    fill_reports(connect, args.rows, first=purchases)
+    cur.execute("UPDATE Reports SET returned = 1 WHERE r_no > %s AND c_id <= 500", (purchases,))
+    cur.execute("INSERT INTO refunds (r_no, b_id, c_id, day, quantity, amount, refunded_by) "
+                "SELECT r_no, b_id, c_id, date_of_purchase, 1, ROUND(price / quantity, 2), 'bench' FROM Reports "
+                "WHERE r_no > %s AND c_id <= 500", (purchases,))
+    rebuild_rollups(cur)
+    conn.commit()
+    since = REPORTS_START + timedelta(days=REPORTS_DAYS - 30)
+    queries = (
+        ("top customers, net", "SELECT c_id, revenue FROM customer_sales ORDER BY revenue DESC LIMIT 10", (),
+         "SELECT r.c_id, SUM(r.price) - COALESCE(SUM(f.amount), 0) AS net FROM Reports r "
+         "LEFT JOIN (SELECT r_no, SUM(amount) AS amount FROM refunds GROUP BY r_no) f ON f.r_no = r.r_no "
+         "GROUP BY r.c_id ORDER BY net DESC LIMIT 10", ()),
+        ("book net, 30 days", "SELECT b_id, SUM(units), SUM(revenue) FROM sales_daily_book WHERE day >= %s "
+                              "GROUP BY b_id", (since,),
+         "SELECT r.b_id, SUM(r.quantity) - COALESCE(SUM(f.quantity), 0), SUM(r.price) - COALESCE(SUM(f.amount), 0) "
+         "FROM Reports r LEFT JOIN refunds f ON f.r_no = r.r_no WHERE r.date_of_purchase >= %s GROUP BY r.b_id",
+         (since,)),
+        ("not yet returned", "SELECT r_no FROM Reports WHERE c_id = %s AND returned < quantity", (7,),
+         "SELECT r.r_no FROM Reports r WHERE r.c_id = %s AND NOT EXISTS "
+         "(SELECT 1 FROM refunds f WHERE f.r_no = r.r_no)", (7,)),
+    )
+    print(f"{args.rows} purchases, {args.rows // 10} refunds:")
+    print(f"{'query':<20} {'no join ms':>10} {'join ms':>10}")
+    for name, fast, fast_params, slow, slow_params in queries:
+        timings = []
+        for sql, params in ((fast, fast_params), (slow, slow_params)):
+            start = time.perf_counter()
+            cur.execute(sql, params)
+            cur.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{name:<20} {timings[0]:10.2f} {timings[1]:10.2f}")
+    conn.commit()
+    cur.close()
+    conn.close()
+    pool.close_all()
+
+
+# the promotions evaluated per row at read time: what checkout and the catalog would run without sale_price
+_RULES = ("SELECT b.b_id, b.price, MIN(CASE WHEN p.promo_id IS NULL THEN NULL WHEN p.kind = 'percent' "
+          "THEN ROUND(b.price * (100 - p.amount) / 100, 2) WHEN b.price > p.amount THEN b.price - p.amount ELSE 0 END) "
+          "FROM Books b LEFT JOIN promotions p "
+          "ON (p.b_id = b.b_id OR p.genre = b.genre) AND p.starts_at <= %s AND p.ends_at > %s ")
+
+
+def bench_pricing(args, connect):
+    """
+    --books titles (SQLite stand-in) and ~1000 promotions running at once
+    (10 of them on a whole genre), with more opening and ending over the
+    next day. The clock is stepped through every window boundary: each
+    refresh re-resolves only the titles the promotion covers, and at the end
+    a full re-resolve must find nothing to fix. Then checkout's price lookup,
+    a catalog page and the whole in-stock catalog, read off Books vs.
+    evaluating the promotions per row.
+    """
+    connect = sqlite_standin(0)
+    conn = connect()
+    cur = conn.cursor()
+    for lo in range(0, args.books, GEN_CHUNK):
+        rows, _, _ = book_rows(lo, min(lo + GEN_CHUNK, args.books), lo // GEN_CHUNK, 1)
+        cur.executemany("INSERT INTO Books (b_id, b_name, genre, quantity, price) VALUES (%s,%s,%s,%s,%s)", rows)
+    rnd = random.Random(11)
+    start = datetime(2025, 1, 1, 12)
+    promos = []
+    for i in range(1200):
+        # 1000 running at the start; 200 more open during the day that follows
+        if i < 1000:
+            opens = start - timedelta(minutes=rnd.randint(1, 1440))
+            closes = start + timedelta(minutes=rnd.randint(60, 2880))
+        else:
+            opens = start + timedelta(minutes=rnd.randint(1, 1440))
+            closes = opens + timedelta(minutes=rnd.randint(60, 2880))
+        if i % 100 == 0:
+            target = (None, rnd.choice(GENRES))
+        else:
+            target = (rnd.randint(1, args.books), None)
+        kind, amount = ("percent", rnd.choice([5, 10, 15, 20, 25, 50])) if i % 2 else ("fixed", rnd.randint(10, 100))
+        promos.append((f"promo {i}", *target, kind, amount, opens, closes))
+    cur.executemany("INSERT INTO promotions (name, b_id, genre, kind, amount, starts_at, ends_at) "
+                    "VALUES (%s,%s,%s,%s,%s,%s,%s)", promos)
+    conn.commit()
+    cur.execute("SELECT COUNT(*) FROM promotions WHERE starts_at <= %s AND ends_at > %s", (start, start))
+    print(f"{args.books} titles, {len(promos)} promotions, {cur.fetchone()[0]} running at the start")
+
+    began = time.perf_counter()
+    opened, _, changed = refresh_promotions(start, connect)
+    print(f"opening the first {opened}: {(time.perf_counter() - began) * 1000:.0f} ms, {changed} titles repriced")
+    began = time.perf_counter()
+    assert rebuild_prices(connect, start) == 0, "the first refresh left stale prices"
+    full = (time.perf_counter() - began) * 1000
+    print(f"full re-resolve of every title: {full:.0f} ms")
+
+    end = start + timedelta(days=1)
+    cur.execute("SELECT starts_at FROM promotions WHERE starts_at > %s AND starts_at <= %s UNION "
+                "SELECT ends_at FROM promotions WHERE ends_at > %s AND ends_at <= %s", (start, end, start, end))
+    boundaries = sorted({datetime.fromisoformat(str(t)) for t, in cur.fetchall()})
+    conn.commit()
+    steps = {"title": [], "genre": []}
+    for at in boundaries:
+        began = time.perf_counter()
+        opened, closed, changed = refresh_promotions(at, connect)
+        elapsed = (time.perf_counter() - began) * 1000
+        steps["genre" if changed > 100 else "title"].append((elapsed, changed))
+    print(f"{len(boundaries)} window boundaries in the next day, refreshed one at a time:")
+    for name, samples in steps.items():
+        if samples:
+            ms = [s[0] for s in samples]
+            print(f"  {name:<6} {len(samples):5d} boundaries  p50 {percentile(ms, 50):7.2f} ms  "
+                  f"p99 {percentile(ms, 99):7.2f} ms  {sum(s[1] for s in samples) / len(samples):7.1f} titles each")
+    began = time.perf_counter()
+    stale = rebuild_prices(connect, end)
+    print(f"full re-resolve afterwards: {stale} stale title(s), {(time.perf_counter() - began) * 1000:.0f} ms")
+    assert stale == 0, "incremental refresh and full re-resolve disagree"
+
+    cur.execute(_RULES + "GROUP BY b.b_id, b.price", (end, end))
+    evaluated = {b_id: best for b_id, _, best in cur.fetchall()}
+    cur.execute("SELECT b_id, sale_price FROM Books")
+    resolved = dict(cur.fetchall())
+    wrong = [b for b, best in evaluated.items() if (best is None) != (resolved[b] is None)
+             or (best is not None and abs(best - float(resolved[b])) > 0.011)]
+    conn.commit()
+    assert not wrong, f"{len(wrong)} sale prices differ from the rules, e.g. b_id {wrong[:5]}"
+    on_sale = sum(1 for p in resolved.values() if p is not None)
+    print(f"{on_sale} titles on sale; every sale price matches the rules evaluated per row")
+
+    picks = [rnd.randint(1, args.books) for _ in range(args.requests)]
+    pages = [rnd.randint(0, args.books - 50) for _ in range(args.requests)]
+    queries = (
+        ("checkout price", lambda i: ("SELECT price, sale_price, genre, slots FROM Books WHERE b_id = %s", (picks[i],)),
+         lambda i: (_RULES + "WHERE b.b_id = %s GROUP BY b.b_id, b.price", (end, end, picks[i]))),
+        ("catalog page (50)", lambda i: ("SELECT * FROM Books WHERE b_id > %s ORDER BY b_id LIMIT 50", (pages[i],)),
+         lambda i: (_RULES + "WHERE b.b_id > %s GROUP BY b.b_id, b.price ORDER BY b.b_id LIMIT 50",
+                    (end, end, pages[i]))),
+        ("in-stock catalog", lambda i: ("SELECT * FROM Books WHERE quantity > 0", ()),
+         lambda i: (_RULES + "WHERE b.quantity > 0 GROUP BY b.b_id, b.price", (end, end))),
+    )
+    print(f"{'read':<20} {'Books p50 ms':>13} {'rules p50 ms':>13}")
+    for name, resolved_sql, rules_sql in queries:
+        n = 5 if name == "in-stock catalog" else args.requests
+        timings = []
+        for make in (resolved_sql, rules_sql):
+            samples = []
+            for i in range(n):
+                sql, params = make(i)
+                began = time.perf_counter()
+                cur.execute(sql, params)
+                cur.fetchall()
+                samples.append((time.perf_counter() - began) * 1000)
+            timings.append(percentile(samples, 50))
+        print(f"{name:<20} {timings[0]:13.3f} {timings[1]:13.3f}")
+    conn.commit()
+
+    cur.execute("SELECT b_id, sale_price FROM Books WHERE sale_price IS NOT NULL AND quantity >= 2 LIMIT 1")
+    b_id, sale_price = cur.fetchone()
+    conn.commit()
+    r_no, total = purchase_book(b_id, 1, 2, connect=connect)
+    assert total == 2 * sale_price, f"charged {total} for 2 x {sale_price}"
+    print(f"checkout charged the sale price: 2 x {sale_price} = {total}")
+    cur.close()
+    conn.close()
+
+
+class HTTPClient:
+    """Tiny keep-alive HTTP/1.1 client on asyncio streams, enough for a load test without extra packages."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.cookie = None
+        self._reader = self._writer = None
+
+    async def request(self, method, path, body=None):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(payload)}"]
+        if body is not None:
+            head.append("Content-Type: application/json")
+        if self.cookie:
+            head.append(f"Cookie: {self.cookie}")
+        self._writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + payload)
+        status = int((await self._reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = (await self._reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            name = name.lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "set-cookie":
+                self.cookie = value.split(";", 1)[0].strip()
+        data = await self._reader.readexactly(length)
+        return status, json.loads(data) if data else None
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+
+
+def bench_api(args, connect):
+    """Concurrent HTTP clients log in, then browse / buy / read history against bookstore_api under uvicorn."""
+    import uvicorn
+    import bookstore_bootstrap as boot
+    from bookstore_api import app
+
+    folder = tempfile.mkdtemp(prefix="bookstore_api_")
+    set_backend(SQLiteBackend(os.path.join(folder, "bookstore.db")))
+    with contextlib.redirect_stdout(io.StringIO()):
+        boot.initialize()
+    conn = connect_raw()
+    cur = conn.cursor()
+    stock = args.threads * args.requests
+    set_stock(cur, stock)
+    conn.commit()
+    cur.execute("SELECT b_id FROM Books ORDER BY b_id")
+    titles = [r[0] for r in cur.fetchall()]
+    conn.close()
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                           access_log=False, backlog=4096))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    logins = ["prachi", "tirthraj", "smera", "ayush", "sairaj", "sankalp"]
+    latencies = {"browse": [], "buy": [], "history": []}
+
+    async def customer(i):
+        client = HTTPClient("127.0.0.1", port)
+        status, _ = await client.request("POST", "/api/login", {"login_id": logins[i % len(logins)],
+                                                                "password": "1234"})
+        assert status == 200, "login failed"
+        rng = random.Random(i)
+        for n in range(args.requests):
+            op = ("browse", "buy", "history")[n % 3]
+            start = time.perf_counter()
+            if op == "browse":
+                status, body = await client.request("GET", "/api/books?limit=20")
+                assert status == 200 and body["books"]
+            elif op == "buy":
+                status, body = await client.request("POST", "/api/purchase",
+                                                    {"b_id": rng.choice(titles), "quantity": 1})
+                assert status == 200, body
+            else:
+                status, body = await client.request("GET", "/api/history?limit=20")
+                assert status == 200
+            latencies[op].append(time.perf_counter() - start)
+        await client.close()
+
+    async def load():
+        await asyncio.gather(*(customer(i) for i in range(args.threads)))
+
+    async def admin():
+        client = HTTPClient("127.0.0.1", port)
+        status, _ = await client.request("POST", "/api/login", {"login_id": "chirag", "password": "admin"})
+        assert status == 200, "admin login failed"
+        for path in ("/api/reports/summary", "/api/restock"):
+            status, body = await client.request("GET", path)
+            assert status == 200, (path, body)
+        # a kind the records endpoints don't manage is a 404, not a KeyError
+        for method, path in (("GET", "/api/nope"), ("POST", "/api/nope"), ("DELETE", "/api/nope/1")):
+            status, body = await client.request(method, path, {} if method == "POST" else None)
+            assert status == 404, (method, path, status, body)
+        await client.close()
+
+    start = time.perf_counter()
+    asyncio.run(load())
+    elapsed = time.perf_counter() - start
+    asyncio.run(admin())
+    server.should_exit = True
+    thread.join()
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"{args.threads} clients x {args.requests} requests: {total / elapsed:.0f} req/s overall")
+    print(f"{'route':<8} {'count':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for op, samples in latencies.items():
+        print(f"{op:<8} {len(samples):>7} {percentile(samples, 50) * 1000:8.1f} {percentile(samples, 99) * 1000:8.1f}")
+
+    conn = connect_raw()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM Reports")
+    bought = cur.fetchone()[0]
+    conn.close()
+    assert bought >= len(latencies["buy"]), "purchases missing from Reports"
+    set_backend(None)
+
+
+def bench_auth(args, connect):
+    """Login throughput with scrypt hashes, and what each later request pays to know who is calling."""
+    import bookstore_bootstrap as boot
+    from bookstore_auth import authenticate, is_hashed, login, session, sessions
+
+    folder = tempfile.mkdtemp(prefix="bookstore_auth_")
+    set_backend(SQLiteBackend(os.path.join(folder, "bookstore.db")))
+    with contextlib.redirect_stdout(io.StringIO()):
+        boot.initialize()
+    conn = connect_raw()
+    cur = conn.cursor()
+    cur.execute("SELECT password FROM Authentication")
+    assert all(is_hashed(pw) for pw, in cur.fetchall()), "plaintext password left after migration"
+    # a row written by an old client: accepted once, then stored hashed
+    cur.execute("UPDATE Authentication SET password = %s WHERE login_id = %s", ("1234", "ayush"))
+    conn.commit()
+    assert authenticate("ayush", "1234") is not None
+    cur.execute("SELECT password FROM Authentication WHERE login_id = %s", ("ayush",))
+    assert is_hashed(cur.fetchone()[0]), "legacy password not re-hashed on login"
+    conn.close()
+    assert authenticate("smera", "wrong") is None and authenticate("nobody", "1234") is None
+    assert authenticate("chirag", "admin")["role"] == "admin"
+
+    logins = ["prachi", "tirthraj", "smera", "ayush", "sairaj", "sankalp"]
+    per_thread = min(args.requests, 10)
+    rate = run_threads(args.threads, per_thread, lambda i: login(logins[i % len(logins)], "1234"))
+    print(f"login (scrypt)      : {rate:9.1f} logins/s on {args.threads} threads")
+
+    # what every request used to do: look the user up again (user_login's two queries)
+    pool = get_pool()
+
+    def lookup():
+        c = pool.get()
+        cur = c.cursor()
+        cur.execute("SELECT * FROM Authentication WHERE login_id = %s", ("smera",))
+        cur.fetchall()
+        cur.execute("SELECT cust_id FROM Customer WHERE login_id = %s", ("smera",))
+        cur.fetchall()
+        cur.close()
+        c.close()
+
+    token, _ = login("smera", "1234")
+    forged = token[:-4] + "AAAA"
+    n = 20000
+    for label, check in [("database lookup", lookup), ("session cache", lambda: session(token)),
+                         ("forged token", lambda: session(forged))]:
+        start = time.perf_counter()
+        for _ in range(n if label != "database lookup" else n // 10):
+            check()
+        per = (time.perf_counter() - start) / (n if label != "database lookup" else n // 10)
+        print(f"{label:<20}: {per * 1e6:9.2f} us per request")
+    assert session(token)["cust_id"] == 4 and session(forged) is None
+    sessions.revoke_user("smera")
+    assert session(token) is None, "revoked session still valid"
+    set_backend(None)
+
+
+def _velocity_histories(days, seed=11):
+    """Synthetic daily unit sales per title (oldest first) and the rate each should be estimated at."""
+    rng = random.Random(seed)
+    steady = [sum(rng.random() < 0.5 for _ in range(10)) for _ in range(days)]          # ~5/day
+    ramp = [round(1 + 9 * d / (days - 1)) for d in range(days)]                          # 1 -> 10/day
+    stopped = [6] * (days - 30) + [0] * 30                                               # discontinued
+    weekly = [14 if d % 7 == 6 else 0 for d in range(days)]                              # 2/day, one big day
+    fresh = [0] * (days - 4) + [8] * 4                                                   # new release
+    return {
+        # b_id: (label, units per day, expected velocity, tolerance)
+        1: ("steady ~5/day", steady, 5.0, 0.2),
+        2: ("ramp 1->10/day", ramp, 8.0, 0.1),
+        3: ("stopped 30 days", stopped, 6 * 0.5 ** (30 / 14), 0.1),
+        4: ("weekly 14 on day 7", weekly, 2.0, 0.35),
+        5: ("new, 8/day x 4", fresh, 8.0, 0.05),
+    }
+
+
+def bench_reorder(args, connect):
+    """Incremental sales velocity against synthetic histories, reorder suggestions and restock orders."""
+    import bookstore_bootstrap as boot
+    from bookstore_analytics import record_sales, record_sales_many
+    from bookstore_reorder import (check_stock, open_orders, rebuild_velocity, receive_restock,
+                                   reorder_suggestions, stock_outlook)
+
+    folder = tempfile.mkdtemp(prefix="bookstore_reorder_")
+    set_backend(SQLiteBackend(os.path.join(folder, "bookstore.db")))
+    with contextlib.redirect_stdout(io.StringIO()):
+        boot.initialize()
+    conn = connect_raw()
+    cur = conn.cursor()
+    for table in ("Reports", "sales_daily_book", "sales_monthly_book", "customer_sales", "book_velocity"):
+        cur.execute(f"DELETE FROM {table}")
+    cur.execute("DELETE FROM Books")
+    cur.executemany("INSERT INTO Books (b_id, b_name, genre, quantity, price) VALUES (%s,%s,%s,%s,%s)",
+                    [(b, f"Title {b}", "Genre", 500, 10) for b in range(1, args.books + 1)])
+    conn.commit()
+
+    days = 90
+    today = REPORTS_START + timedelta(days=days - 1)
+    histories = _velocity_histories(days)
+    rng = random.Random(5)
+    start = time.perf_counter()
+    calls = 0
+    for d in range(days):
+        day = REPORTS_START + timedelta(days=d)
+        for b_id, (_, units, _, _) in histories.items():
+            left = units[d]
+            while left:
+                # several purchases a day; the weekly title goes through the ledger's batch path
+                qty = min(left, rng.randint(1, 3))
+                if b_id == 4:
+                    record_sales_many(cur, [(day, 1, b_id, "Genre", qty, qty * 10)])
+                else:
+                    record_sales(cur, day, 1, [(b_id, "Genre", qty, qty * 10)])
+                calls += 1
+                left -= qty
+        conn.commit()
+    per_purchase = (time.perf_counter() - start) / calls
+
+    outlook = stock_outlook(today).set_index("b_id")
+    print(f"{'history':<20} {'expected':>9} {'estimated':>10}")
+    for b_id, (label, _, expected, tolerance) in histories.items():
+        got = outlook.loc[b_id, "velocity"]
+        print(f"{label:<20} {expected:9.2f} {got:10.2f}")
+        assert abs(got - expected) <= tolerance * expected, f"{label}: velocity {got:.2f}, expected {expected:.2f}"
+
+    # the incremental rows must match a from-scratch rebuild
+    cur.execute("SELECT b_id, rate, day, day_units, first_day FROM book_velocity ORDER BY b_id")
+    incremental = cur.fetchall()
+    rebuild_velocity(cur)
+    cur.execute("SELECT b_id, rate, day, day_units, first_day FROM book_velocity ORDER BY b_id")
+    rebuilt = cur.fetchall()
+    conn.commit()
+    assert [r[2:] for r in incremental] == [r[2:] for r in rebuilt]
+    assert all(abs(a[1] - b[1]) < 1e-9 for a, b in zip(incremental, rebuilt)), "incremental velocity drifted"
+
+    # 20 copies of the ~5/day title last 4 days: inside lead time + safety stock
+    cur.execute("UPDATE Books SET quantity = 20 WHERE b_id = 1")
+    conn.commit()
+    suggestions = reorder_suggestions(today).set_index("b_id")
+    assert list(suggestions.index) == [1], f"unexpected suggestions: {list(suggestions.index)}"
+    v = outlook.loc[1, "velocity"]
+    assert suggestions.loc[1, "order"] == int(np.ceil(v * 37)) - 20
+    _, created = check_stock(auto_order=True, today=today)
+    _, again = check_stock(auto_order=True, today=today)
+    assert (created, again) == (1, 0), "an open order must suppress a second one"
+    _, orders = open_orders()
+    assert receive_restock(orders[0][0]) and not receive_restock(orders[0][0])
+    assert reorder_suggestions(today).empty
+    print(f"title 1 at 20 copies: {suggestions.loc[1, 'days_left']} days left -> "
+          f"ordered {suggestions.loc[1, 'order']}, received, no longer low")
+
+    # scan cost with a velocity row for every title
+    cur.executemany("INSERT INTO book_velocity (b_id, rate, day, day_units, first_day) VALUES (%s,%s,%s,%s,%s) "
+                    "ON DUPLICATE KEY UPDATE rate = VALUES(rate)",
+                    [(b, rng.random() * 5, today, rng.randint(0, 5), REPORTS_START) for b in range(1, args.books + 1)])
+    conn.commit()
+    conn.close()
+    _, seconds, peak = measure(lambda: reorder_suggestions(today))
+    print(f"rollup upkeep: {per_purchase * 1e6:.0f} us per purchase (all rollups incl. velocity); "
+          f"suggestions over {args.books} titles: {seconds * 1000:.0f} ms, {peak:.0f} MB")
+    set_backend(None)
+
+
+def bench_indexes(args, connect):
+    """
+    Every hot query (bookstore_schema.HOT_QUERIES) is served by an index on the
+    migrated schema: EXPLAIN on MySQL, EXPLAIN QUERY PLAN on the stand-in.
+    On the stand-in, dropping one of the indexes must make the check fail.
+    """
+    plans = {}
+    failures = explain_hot_queries(connect, plans)
+    for name, steps in plans.items():
+        print(f"{name:<24} " + ", ".join(f"{table} {access} {key or '-'}" for table, access, key in steps))
+    assert not failures, f"full scans: {failures}"
+    print(f"{len(plans)}/{len(HOT_QUERIES)} hot queries use an index")
+    if args.mysql:
+        return
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("DROP INDEX idx_customer_login")
+    conn.commit()
+    caught = explain_hot_queries(connect)
+    cur.execute("CREATE INDEX idx_customer_login ON Customer (login_id, cust_id)")
+    conn.commit()
+    cur.close()
+    conn.close()
+    print(f"without idx_customer_login: {caught}")
+    assert [f[0] for f in caught] == ["login"], "the check missed a dropped index"
+
+
+def bench_profiler(args, connect):
+    """What profiling adds to a point query, and that statements land under the right caller."""
+    pool = ConnectionPool(connect, size=args.pool_size)
+    query = "SELECT quantity, price FROM Books WHERE b_id = %s"
+
+    def point_queries(n):
+        conn = pool.get()
+        start = time.perf_counter()
+        for i in range(n):
+            cur = conn.cursor()
+            cur.execute(query, (i % 1000 + 1,))
+            cur.fetchall()
+            cur.close()
+        conn.close()
+        return (time.perf_counter() - start) / n
+
+    n = args.requests * 40
+    enabled = profiler.enabled
+    timings = {}
+    for label, on in [("off", False), ("on", True), ("off", False), ("on", True)]:
+        profiler.enabled = on
+        timings[label] = min(timings.get(label, 1e9), point_queries(n))
+    profiler.enabled = True
+    print(f"point query, profiling off : {timings['off'] * 1e6:8.2f} us")
+    print(f"point query, profiling on  : {timings['on'] * 1e6:8.2f} us  "
+          f"(+{(timings['on'] - timings['off']) * 1e6:.2f} us per statement)")
+
+    profiler.reset()
+    point_queries(100)
+    catalog_cache.clear()
+    available_books(connect=pool.get)
+    slow_seconds, profiler.slow_seconds = profiler.slow_seconds, 0.005
+    conn = pool.get()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM Books a, Books b WHERE a.price + b.price > %s", (0,))
+    cur.fetchall()
+    cur.close()
+    conn.close()
+    profiler.slow_seconds = slow_seconds
+
+    by_caller = {(r["caller"], r["statement"]): r for r in profiler.summary()}
+    assert by_caller[("bookstore_bench.point_queries", query)]["calls"] == 100
+    assert by_caller[("bookstore_bench.point_queries", query)]["rows"] == 100
+    assert any(caller == "bookstore_catalog.available_books" for caller, _ in by_caller), \
+        "catalog query credited to a helper instead of available_books"
+    slow = profiler.slow_log()
+    assert slow and slow[0]["caller"] == "bookstore_bench.bench_profiler", "slow query missing from the slow log"
+    print(f"slow log            : {slow[0]['ms']:.1f} ms {slow[0]['caller']} {slow[0]['statement'][:50]}")
+
+    text = prometheus_text(pool=pool)
+    count = [line for line in text.splitlines()
+             if line.startswith("bookstore_query_duration_seconds_count") and "point_queries" in line]
+    assert count and count[0].endswith(" 100"), count
+    path = os.path.join(tempfile.mkdtemp(prefix="bookstore_metrics_"), "bookstore.prom")
+    write_prometheus(path, pool=pool)
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == prometheus_text(pool=pool)
+    print(f"prometheus export   : {len(text.splitlines())} lines, {len(profiler.summary())} statements")
+    profiler.enabled = enabled
+    pool.close_all()
+
+
+def bench_authors(args, connect):
+    """
+    Author names for a page of titles and browsing one author's titles, on
+    --books generated titles (~10% co-written): the cached author map and
+    the BookAuthor (a_id, b_id) index, against a join per page and a scan of
+    a denormalized "Name, Name" author string.
+    """
+    connect = sqlite_standin(0)
+    n_authors = max(args.books // 25, 1)
+    names = author_names(n_authors)
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM Author")
+    cur.executemany("INSERT INTO Author (a_id, a_name) VALUES (%s, %s)", list(enumerate(names, 1)))
+    for lo in range(0, args.books, GEN_CHUNK):
+        rows, pairs, _ = book_rows(lo, min(lo + GEN_CHUNK, args.books), lo // GEN_CHUNK, n_authors)
+        cur.executemany("INSERT INTO Books (b_id, b_name, genre, quantity, price) VALUES (%s,%s,%s,%s,%s)", rows)
+        cur.executemany("INSERT INTO BookAuthor (b_id, a_id) VALUES (%s, %s)", pairs)
+    # what Books.a_name held before authors were normalized
+    cur.execute("CREATE TABLE books_flat AS SELECT b.*, GROUP_CONCAT(a.a_name) AS a_name FROM Books b "
+                "JOIN BookAuthor ba ON ba.b_id = b.b_id JOIN Author a ON a.a_id = ba.a_id GROUP BY b.b_id")
+    conn.commit()
+    author_map.clear()
+    rnd = random.Random(9)
+    starts = [rnd.randint(0, args.books - 50) for _ in range(args.requests)]
+    picks = [rnd.randint(1, n_authors) for _ in range(args.requests)]
+
+    def query(sql, params):
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+    def join_page(i):
+        return query("SELECT b.*, (SELECT GROUP_CONCAT(a.a_name) FROM BookAuthor ba JOIN Author a ON a.a_id = ba.a_id "
+                     "WHERE ba.b_id = b.b_id) FROM Books b WHERE b.b_id > %s ORDER BY b.b_id LIMIT 50", (starts[i],))
+
+    def string_scan(i):
+        return [r[0] for r in query("SELECT b_id FROM books_flat WHERE a_name LIKE %s ORDER BY b_id LIMIT 50",
+                                    (f"%{names[picks[i] - 1]}%",))]
+
+    pool = ConnectionPool(connect, size=1)      # the app reads through its pool
+
+    def indexed(i):
+        return [r[0] for r in books_by_author(picks[i], None, 50, connect=pool.get)[1]]
+
+    start = time.perf_counter()
+    author_map.load(connect)
+    print(f"titles: {args.books}  authors: {n_authors}  author map loaded in "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+    results = {}
+    for label, fn in [("page of 50: join Author per row", join_page),
+                      ("page of 50: BookAuthor + author map", lambda i: books_page(starts[i], 50, connect=pool.get)),
+                      ("by author: LIKE scan of the string", string_scan),
+                      ("by author: BookAuthor index", indexed)]:
+        timings = []
+        for i in range(args.requests):
+            t = time.perf_counter()
+            results.setdefault(label, []).append(fn(i))
+            timings.append((time.perf_counter() - t) * 1000)
+        print(f"{label:<38} p50 {percentile(timings, 50):8.3f} ms  p99 {percentile(timings, 99):8.3f} ms")
+    # the substring match also finds "Name-12" inside "Name-123"
+    wrong = sum(a != b for a, b in zip(results["by author: LIKE scan of the string"],
+                                       results["by author: BookAuthor index"]))
+    print(f"LIKE scan results that differ from the index (substring false positives): {wrong} / {args.requests}")
+    for i in range(min(args.requests, 50)):
+        cur.execute("SELECT b_id FROM BookAuthor WHERE a_id = %s ORDER BY b_id LIMIT 50", (picks[i],))
+        assert results["by author: BookAuthor index"][i] == [r[0] for r in cur.fetchall()]
+    print("author map:", author_map.stats())
+    cur.close()
+    conn.close()
+    pool.close_all()
+
+
+def bench_streamlit(args, connect):
+    """
+    Drive streamlit_app.py with Streamlit's AppTest and count the statements
+    each interaction issues (the profiler sees every query through the
+    pool). Each step must stay within its budget and render one page.
+    """
+    import bookstore_bootstrap as boot
+    from streamlit.testing.v1 import AppTest
+
+    folder = tempfile.mkdtemp(prefix="bookstore_streamlit_")
+    set_backend(SQLiteBackend(os.path.join(folder, "bookstore.db")))
+    with contextlib.redirect_stdout(io.StringIO()):
+        boot.initialize()
+    # a purchase history for smera (cust_id 4)
+    bought = [purchase_book(101 + i % 10, 4, 1)[0] for i in range(60)]
+    stock_view.compact()                        # or the app's compactor folds them inside a counted step
+    clock = start_price_clock()                 # likewise the price clock's first pass
+    while clock is not None and clock.runs < 1:
+        time.sleep(0.01)
+    catalog_cache.clear()
+    author_map.clear()
+    at = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py"),
+                           default_timeout=60)
+
+    def widget(kind, label):
+        return next(w for w in getattr(at, kind) if w.label == label)
+
+    def log_in(login_id, password):
+        widget("text_input", "Login ID").input(login_id)
+        widget("text_input", "Password").input(password)
+        widget("button", "Login").click().run()
+
+    def menu(choice):
+        at.sidebar.selectbox[0].select(choice).run()
+
+    # (step, action, statement budget)
+    steps = [
+        ("login page", lambda: at.run(), 0),
+        # login + profile, then the rerun draws the dashboard's first page (Add Book: no queries)
+        ("admin login", lambda: log_in("chirag", "admin"), 2),
+        ("rerun, nothing changed", lambda: at.run(), 0),
+        # page + its authors + loading the author map once
+        ("view all books", lambda: widget("selectbox", "Select an option").select("View All Books").run(), 3),
+        ("reports page", lambda: menu("Reports"), 1),
+        ("next page", lambda: widget("button", "Next").click().run(), 1),
+        # the open orders; the catalog-wide reorder check waits for its button
+        ("restock page", lambda: menu("Restock"), 1),
+        ("rerun, stock not checked", lambda: at.run(), 1),
+        # the reorder check, then the open orders again
+        ("check stock", lambda: widget("button", "Check stock").click().run(), 2),
+        ("rerun, suggestions kept", lambda: at.run(), 1),
+        ("logout", lambda: menu("Logout"), 0),
+        # login + profile + the catalog (and its authors) for View Books
+        ("customer login", lambda: log_in("smera", "1234"), 4),
+        ("rerun, catalog cached", lambda: at.run(), 0),
+        # history page + the customer's report
+        ("purchase history", lambda: menu("View Purchase History"), 2),
+        # the page twice (typing the number, then the button) and the refund transaction
+        ("return a purchase", lambda: (widget("number_input", "Report No").set_value(bought[0]).run(),
+                                       widget("button", "Return").click().run()), 16),
+        ("buy a book", lambda: (menu("Buy Book"), widget("button", "Buy").click().run()), 3),
+    ]
+    print(f"{'step':<28} {'statements':>10} {'budget':>7} {'ms':>8}")
+    over = []
+    for label, action, budget in steps:
+        profiler.reset()
+        start = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - start
+        assert not at.exception, f"{label}: {at.exception[0].value}"
+        titles = [t.value for t in at.title]
+        assert len(titles) == 1, f"{label}: {len(titles)} pages rendered: {titles}"
+        statements = sum(r["calls"] for r in profiler.summary())
+        print(f"{label:<28} {statements:>10} {budget:>7} {elapsed * 1000:8.1f}")
+        if statements > budget:
+            over.append((label, statements, budget, [(r["caller"], r["statement"][:60]) for r in profiler.summary()]))
+    set_backend(None)
+    assert not over, f"over the statement budget: {over}"
+    print("every step within its statement budget")
+
+
+# ---------- suite: generated data, JSON results ----------
+SUITE_PAGE = 50
+SUITE_TOLERANCE = 0.10      # --compare flags scenarios whose p50 / p99 got this much slower
+
+
+def _suite_scenarios(args, sizes, rnd):
+    """name -> (ops, op(i)); every parameter is drawn up front from the seeded `rnd`."""
+    def pick(n, size):
+        return [rnd.randint(1, n) for _ in range(size)]
+
+    n = args.requests
+    starts, genres = pick(sizes["books"], n), [rnd.choice(GENRES) for _ in range(n)]
+    writers = pick(max(sizes["authors"], 1), n)
+    queries = [" ".join(rnd.choice(WORDS + SURNAMES)[:rnd.randint(3, 7)].lower() for _ in range(rnd.randint(1, 2)))
+               for _ in range(n)]
+    customers = pick(max(sizes["customers"], 1), n)
+    buys = list(zip(pick(sizes["books"], n), pick(max(sizes["customers"], 1), n)))
+
+    def browse(i):
+        if i % 2:
+            return books_page(starts[i], SUITE_PAGE, "genre = %s", (genres[i],))
+        return books_page(starts[i], SUITE_PAGE)
+
+    def history(i):
+        _, rows, after = fetch_page("Reports", "r_no", None, SUITE_PAGE, "c_id = %s", (customers[i],))
+        if after is not None:
+            fetch_page("Reports", "r_no", after, SUITE_PAGE, "c_id = %s", (customers[i],))
+
+    admin = [lambda i: top_books(30, 10, today=GEN_END), lambda i: daily_revenue(30, today=GEN_END),
+             lambda i: genre_totals(12, today=GEN_END), lambda i: top_customers(10),
+             lambda i: customer_report(customers[i])]
+
+    def buy(i):
+        try:
+            purchase_book(buys[i][0], buys[i][1], 1)
+        except PurchaseError:
+            pass            # out of stock: still a full purchase transaction
+
+    # read-only scenarios first, so a --reuse run reads the same data until "buy"
+    return {
+        "browse": (n, browse),
+        "by_author": (n, lambda i: books_by_author(writers[i], None, SUITE_PAGE, in_stock_only=True)),
+        "search": (n, lambda i: search_books(queries[i])),
+        "history": (n, history),
+        "admin_reports": (n, lambda i: admin[i % len(admin)](i)),
+        "report_scan": (1, lambda i: sales_report()),
+        "buy": (n, buy),
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _compare(old, new, tolerance=SUITE_TOLERANCE):
+    print(f"vs {old.get('commit') or '?'}: {'scenario':<14} {'ops/s':>16} {'p50 ms':>20} {'p99 ms':>20}")
+    for name, result in new["scenarios"].items():
+        before = old["scenarios"].get(name)
+        if before is None:
+            continue
+        worse = [m for m in ("p50_ms", "p99_ms") if result[m] > before[m] * (1 + tolerance)]
+        cells = [f"{before[m]:>8.2f} -> {result[m]:<8.2f}" for m in ("ops_per_s", "p50_ms", "p99_ms")]
+        print(f"    {name:<14} {' '.join(cells)}  {'SLOWER (' + ', '.join(worse) + ')' if worse else ''}")
+    if old.get("sizes") != new["sizes"] or old.get("backend_name") != new["backend_name"]:
+        print("    note: different data sizes or backend; numbers are not comparable")
+
+
+def bench_suite(args, connect):
+    """
+    Reproducible end-to-end suite: generate (or --reuse) a database of the
+    requested size, run each scenario through the app's own functions with
+    seeded parameters, and report per-scenario throughput, latency
+    percentiles and statements per op as JSON.
+    """
+    import bookstore_bootstrap as boot
+
+    if args.mysql:
+        backend = MySQLBackend()        # BOOKSTORE_DB_* - point it at a scratch database
+    else:
+        backend = SQLiteBackend(args.data or os.path.join(tempfile.mkdtemp(prefix="bookstore_suite_"), "bench.db"))
+    set_backend(backend)
+    with contextlib.redirect_stdout(io.StringIO()):
+        boot.initialize()
+    generated = {}
+    if not args.reuse:
+        def progress(table, done, total):
+            print(f"\rgenerating {table:<10} {done:>12,} / {total:,}", end="" if done < total else "\n", flush=True)
+
+        generated = generate(args.authors, args.books, args.customers, args.rows, args.days, args.seed,
+                             args.load_method, args.replace, progress)
+    conn = connect_raw()
+    cur = conn.cursor()
+    sizes = {}
+    for name, table in [("authors", "Author"), ("books", "Books"), ("customers", "Customer"), ("reports", "Reports")]:
+        cur.execute(f"SELECT COUNT(*) FROM {table}")
+        sizes[name] = cur.fetchone()[0]
+    conn.close()
+    catalog_cache.clear()
+    start = time.perf_counter()
+    refresh_index()
+    generated["search_index"] = time.perf_counter() - start
+
+    results = {}
+    for name, (ops, op) in _suite_scenarios(args, sizes, random.Random(args.seed)).items():
+        profiler.reset()
+        timings = []
+        start = time.perf_counter()
+        for i in range(ops):
+            t = time.perf_counter()
+            op(i)
+            timings.append((time.perf_counter() - t) * 1000)
+        elapsed = time.perf_counter() - start
+        stats = profiler.summary()
+        results[name] = {
+            "ops": ops, "seconds": round(elapsed, 4), "ops_per_s": round(ops / elapsed, 2),
+            "p50_ms": round(percentile(timings, 50), 3), "p95_ms": round(percentile(timings, 95), 3),
+            "p99_ms": round(percentile(timings, 99), 3), "max_ms": round(max(timings), 3),
+            "statements_per_op": round(sum(r["calls"] for r in stats) / ops, 2),
+            "rows_per_op": round(sum(r["rows"] for r in stats) / ops, 1),
+        }
+        r = results[name]
+        print(f"{name:<14} {ops:>6} ops {r['ops_per_s']:>10.1f} ops/s  p50 {r['p50_ms']:>9.2f} ms  "
+              f"p99 {r['p99_ms']:>9.2f} ms  {r['statements_per_op']:>5.1f} stmts/op")
+
+    report = {
+        "commit": _git_commit(), "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "backend": backend.describe(),
+        "backend_name": backend.name, "python": platform.python_version(), "machine": platform.machine(),
+        "cpus": os.cpu_count(), "seed": args.seed, "sizes": sizes,
+        "setup_seconds": {k: round(v, 3) for k, v in generated.items()}, "scenarios": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.json}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            _compare(json.load(f), report)
+    set_backend(None)
+
+
+SCENARIOS = {
+    "pool": bench_pool,
+    "purchase": bench_purchase,
+    "cart": bench_cart,
+    "cache": bench_cache,
+    "paging": bench_paging,
+    "search": bench_search,
+    "analytics": bench_analytics,
+    "reporting": bench_reporting,
+    "export": bench_export,
+    "import": bench_import,
+    "startup": bench_startup,
+    "ledger": bench_ledger,
+    "inventory": bench_inventory,
+    "shards": bench_shards,
+    "returns": bench_returns,
+    "pricing": bench_pricing,
+    "api": bench_api,
+    "auth": bench_auth,
+    "reorder": bench_reorder,
+    "indexes": bench_indexes,
+    "profiler": bench_profiler,
+    "authors": bench_authors,
+    "streamlit": bench_streamlit,
+    "suite": bench_suite,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bookstore benchmarks")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--mysql", action="store_true", help="use MySQL instead of a SQLite stand-in")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="requests per thread")
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=1000000, help="Reports rows for the paging and suite scenarios")
+    parser.add_argument("--books", type=int, default=500000, help="titles for the search, authors and suite scenarios")
+    parser.add_argument("--stock", type=int, default=1000, help="starting stock for the purchase scenario")
+    parser.add_argument("--authors", type=int, default=DEFAULT_SIZES["authors"], help="suite: generated authors")
+    parser.add_argument("--customers", type=int, default=DEFAULT_SIZES["customers"], help="suite: generated customers")
+    parser.add_argument("--days", type=int, default=730, help="suite: days of generated Reports history")
+    parser.add_argument("--seed", type=int, default=GEN_SEED, help="suite: data and parameter seed")
+    parser.add_argument("--data", help="suite: SQLite file to generate into / reuse (default: a temp file)")
+    parser.add_argument("--reuse", action="store_true", help="suite: run on the data already in the database")
+    parser.add_argument("--replace", action="store_true", help="suite: regenerate over existing generated data")
+    parser.add_argument("--load-method", choices=["executemany", "load"], default="executemany")
+    parser.add_argument("--json", help="suite: write results to this file")
+    parser.add_argument("--compare", help="suite: earlier results file to diff against")
+    args = parser.parse_args()
+
+    connect = connect_raw if args.mysql else sqlite_standin()
+    SCENARIOS[args.scenario](args, connect)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,245 +1,142 @@
 """
 bookstore_bootstrap.py
-- Initializes DB (creates database, tables, seed data if absent)
+- Initializes DB (creates database, tables, seed data if absent; a single
+  version check when it is already current)
 - Then either runs CLI menu or launches Streamlit app.
 Usage:
   1) Initialize & run CLI menu:
        python bookstore_bootstrap.py
   2) Initialize & launch Streamlit:
        python bookstore_bootstrap.py --streamlit
+  3) Initialize & export Reports (streamed, any size):
+       python bookstore_bootstrap.py export reports.csv.gz [--format csv|parquet] [--compression gzip]
+  4) Initialize & bulk-import a CSV (books, customers, staff or authors):
+       python bookstore_bootstrap.py import books catalog.csv [--batch 5000] [--method executemany|load]
+  5) Initialize & serve the web pages and JSON API (see bookstore_api.py):
+       python bookstore_bootstrap.py api [--host 127.0.0.1] [--port 8000]
+  6) Initialize & list titles about to run out (--auto also files restock orders; cron-friendly):
+       python bookstore_bootstrap.py reorder [--auto]
+  7) Initialize & compact / verify / rebuild the stock event log, or show a title's stock history:
+       python bookstore_bootstrap.py inventory compact|verify|rebuild|history [B_ID]
+  8) Initialize & open / close due promotions, re-resolve every sale price, or show a title's price history:
+       python bookstore_bootstrap.py prices refresh|rebuild|history [B_ID]
 Requirements:
   pip install mysql-connector-python pandas streamlit
-Make sure MySQL server is running and update DB credentials below if needed.
+  (api: pip install starlette uvicorn jinja2 itsdangerous python-multipart)
+Make sure MySQL server is running and update DB credentials in bookstore_db.py if needed,
+or run without a server on the embedded SQLite backend:
+  BOOKSTORE_BACKEND=sqlite BOOKSTORE_SQLITE_PATH=bookstore.db python bookstore_bootstrap.py
 """
 
-import mysql.connector
-from mysql.connector import errorcode
-from datetime import date
+import getpass
 import os
 import sys
 import subprocess
 import time
 
-# ---------- CONFIG ----------
-DB_CONFIG = {
-    "host": "localhost",
-    "user": "root",
-    "password": "root",
-    "database": "bookstore"
-}
-# ----------------------------
-
-def connect_server():
-    """Connect to MySQL server (without specifying database)."""
-    cfg = DB_CONFIG.copy()
-    cfg_no_db = {k: v for k, v in cfg.items() if k != "database"}
-    return mysql.connector.connect(**cfg_no_db)
+# DB backend and credentials live in bookstore_db.py (shared with streamlit_app.py)
+from bookstore_db import get_backend, get_pool, fetch_page
+from bookstore_auth import authenticate, create_login
+from bookstore_authors import books_page, join_authors, link_authors, split_authors
+from bookstore_catalog import book_added, book_deleted
+from bookstore_search import search_books
+from bookstore_purchase import PurchaseError
+from bookstore_ledger import buy, shutdown as shutdown_ledger
+from bookstore_export import EXPORT_BATCH, export_reports
+from bookstore_import import COMMIT_EVERY, IMPORT_BATCH, IMPORT_SPECS, import_csv, write_rejects
+from bookstore_inventory import main as inventory_main, open_stock, shutdown as shutdown_inventory, start_compactor
+from bookstore_pricing import main as pricing_main, reprice, shutdown as shutdown_pricing, start_price_clock
+from bookstore_reporting import sales_report, customer_report
+from bookstore_reorder import check_stock
+from bookstore_schema import LATEST_VERSION, installed_version, migrate
 
 def connect_db():
-    """Connect to MySQL server and use bookstore database."""
-    return mysql.connector.connect(**DB_CONFIG)
+    """Check out a pooled connection to the bookstore database (close() returns it)."""
+    return get_pool().get()
 
 def ensure_database_exists():
     try:
-        cnx = connect_server()
-        cur = cnx.cursor()
-        cur.execute("CREATE DATABASE IF NOT EXISTS `{}` DEFAULT CHARACTER SET 'utf8mb4'".format(DB_CONFIG['database']))
-        cnx.commit()
-        cur.close()
-        cnx.close()
-        print("✅ Database ensured.")
+        backend = get_backend()
+        backend.ensure_database()
+        print(f"✅ Database ensured ({backend.describe()}).")
     except Exception as e:
         print("Error creating database:", e)
         sys.exit(1)
 
 def create_tables():
-    """Create required tables (IF NOT EXISTS)."""
-    statements = [
-        """
-        CREATE TABLE IF NOT EXISTS Authentication (
-            login_id VARCHAR(50) PRIMARY KEY,
-            password VARCHAR(100) NOT NULL
-        ) ENGINE=InnoDB;
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS Customer (
-            cust_id INT PRIMARY KEY,
-            c_name VARCHAR(100) NOT NULL,
-            address VARCHAR(200) NOT NULL,
-            phoneno VARCHAR(15) NOT NULL,
-            login_id VARCHAR(50),
-            FOREIGN KEY (login_id) REFERENCES Authentication(login_id)
-               ON DELETE SET NULL ON UPDATE CASCADE
-        ) ENGINE=InnoDB;
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS Author (
-            a_id INT PRIMARY KEY,
-            a_name VARCHAR(100) NOT NULL
-        ) ENGINE=InnoDB;
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS Books (
-            b_id INT PRIMARY KEY,
-            b_name VARCHAR(100) NOT NULL,
-            a_name VARCHAR(100) NOT NULL,
-            genre VARCHAR(50) NOT NULL,
-            quantity INT NOT NULL CHECK (quantity >= 0),
-            price DECIMAL(10,2) NOT NULL CHECK (price >= 0)
-        ) ENGINE=InnoDB;
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS Staff (
-            s_id INT PRIMARY KEY,
-            s_name VARCHAR(100) NOT NULL,
-            s_phone VARCHAR(15) NOT NULL,
-            designation VARCHAR(50) NOT NULL
-        ) ENGINE=InnoDB;
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS Reports (
-            r_no INT PRIMARY KEY,
-            b_id INT,
-            c_id INT,
-            date_of_purchase DATE NOT NULL,
-            quantity INT NOT NULL CHECK (quantity > 0),
-            price DECIMAL(10,2) NOT NULL CHECK (price >= 0),
-            FOREIGN KEY (b_id) REFERENCES Books(b_id) ON DELETE SET NULL ON UPDATE CASCADE,
-            FOREIGN KEY (c_id) REFERENCES Customer(cust_id) ON DELETE SET NULL ON UPDATE CASCADE
-        ) ENGINE=InnoDB;
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS BookAuthor (
-            b_id INT,
-            a_id INT,
-            PRIMARY KEY (b_id, a_id),
-            FOREIGN KEY (b_id) REFERENCES Books(b_id) ON DELETE CASCADE ON UPDATE CASCADE,
-            FOREIGN KEY (a_id) REFERENCES Author(a_id) ON DELETE CASCADE ON UPDATE CASCADE
-        ) ENGINE=InnoDB;
-        """
-    ]
-
+    """Bring the schema up to date by applying pending migrations (see bookstore_schema.py)."""
     try:
-        cnx = connect_db()
-        cur = cnx.cursor()
-        for s in statements:
-            cur.execute(s)
-        cnx.commit()
-        cur.close()
-        cnx.close()
-        print("✅ Tables created/verified.")
+        version = migrate()
+        print(f"✅ Tables created/verified (schema version {version}).")
     except Exception as e:
         print("Error creating tables:", e)
         sys.exit(1)
 
-def seed_data_if_empty():
-    """Insert seed data only if tables are empty."""
-    try:
-        cnx = connect_db()
-        cur = cnx.cursor()
-        # Authentication
-        cur.execute("SELECT COUNT(*) FROM Authentication")
-        if cur.fetchone()[0] == 0:
-            auth_rows = [
-                ('chirag', 'admin'),
-                ('prachi', '1234'),
-                ('tirthraj', '1234'),
-                ('smera', '1234'),
-                ('ayush', '1234'),
-                ('sairaj', '1234'),
-                ('sankalp', '1234')
-            ]
-            cur.executemany("INSERT INTO Authentication (login_id, password) VALUES (%s, %s)", auth_rows)
-            print("  - Authentication seeded")
-
-        # Customer
-        cur.execute("SELECT COUNT(*) FROM Customer")
-        if cur.fetchone()[0] == 0:
-            cust_rows = [
-                (1, 'chirag', 'Mumbai', '9999999999', 'chirag'),
-                (2, 'prachi', 'Pune', '9876543210', 'prachi'),
-                (3, 'tirthraj', 'Delhi', '9123456780', 'tirthraj'),
-                (4, 'smera', 'Chennai', '9988776655', 'smera'),
-                (5, 'ayush', 'Bangalore', '9112233445', 'ayush'),
-                (6, 'sairaj', 'Hyderabad', '9900887766', 'sairaj'),
-                (7, 'sankalp', 'Ahmedabad', '9877898765', 'sankalp')
-            ]
-            cur.executemany(
-                "INSERT INTO Customer (cust_id, c_name, address, phoneno, login_id) VALUES (%s, %s, %s, %s, %s)",
-                cust_rows
-            )
-            print("  - Customer seeded")
-
-        # Author
-        cur.execute("SELECT COUNT(*) FROM Author")
-        if cur.fetchone()[0] == 0:
-            author_rows = [
-                (1, 'J.K. Rowling'),
-                (2, 'George Orwell'),
-                (3, 'Chetan Bhagat'),
-                (4, 'Jane Austen'),
-                (5, 'Dan Brown'),
-                (6, 'Agatha Christie'),
-                (7, 'Paulo Coelho'),
-                (8, 'Mark Manson'),
-                (9, 'Stephen King'),
-                (10, 'Khaled Hosseini')
-            ]
-            cur.executemany("INSERT INTO Author (a_id, a_name) VALUES (%s, %s)", author_rows)
-            print("  - Author seeded")
-
-        # Books
-        cur.execute("SELECT COUNT(*) FROM Books")
-        if cur.fetchone()[0] == 0:
-            books_rows = [
-                (101, 'Harry Potter', 'J.K. Rowling', 'Fantasy', 10, 499.00),
-                (102, '1984', 'George Orwell', 'Dystopian', 8, 349.00),
-                (103, '2 States', 'Chetan Bhagat', 'Romance', 15, 299.00),
-                (104, 'Pride and Prejudice', 'Jane Austen', 'Classic', 12, 399.00),
-                (105, 'The Da Vinci Code', 'Dan Brown', 'Thriller', 20, 450.00),
-                (106, 'Murder on the Orient Express', 'Agatha Christie', 'Mystery', 14, 375.00),
-                (107, 'The Alchemist', 'Paulo Coelho', 'Philosophy', 18, 320.00),
-                (108, 'You Are Not Alone', 'Mark Manson', 'Self-Help', 22, 299.00),
-                (109, 'The Shining', 'Stephen King', 'Horror', 9, 425.00),
-                (110, 'The Kite Runner', 'Khaled Hosseini', 'Drama', 16, 380.00)
-            ]
-            cur.executemany("INSERT INTO Books (b_id, b_name, a_name, genre, quantity, price) VALUES (%s, %s, %s, %s, %s, %s)", books_rows)
-            print("  - Books seeded")
-
-        # BookAuthor
-        cur.execute("SELECT COUNT(*) FROM BookAuthor")
-        if cur.fetchone()[0] == 0:
-            ba_rows = [(101,1),(102,2),(103,3),(104,4),(105,5),(106,6),(107,7),(108,8),(109,9),(110,10)]
-            cur.executemany("INSERT INTO BookAuthor (b_id, a_id) VALUES (%s, %s)", ba_rows)
-            print("  - BookAuthor seeded")
-
-        # Reports (empty initially) - skip
-
-        cnx.commit()
-        cur.close()
-        cnx.close()
-        print("✅ Seed data inserted (if tables were empty).")
-    except Exception as e:
-        print("Error seeding data:", e)
-        sys.exit(1)
+def initialize():
+    """
+    Bring the database up to date, as fast as possible when it already is:
+    one schema_version query on a pooled connection (kept for the app to
+    reuse), and only if that shows an older or missing schema does it create
+    the database, migrate and seed. Returns [(phase, seconds)].
+    """
+    phases = []
+    start = time.perf_counter()
+    version = installed_version()
+    phases.append(("version check", time.perf_counter() - start))
+    if version == LATEST_VERSION:
+        return phases
+    start = time.perf_counter()
+    ensure_database_exists()
+    phases.append(("ensure database", time.perf_counter() - start))
+    start = time.perf_counter()
+    create_tables()     # also seeds empty tables (migration "seed data")
+    phases.append(("migrate + seed", time.perf_counter() - start))
+    return phases
 
 # ----------------- CLI menu implementation (adapted from your main code) -----------------
+CLI_PAGE_SIZE = 20
+
 def get_connection():
     return connect_db()
 
+def print_pages(table, key, where=None, params=(), fetch=None):
+    """
+    Print a table one keyset page at a time; returns the number of rows shown.
+    fetch(after, page_size) -> (columns, rows, next_after) replaces fetch_page.
+    """
+    size = input(f"Rows per page [{CLI_PAGE_SIZE}]: ").strip()
+    size = int(size) if size.isdigit() and int(size) > 0 else CLI_PAGE_SIZE
+    after, shown = None, 0
+    while True:
+        if fetch is None:
+            _, rows, after = fetch_page(table, key, after, size, where, params)
+        else:
+            _, rows, after = fetch(after, size)
+        for r in rows:
+            print(r)
+        shown += len(rows)
+        if after is None or input("Enter for next page, q to stop: ").strip().lower() == "q":
+            return shown
+
 def add_book_cli():
     try:
         conn = get_connection()
         cur = conn.cursor()
         b_id = int(input("Book ID: "))
         b_name = input("Book Name: ")
-        a_name = input("Author Name: ")
+        authors = split_authors(input("Author(s), separated by ;: "))
         genre = input("Genre: ")
         quantity = int(input("Quantity: "))
         price = float(input("Price: "))
-        cur.execute("INSERT INTO Books (b_id, b_name, a_name, genre, quantity, price) VALUES (%s,%s,%s,%s,%s,%s)",
-                    (b_id, b_name, a_name, genre, quantity, price))
+        if not authors:
+            raise ValueError("at least one author is required")
+        cur.execute("INSERT INTO Books (b_id, b_name, genre, quantity, price) VALUES (%s,%s,%s,%s,%s)",
+                    (b_id, b_name, genre, quantity, price))
+        link_authors(cur, [(b_id, authors)])
+        open_stock(cur, [b_id])
+        reprice(cur, [b_id])
         conn.commit()
+        book_added(b_id, b_name, join_authors(authors), genre)
         print("Book added.")
     except Exception as e:
         print("Error adding book:", e)
@@ -254,6 +151,7 @@ def delete_book_cli():
         b_id = int(input("Enter Book ID to delete: "))
         cur.execute("DELETE FROM Books WHERE b_id = %s", (b_id,))
         conn.commit()
+        book_deleted(b_id)
         print("Book deleted.")
     except Exception as e:
         print("Error deleting book:", e)
@@ -262,26 +160,40 @@ def delete_book_cli():
         conn.close()
 
 def view_books_cli():
-    conn = get_connection()
-    df_cur = conn.cursor()
-    df_cur.execute("SELECT * FROM Books WHERE quantity > 0")
-    for book in df_cur.fetchall():
-        print(book)
-    df_cur.close()
-    conn.close()
+    print_pages("Books", "b_id", fetch=lambda after, size: books_page(after, size, "quantity > 0"))
+
+def search_books_cli():
+    query = input("Search title / author / genre: ").strip()
+    _, rows = search_books(query) if query else ([], [])
+    if rows:
+        for book in rows:
+            print(book)
+    else:
+        print("No books match your search.")
 
 # Customer functions
 def add_customer_cli():
     try:
-        conn = get_connection()
-        cur = conn.cursor()
         c_id = int(input("Customer ID: "))
-        c_name = input("Customer Name: ")
-        address = input("Address: ")
-        phoneno = input("Phone: ")
-        login_id = input("Login ID (unique): ")
+    except ValueError as e:
+        print("Error adding customer:", e)
+        return
+    c_name = input("Customer Name: ")
+    address = input("Address: ")
+    phoneno = input("Phone: ")
+    login_id = input("Login ID (unique, Enter for none): ").strip()
+    password = getpass.getpass("Password: ") if login_id else None
+    if login_id and not password:
+        print("Error adding customer: the new login needs a password.")
+        return
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        # the login first: Customer.login_id references Authentication
+        if login_id:
+            create_login(cur, login_id, password)
         cur.execute("INSERT INTO Customer (cust_id, c_name, address, phoneno, login_id) VALUES (%s,%s,%s,%s,%s)",
-                    (c_id, c_name, address, phoneno, login_id))
+                    (c_id, c_name, address, phoneno, login_id or None))
         conn.commit()
         print("Customer added.")
     except Exception as e:
@@ -305,13 +217,7 @@ def delete_customer_cli():
         conn.close()
 
 def view_customers_cli():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM Customer")
-    for r in cur.fetchall():
-        print(r)
-    cur.close()
-    conn.close()
+    print_pages("Customer", "cust_id")
 
 # Staff
 def add_staff_cli():
@@ -347,68 +253,45 @@ def delete_staff_cli():
         conn.close()
 
 def view_staff_cli():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM Staff")
-    for r in cur.fetchall():
-        print(r)
-    cur.close()
-    conn.close()
+    print_pages("Staff", "s_id")
 
 # Reports & buying
+def print_report_summary(report, top=5):
+    t = report.totals()
+    print(f"Purchases: {t['purchases']}  Units: {t['units']}  Revenue: {t['revenue']:.2f}  "
+          f"Avg/purchase: {t['avg_purchase']:.2f}")
+    daily = report.daily()
+    if len(daily):
+        print("Last days (revenue, 7-day moving average):")
+        for day, row in daily.tail(top).iterrows():
+            print(f"  {day.date()}  {row['revenue']:10.2f}  {row['moving_avg']:10.2f}")
+    ltv = report.lifetime_value()
+    if len(ltv) > 1:
+        print("Top customers by lifetime value:")
+        for c_id, row in ltv.head(top).iterrows():
+            print(f"  customer {c_id}: {row['revenue']:.2f} over {row['purchases']} purchase(s)")
+
 def view_reports_cli():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM Reports")
-    for r in cur.fetchall():
-        print(r)
-    cur.close()
-    conn.close()
+    print_report_summary(sales_report())
+    print_pages("Reports", "r_no")
 
 def buy_book_cli(cust_id):
-    conn = get_connection()
-    cur = conn.cursor()
     view_books_cli()
     try:
         b_id = int(input("Enter Book ID to buy: "))
         qty = int(input("Enter quantity: "))
-        cur.execute("SELECT quantity, price FROM Books WHERE b_id = %s", (b_id,))
-        res = cur.fetchone()
-        if not res:
-            print("Book not found.")
-            return
-        stock, price = res
-        if qty > stock:
-            print("Not enough stock.")
-            return
-        total = price * qty
-        today = date.today()
-        cur.execute("SELECT MAX(r_no) FROM Reports")
-        rno = cur.fetchone()[0]
-        rno = 1 if rno is None else rno + 1
-        cur.execute("INSERT INTO Reports (r_no, b_id, c_id, date_of_purchase, quantity, price) VALUES (%s,%s,%s,%s,%s,%s)",
-                    (rno, b_id, cust_id, today, qty, total))
-        cur.execute("UPDATE Books SET quantity = quantity - %s WHERE b_id = %s", (qty, b_id))
-        conn.commit()
+        r_no, total = buy(b_id, cust_id, qty)
         print("Purchase successful. Total:", total)
+    except PurchaseError as e:
+        print(e)
     except Exception as e:
         print("Error during purchase:", e)
-    finally:
-        cur.close()
-        conn.close()
 
 def view_purchase_history_cli(cust_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM Reports WHERE c_id = %s", (cust_id,))
-    recs = cur.fetchall()
-    if recs:
-        for r in recs:
-            print(r)
-    else:
+    if not print_pages("Reports", "r_no", "c_id = %s", (cust_id,)):
         print("No purchases yet.")
-    cur.close()
-    conn.close()
+    else:
+        print_report_summary(customer_report(cust_id))
 
 # Login & Menus
 def admin_menu():
@@ -494,17 +377,20 @@ def customer_menu(cust_id):
     while True:
         print("\n--- CUSTOMER MENU ---")
         print("1. View Books")
-        print("2. Buy Book")
-        print("3. View Purchase History")
-        print("4. Logout")
+        print("2. Search Books")
+        print("3. Buy Book")
+        print("4. View Purchase History")
+        print("5. Logout")
         choice = input("Enter choice: ")
         if choice == "1":
             view_books_cli()
         elif choice == "2":
-            buy_book_cli(cust_id)
+            search_books_cli()
         elif choice == "3":
-            view_purchase_history_cli(cust_id)
+            buy_book_cli(cust_id)
         elif choice == "4":
+            view_purchase_history_cli(cust_id)
+        elif choice == "5":
             break
         else:
             print("Invalid choice.")
@@ -512,30 +398,13 @@ def customer_menu(cust_id):
 def login_cli():
     login_id = input("Login ID: ").strip()
     password = input("Password: ").strip()
-    # check Authentication table
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT password FROM Authentication WHERE login_id = %s", (login_id,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
-    if row and row[0] == password:
-        if login_id == "chirag":
-            admin_menu()
-        else:
-            # get cust_id
-            conn2 = get_connection()
-            cur2 = conn2.cursor()
-            cur2.execute("SELECT cust_id FROM Customer WHERE login_id = %s", (login_id,))
-            r = cur2.fetchone()
-            cur2.close()
-            conn2.close()
-            if r:
-                customer_menu(r[0])
-            else:
-                print("Customer record not found.")
-    else:
+    user = authenticate(login_id, password)
+    if user is None:
         print("Invalid credentials.")
+    elif user["role"] == "admin":
+        admin_menu()
+    else:
+        customer_menu(user["cust_id"])
 
 def run_cli_loop():
     while True:
@@ -550,17 +419,97 @@ def run_cli_loop():
         else:
             print("Invalid option.")
 
+def export_cli(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="bookstore_bootstrap.py export",
+                                     description="Stream the Reports table to CSV or Parquet.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "parquet"])
+    parser.add_argument("--compression", help="csv: gzip, bz2, xz; parquet: snappy, gzip, zstd, none")
+    parser.add_argument("--batch", type=int, default=EXPORT_BATCH, help="rows fetched and written per batch")
+    args = parser.parse_args(argv)
+    fmt = args.format or ("parquet" if args.path.endswith(".parquet") else "csv")
+    compression = args.compression
+    if compression is None and fmt == "csv":
+        compression = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz"}.get(os.path.splitext(args.path)[1])
+    start = time.perf_counter()
+    count = export_reports(args.path, fmt, compression, args.batch)
+    print(f"Exported {count} rows to {args.path} in {time.perf_counter() - start:.1f}s.")
+
+def import_cli(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="bookstore_bootstrap.py import",
+                                     description="Bulk upsert rows from a CSV file (header row required).")
+    parser.add_argument("kind", choices=list(IMPORT_SPECS))
+    parser.add_argument("path")
+    parser.add_argument("--batch", type=int, default=IMPORT_BATCH, help="rows validated and written per batch")
+    parser.add_argument("--commit-every", type=int, default=COMMIT_EVERY, help="commit after this many rows")
+    parser.add_argument("--method", choices=["executemany", "load"], default="executemany",
+                        help="load = MySQL LOAD DATA LOCAL INFILE (server needs local_infile=ON)")
+    parser.add_argument("--rejects", help="where to write rejected rows (default: <path>.rejects.csv)")
+    args = parser.parse_args(argv)
+
+    def progress(imported, rejected):
+        print(f"\r{imported} imported, {rejected} rejected", end="", flush=True)
+
+    result = import_csv(args.kind, args.path, args.batch, args.commit_every, args.method, progress=progress)
+    print(f"\nImported {result['imported']} of {result['rows']} rows in {result['seconds']:.1f}s "
+          f"({result['rows'] / max(result['seconds'], 1e-9):.0f} rows/s).")
+    if result["rejected"]:
+        out = args.rejects or args.path + ".rejects.csv"
+        write_rejects(result["rejected"], out)
+        print(f"{len(result['rejected'])} rows rejected, see {out}")
+
+def reorder_cli(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="bookstore_bootstrap.py reorder",
+                                     description="List titles that will run out within the supplier lead time.")
+    parser.add_argument("--auto", action="store_true", help="file restock orders for them")
+    args = parser.parse_args(argv)
+    suggestions, created = check_stock(auto_order=args.auto)
+    if suggestions.empty:
+        print("No title is about to run out.")
+        return
+    print(f"{'b_id':>6}  {'title':<40} {'stock':>6} {'/day':>7} {'days':>6} {'order':>6}")
+    for row in suggestions.itertuples():
+        print(f"{row.b_id:>6}  {row.b_name[:40]:<40} {row.quantity:>6} {row.velocity:>7.2f} "
+              f"{row.days_left:>6.1f} {row.order:>6}")
+    if args.auto:
+        print(f"{created} restock order(s) created ({len(suggestions) - created} already on order).")
+
+def api_cli(argv):
+    import argparse
+    from bookstore_api import serve
+    parser = argparse.ArgumentParser(prog="bookstore_bootstrap.py api",
+                                     description="Serve the web pages and the JSON API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+    print(f"Serving on http://{args.host}:{args.port}/ (Ctrl+C to stop)")
+    serve(args.host, args.port)
+
 # ----------------- MAIN -----------------
 def main():
     print("Initializing bookstore database...")
-    ensure_database_exists()
-    # small delay to ensure DB ready
-    time.sleep(0.5)
-    create_tables()
-    seed_data_if_empty()
+    phases = initialize()
+    total = sum(seconds for _, seconds in phases)
+    print(f"✅ Ready in {total * 1000:.1f} ms (" +
+          ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in phases) + ")")
 
     # Decide what to run
-    if len(sys.argv) > 1 and sys.argv[1] == "--streamlit":
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        export_cli(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "import":
+        import_cli(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "reorder":
+        reorder_cli(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "api":
+        api_cli(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "inventory":
+        sys.exit(inventory_main(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "prices":
+        sys.exit(pricing_main(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "--streamlit":
         # Launch streamlit app (assumes streamlit_app.py in same folder)
         print("Launching Streamlit app...")
         # Use subprocess so this script doesn't block the shell if you want to keep logs
@@ -571,7 +520,12 @@ def main():
             print(e)
     else:
         # Default: run CLI menu
+        start_compactor()
+        start_price_clock()
         run_cli_loop()
+        shutdown_ledger()
+        shutdown_inventory()
+        shutdown_pricing()
         print("Exiting. Goodbye!")
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+"""
+bookstore_catalog.py
+- Catalog reads shared by the CLI and the Streamlit views.
+- Results are kept in a process-wide TTL cache, so Streamlit reruns don't
+  query Books again until something writes to it. Writers (add/delete book,
+  purchases) call catalog_cache.invalidate("Books").
+- book_added() / book_deleted() / books_imported() / authors_imported() /
+  author_deleted() are the hooks add_book, delete_book, the CSV import and
+  delete_author call after committing; they also keep the search index and
+  the author map current.
+"""
+
+import os
+import threading
+import time
+
+from bookstore_authors import author_map, with_authors
+from bookstore_db import get_connection
+from bookstore_metrics import pass_through
+from bookstore_search import search_index
+
+CATALOG_TTL = float(os.environ.get("BOOKSTORE_CATALOG_TTL", "30"))
+
+
+class CatalogCache:
+    """
+    Small TTL cache keyed by query name. Every entry records the tables it
+    was read from; invalidate(table) drops only the entries that depend on it.
+    """
+
+    def __init__(self, ttl=CATALOG_TTL):
+        self.ttl = ttl
+        self._entries = {}          # key -> (expires_at, tables, value)
+        self._generation = {}       # table -> bumped on every invalidate
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @pass_through
+    def get(self, key, loader, tables):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            seen = [self._generation.get(t, 0) for t in tables]
+
+        value = loader()
+
+        with self._lock:
+            # don't store a result that a concurrent write has already made stale
+            if seen == [self._generation.get(t, 0) for t in tables]:
+                self._entries[key] = (now + self.ttl, tuple(tables), value)
+        return value
+
+    def invalidate(self, table):
+        with self._lock:
+            self._generation[table] = self._generation.get(table, 0) + 1
+            for key in [k for k, e in self._entries.items() if table in e[1]]:
+                del self._entries[key]
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+catalog_cache = CatalogCache()
+
+
+@pass_through
+def _fetch(connect, query):
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute(query)
+        columns = [d[0] for d in cur.description]
+        return columns, cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def available_books(connect=get_connection):
+    """(columns, rows) for books with stock left, with their "authors", cached."""
+    return catalog_cache.get(
+        "books:available",
+        lambda: with_authors(*_fetch(connect, "SELECT * FROM Books WHERE quantity > 0"), connect),
+        ("Books", "BookAuthor"))
+
+
+def book_added(b_id, b_name, authors, genre):
+    """authors: the display text, "Name; Name"."""
+    catalog_cache.invalidate("Books")
+    catalog_cache.invalidate("BookAuthor")
+    if search_index.built_at is not None:
+        search_index.add(b_id, b_name, authors, genre)
+
+
+def books_imported():
+    # a bulk upsert can also rename existing titles, so rebuild the index on next use
+    catalog_cache.invalidate("Books")
+    catalog_cache.invalidate("BookAuthor")
+    search_index.built_at = None
+
+
+def authors_imported():
+    # names may have changed under ids the map already holds
+    author_map.clear()
+    catalog_cache.invalidate("BookAuthor")
+    search_index.built_at = None
+
+
+def author_deleted(a_id):
+    # BookAuthor rows go with it (ON DELETE CASCADE), so titles lose that name
+    author_map.removed(a_id)
+    catalog_cache.invalidate("BookAuthor")
+    search_index.built_at = None
+
+
+def book_deleted(b_id):
+    catalog_cache.invalidate("Books")
+    search_index.remove(b_id)
@@ -0,0 +1,351 @@
+"""
+bookstore_datagen.py
+- Deterministic synthetic data for benchmarking at scale: fills Author,
+  Books, BookAuthor, Customer and Reports to the requested sizes (e.g. 1M
+  titles and 50M purchases) and rebuilds the rollups and sales velocity from
+  the generated Reports, so every page of the app has realistic data.
+- The same seed and sizes always give the same rows, on either backend:
+  each GEN_CHUNK-row chunk of a table is drawn from its own NumPy generator
+  seeded with (seed, table, chunk), so chunks can be generated and loaded
+  one at a time in flat memory.
+- Shape: title popularity is Zipf-like (a few hot titles, a long tail) and
+  independent of b_id; a few customers buy far more than the rest; Reports
+  is in date order over `days` days ending GEN_END, like a real purchase log
+  (r_no grows with date_of_purchase). ~5% of titles are out of stock and
+  ~10% have a second author.
+- Loading is bulk: large executemany batches on an unpooled connection with
+  foreign key / unique checks off (rows are consistent by construction), or
+  on MySQL method="load" (LOAD DATA LOCAL INFILE, one file per chunk). The
+  secondary indexes of the loaded tables (as created by the migrations) are
+  dropped for the load and rebuilt once at the end.
+- generate() replaces the catalog, customers and sales. It refuses to run
+  on a database with more than the seed data unless replace=True.
+Usage:
+    BOOKSTORE_BACKEND=sqlite BOOKSTORE_SQLITE_PATH=bench.db \\
+        python bookstore_datagen.py --books 1000000 --reports 50000000 [--method load] [--replace]
+"""
+
+import argparse
+import csv
+import os
+import random
+import re
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from bookstore_analytics import rebuild_rollups
+from bookstore_catalog import authors_imported, books_imported
+from bookstore_db import connect_raw, get_backend
+from bookstore_import import connect_local_infile
+from bookstore_inventory import stock_view
+from bookstore_reorder import rebuild_velocity
+from bookstore_schema import MIGRATIONS
+
+GEN_CHUNK = 100000          # rows per generated (and loaded) chunk; part of what the seed reproduces
+GEN_END = date(2025, 12, 31)
+GEN_SEED = 42
+SEED_MAX_BOOKS = 10         # more titles than the seed data: generate() wants replace=True
+
+DEFAULT_SIZES = {"authors": 20000, "books": 100000, "customers": 50000, "reports": 1000000}
+
+WORDS = ("dark night river stone house garden secret city winter summer king queen ghost "
+         "shadow fire ocean star empire silent broken golden lost last first little wild "
+         "dream storm island forest mountain journey letter daughter son war peace love "
+         "murder mystery code game hunger wind glass iron silver heart mind time road").split()
+SURNAMES = ("Smith Patel Sharma Brown Khan Garcia Rossi Mueller Tanaka Silva Austen Orwell "
+            "Christie King Brown Rowling Coelho Bhagat Hosseini Manson").split()
+FIRST_NAMES = ("Aarav Ananya Chirag Prachi Smera Ayush Sairaj Sankalp Tirthraj Meera Rohan Kavya "
+               "Emma Liam Olivia Noah Sofia Mateo Yuki Hana Lucas Amara Omar Leila").split()
+GENRES = ("Fantasy Dystopian Romance Classic Thriller Mystery Philosophy Self-Help Horror "
+          "Drama Science History Biography Poetry").split()
+STREETS = ("MG Road|Park Street|Station Road|Lake View|Hill Road|Church Street|Market Lane|"
+           "Ring Road|College Road|Temple Street").split("|")
+CITIES = "Pune Mumbai Delhi Bangalore Chennai Kolkata Hyderabad Ahmedabad Jaipur Nagpur".split()
+
+# tables generate() fills or has to empty, children first
+CLEARED_TABLES = ("refunds", "Reports", "BookAuthor", "inventory_events", "stock_slots", "restock_orders",
+                  "book_velocity", "sales_daily_book", "sales_monthly_book", "customer_sales", "ledger_applied",
+                  "price_history", "promotions", "Books", "Author", "Customer")
+
+_CREATE_INDEX = re.compile(r"\s*CREATE INDEX (\w+) ON (\w+)\b")
+_DROP_INDEX = re.compile(r"\s*DROP INDEX (\w+) ON \w+")
+
+_TABLE_CODES = {"popularity": 0, "Author": 1, "Books": 2, "Customer": 3, "Reports": 4}
+
+
+def synthetic_titles(n, seed=42):
+    """Deterministic (b_id, b_name, authors, genre) rows."""
+    rnd = random.Random(seed)
+    for b_id in range(1, n + 1):
+        title = " ".join(rnd.choice(WORDS).title() for _ in range(rnd.randint(1, 4)))
+        author = f"{rnd.choice(SURNAMES)} {rnd.choice(SURNAMES)}-{b_id % 997}"
+        yield b_id, f"{title} {b_id % 101}", author, rnd.choice(GENRES)
+
+
+def _rng(seed, table, chunk=0):
+    return np.random.default_rng([seed, _TABLE_CODES[table], chunk])
+
+
+def _chunks(n):
+    for i, lo in enumerate(range(0, n, GEN_CHUNK)):
+        yield i, lo, min(lo + GEN_CHUNK, n)
+
+
+def author_names(n, seed=GEN_SEED):
+    """a_name for a_id 1..n (index 0 is a_id 1)."""
+    rng = _rng(seed, "Author")
+    first = np.array(FIRST_NAMES, dtype=object)[rng.integers(len(FIRST_NAMES), size=n)]
+    last = np.array(SURNAMES, dtype=object)[rng.integers(len(SURNAMES), size=n)]
+    return [f"{f} {s}-{a_id}" for a_id, f, s in zip(range(1, n + 1), first, last)]
+
+
+def _zipf_sampler(n, exponent, rng):
+    """Draw ids 1..n with Zipf-like weights over a random ranking: sample(rng, size) -> ids."""
+    ranked = rng.permutation(n) + 1
+    cdf = np.cumsum(1.0 / np.arange(1, n + 1) ** exponent)
+    cdf /= cdf[-1]
+    return lambda r, size: ranked[np.minimum(np.searchsorted(cdf, r.random(size)), n - 1)]
+
+
+def book_rows(lo, hi, chunk, authors, seed=GEN_SEED):
+    """Books rows b_id lo+1..hi plus each title's BookAuthor pairs and price (paise) array."""
+    rng = _rng(seed, "Books", chunk)
+    n = hi - lo
+    b_ids = np.arange(lo + 1, hi + 1)
+    words = np.array([w.title() for w in WORDS], dtype=object)[rng.integers(len(WORDS), size=(n, 4))]
+    lengths = rng.integers(1, 5, size=n)
+    primary = rng.integers(1, authors + 1, size=n)
+    genres = np.array(GENRES, dtype=object)[rng.integers(len(GENRES), size=n)]
+    quantity = np.where(rng.random(n) < 0.05, 0, rng.integers(1, 200, size=n))
+    paise = rng.integers(99, 2000, size=n) * 50 - 1          # 49.49 .. 999.49, ending in .49 / .99
+    rows = list(zip(b_ids.tolist(), [" ".join(w[:k]) for w, k in zip(words, lengths)], genres.tolist(),
+                    quantity.tolist(), (paise / 100).tolist()))
+    pairs = list(zip(b_ids.tolist(), primary.tolist()))
+    second = rng.random(n) < 0.10
+    co = rng.integers(1, authors + 1, size=n)
+    pairs += [(b, a) for b, a, p in zip(b_ids[second].tolist(), co[second].tolist(), primary[second].tolist())
+              if a != p]
+    return rows, sorted(pairs), paise
+
+
+def customer_rows(lo, hi, chunk, seed=GEN_SEED):
+    rng = _rng(seed, "Customer", chunk)
+    n = hi - lo
+    first = np.array(FIRST_NAMES, dtype=object)[rng.integers(len(FIRST_NAMES), size=n)]
+    last = np.array(SURNAMES, dtype=object)[rng.integers(len(SURNAMES), size=n)]
+    street = np.array(STREETS, dtype=object)[rng.integers(len(STREETS), size=n)]
+    city = np.array(CITIES, dtype=object)[rng.integers(len(CITIES), size=n)]
+    house = rng.integers(1, 500, size=n)
+    phone = rng.integers(7000000000, 9999999999, size=n)
+    return [(c, f"{f} {s}", f"{h} {st}, {ci}", str(p), None)
+            for c, f, s, st, ci, h, p in zip(range(lo + 1, hi + 1), first, last, street, city, house.tolist(),
+                                             phone.tolist())]
+
+
+def report_rows(lo, hi, chunk, total, days, pick_book, pick_customer, paise, seed=GEN_SEED):
+    """Reports rows r_no lo+1..hi of `total`, dated in order over the `days` days ending GEN_END."""
+    rng = _rng(seed, "Reports", chunk)
+    n = hi - lo
+    b_ids = pick_book(rng, n)
+    c_ids = pick_customer(rng, n)
+    qty = 1 + (rng.random(n) < 0.2) + (rng.random(n) < 0.05)
+    offsets = (np.arange(lo, hi, dtype=np.int64) * days) // total
+    first_day = GEN_END - timedelta(days=days - 1)
+    day_names = [(first_day + timedelta(days=int(d))).isoformat() for d in range(days)]
+    prices = (paise[b_ids - 1] * qty / 100).tolist()
+    return list(zip(range(lo + 1, hi + 1), b_ids.tolist(), c_ids.tolist(), [day_names[d] for d in offsets.tolist()],
+                    qty.tolist(), prices))
+
+
+INSERTS = {
+    "Author": ("a_id", "a_name"),
+    "Books": ("b_id", "b_name", "genre", "quantity", "price"),
+    "BookAuthor": ("b_id", "a_id"),
+    "Customer": ("cust_id", "c_name", "address", "phoneno", "login_id"),
+    "Reports": ("r_no", "b_id", "c_id", "date_of_purchase", "quantity", "price"),
+}
+
+
+def secondary_indexes(tables):
+    """[(index, table, CREATE INDEX statement)] the migrations create (and don't drop again) on `tables`."""
+    found = {}
+    for _, _, statements in MIGRATIONS:
+        for statement in statements:
+            if not isinstance(statement, str):
+                continue
+            m = _CREATE_INDEX.match(statement)
+            if m:
+                found[m.group(1)] = (m.group(1), m.group(2), statement)
+            m = _DROP_INDEX.match(statement)
+            if m:
+                found.pop(m.group(1), None)
+    return [index for index in found.values() if index[1] in tables]
+
+
+class _Loader:
+    """Bulk writes on one unpooled connection: executemany, or LOAD DATA LOCAL INFILE on MySQL."""
+
+    def __init__(self, method):
+        mysql = get_backend().name == "mysql"
+        if method == "load" and not mysql:
+            raise ValueError("LOAD DATA needs the MySQL backend; use method executemany")
+        self.method = method
+        self.mysql = mysql
+        self.dropped = []           # CREATE INDEX statements to run again after the load
+        self.conn = connect_local_infile() if method == "load" else connect_raw()
+        self.cur = self.conn.cursor()
+        # rows are consistent by construction; checking every key row by row is most of the load time
+        if mysql:
+            self.cur.execute("SET foreign_key_checks = 0, unique_checks = 0")
+        else:
+            self.cur.execute("PRAGMA foreign_keys = OFF")
+            self.cur.execute("PRAGMA synchronous = OFF")
+
+    def write(self, table, rows):
+        columns = INSERTS[table]
+        if self.method == "executemany":
+            self.cur.executemany(f"INSERT INTO {table} ({', '.join(columns)}) "
+                                 f"VALUES ({', '.join(['%s'] * len(columns))})", rows)
+        else:
+            fd, path = tempfile.mkstemp(suffix=".csv", prefix="bookstore_datagen_")
+            try:
+                with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+                    csv.writer(f, lineterminator="\n").writerows(
+                        [["\\N" if v is None else v for v in row] for row in rows])
+                self.cur.execute(
+                    f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' "
+                    f"OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' ({', '.join(columns)})", (path,))
+            finally:
+                os.remove(path)
+        self.conn.commit()
+
+    def drop_indexes(self, indexes):
+        for name, table, statement in indexes:
+            self.cur.execute(f"DROP INDEX {name} ON {table}" if self.mysql else f"DROP INDEX IF EXISTS {name}")
+            self.dropped.append(statement)
+        self.conn.commit()
+
+    def restore_indexes(self):
+        while self.dropped:
+            self.cur.execute(self.dropped[0])
+            self.dropped.pop(0)
+        self.conn.commit()
+
+    def close(self):
+        try:
+            if self.dropped:        # the load failed: leave the schema as the migrations made it
+                self.conn.rollback()
+                self.restore_indexes()
+        finally:
+            self.cur.close()
+            self.conn.close()
+
+
+def _check_replace(cur, replace):
+    cur.execute("SELECT COUNT(*) FROM Books")
+    count = cur.fetchone()[0]
+    if count > SEED_MAX_BOOKS and not replace:
+        raise ValueError(f"Books already has {count} rows; pass replace=True (--replace) to overwrite them")
+
+
+def generate(authors=DEFAULT_SIZES["authors"], books=DEFAULT_SIZES["books"], customers=DEFAULT_SIZES["customers"],
+             reports=DEFAULT_SIZES["reports"], days=730, seed=GEN_SEED, method="executemany", replace=False,
+             progress=None):
+    """
+    Replace the catalog, customers and sales with generated data (the schema
+    must be migrated). progress(table, rows_done, rows_total) is called per
+    chunk. Returns {table: seconds}, including "rollups" for the rebuild.
+    """
+    if min(authors, books, days) < 1 or min(customers, reports) < 0:
+        raise ValueError("sizes: need at least one author, one book and one day")
+    if method not in ("executemany", "load"):
+        raise ValueError(f"unknown load method: {method}")
+    timings = {}
+    loader = _Loader(method)
+    try:
+        _check_replace(loader.cur, replace)
+        start = time.perf_counter()
+        for table in CLEARED_TABLES:
+            loader.cur.execute(f"DELETE FROM {table}")
+        loader.conn.commit()
+        loader.drop_indexes(secondary_indexes(INSERTS))
+        timings["clear"] = time.perf_counter() - start
+
+        def load(table, total, make):
+            start = time.perf_counter()
+            for chunk, lo, hi in _chunks(total):
+                for name, rows in make(chunk, lo, hi):
+                    loader.write(name, rows)
+                if progress:
+                    progress(table, hi, total)
+            timings[table] = time.perf_counter() - start
+
+        names = author_names(authors, seed)
+        load("Author", authors, lambda chunk, lo, hi: [("Author", list(zip(range(lo + 1, hi + 1), names[lo:hi])))])
+        paise = np.empty(books, dtype=np.int64)
+
+        def books_chunk(chunk, lo, hi):
+            rows, pairs, paise[lo:hi] = book_rows(lo, hi, chunk, authors, seed)
+            return [("Books", rows), ("BookAuthor", pairs)]
+
+        load("Books", books, books_chunk)
+        load("Customer", customers, lambda chunk, lo, hi: [("Customer", customer_rows(lo, hi, chunk, seed))])
+        if reports:
+            popularity = _rng(seed, "popularity")
+            pick_book = _zipf_sampler(books, 1.0, popularity)
+            if customers:
+                pick_customer = _zipf_sampler(customers, 0.6, popularity)
+            else:
+                def pick_customer(rng, size):       # walk-in sales only
+                    return np.full(size, None)
+            load("Reports", reports, lambda chunk, lo, hi: [
+                ("Reports", report_rows(lo, hi, chunk, reports, days, pick_book, pick_customer, paise, seed))])
+
+        start = time.perf_counter()
+        loader.restore_indexes()
+        timings["indexes"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rebuild_rollups(loader.cur)
+        rebuild_velocity(loader.cur)
+        loader.conn.commit()
+        timings["rollups"] = time.perf_counter() - start
+    finally:
+        loader.close()
+        # this process's catalog cache, search index, author map and stock view describe the old rows
+        books_imported()
+        authors_imported()
+        stock_view.clear()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the bookstore database with deterministic synthetic data")
+    for name, default in DEFAULT_SIZES.items():
+        parser.add_argument(f"--{name}", type=int, default=default)
+    parser.add_argument("--days", type=int, default=730, help=f"days of Reports history, ending {GEN_END}")
+    parser.add_argument("--seed", type=int, default=GEN_SEED)
+    parser.add_argument("--method", choices=["executemany", "load"], default="executemany")
+    parser.add_argument("--replace", action="store_true", help="overwrite a database that has more than the seed")
+    args = parser.parse_args()
+
+    import bookstore_bootstrap as boot
+    boot.initialize()
+
+    def progress(table, done, total):
+        print(f"\r{table:<10} {done:>12,} / {total:,}", end="" if done < total else "\n", flush=True)
+
+    try:
+        timings = generate(args.authors, args.books, args.customers, args.reports, args.days, args.seed,
+                           args.method, args.replace, progress)
+    except ValueError as e:
+        parser.error(str(e))
+    for table, seconds in timings.items():
+        print(f"{table:<10} {seconds:8.1f} s")
+
+
+if __name__ == "__main__":
+    main()
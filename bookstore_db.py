@@ -0,0 +1,517 @@
+"""
+bookstore_db.py
+- Shared database layer for bookstore_bootstrap.py (CLI) and streamlit_app.py.
+- Two storage backends behind the same interface, picked with
+  BOOKSTORE_BACKEND:
+    mysql   (default) MySQL via mysql-connector, credentials from DB_CONFIG
+    sqlite  embedded file (BOOKSTORE_SQLITE_PATH) in WAL mode, no server;
+            ":memory:" gives an in-memory database shared by every
+            connection of that backend in this process (not persisted)
+  The app's SQL is written for MySQL; the SQLite backend translates it
+  (placeholders, upserts, DDL) so the same schema and seed run on both.
+- Keeps a process-wide pool of open connections so each view / CLI action
+  checks one out instead of paying the TCP + auth handshake every time.
+Usage:
+    from bookstore_db import get_pool
+    conn = get_pool().get()
+    cur = conn.cursor()
+    ...
+    conn.close()      # returns the connection to the pool
+"""
+
+import math
+import mysql.connector
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+from bookstore_metrics import InstrumentedCursor, profiler, start_file_exporter
+
+# ---------- CONFIG ----------
+BACKEND = os.environ.get("BOOKSTORE_BACKEND", "mysql")
+
+DB_CONFIG = {
+    "host": os.environ.get("BOOKSTORE_DB_HOST", "localhost"),
+    "user": os.environ.get("BOOKSTORE_DB_USER", "root"),
+    "password": os.environ.get("BOOKSTORE_DB_PASSWORD", "root"),
+    "database": os.environ.get("BOOKSTORE_DB_NAME", "bookstore")
+}
+
+SQLITE_PATH = os.environ.get("BOOKSTORE_SQLITE_PATH", "bookstore.db")
+SQLITE_PRAGMAS = [
+    "journal_mode = WAL",       # readers never block the writer
+    "synchronous = NORMAL",     # fsync at checkpoints only; safe with WAL
+    "foreign_keys = ON",
+    "busy_timeout = 10000",     # wait for the write lock instead of failing
+    "cache_size = -65536",      # 64 MB page cache
+    "temp_store = MEMORY",
+    "mmap_size = 268435456",
+]
+
+POOL_SIZE = int(os.environ.get("BOOKSTORE_POOL_SIZE", "5"))
+POOL_TIMEOUT = float(os.environ.get("BOOKSTORE_POOL_TIMEOUT", "10"))
+# connections older than this (seconds) are closed and reopened on checkout
+POOL_RECYCLE = float(os.environ.get("BOOKSTORE_POOL_RECYCLE", "1800"))
+# ----------------------------
+
+# catch these around statements that may fail on either backend
+DB_ERRORS = (mysql.connector.Error, sqlite3.Error)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a DB-API connection; close() hands it back to the pool.
+    Its cursors are profiled (bookstore_metrics) unless profiling is off.
+    A proxy dropped without close() gives its slot back when it is collected.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._cursors = set()       # instrumented cursors not closed yet; their last statement is recorded on close()
+
+    def cursor(self, *args, **kwargs):
+        if self._raw is None:
+            raise AttributeError("connection already returned to pool (cursor)")
+        cur = self._raw.cursor(*args, **kwargs)
+        if not profiler.enabled:
+            return cur
+        return InstrumentedCursor(cur, open_cursors=self._cursors)
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise AttributeError(f"connection already returned to pool ({name})")
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._raw is not None:
+            for cur in self._cursors:
+                cur._finish()
+            self._cursors.clear()
+            raw, self._raw = self._raw, None
+            self._pool._release(raw, self._created_at)
+
+    def __del__(self):
+        # leaked (an exception skipped close()): the connection may be mid-transaction
+        # and this may run on any thread, so close it rather than reuse it
+        raw, self._raw = getattr(self, "_raw", None), None
+        if raw is not None:
+            self._pool._reclaim(raw)
+
+
+def _mysql_ping(raw):
+    raw.ping(reconnect=False, attempts=1, delay=0)
+
+
+def _generic_ping(raw):
+    cur = raw.cursor()
+    cur.execute("SELECT 1")
+    cur.fetchall()
+    cur.close()
+
+
+# ---------- SQLite backend ----------
+_MYSQL_ONLY = re.compile(r"\s*ALTER\s+TABLE\s+\w+\s+MODIFY\b", re.I)
+
+
+@lru_cache(maxsize=512)
+def to_sqlite(sql):
+    """
+    Rewrite the app's MySQL dialect for SQLite. Returns None for statements
+    that have no SQLite equivalent and nothing to do there (column MODIFYs:
+    SQLite tables are always created from the latest DDL).
+    """
+    if _MYSQL_ONLY.match(sql):
+        return None
+    # sqlite locks the whole database on write; FOR UPDATE becomes BEGIN IMMEDIATE (see SQLiteCursor)
+    sql = sql.replace("%s", "?").replace(" FOR UPDATE", "")
+    sql = re.sub(r"\)\s*ENGINE\s*=\s*\w+", ")", sql)
+    sql = re.sub(r"\bINT\s+(?:NOT NULL\s+)?AUTO_INCREMENT\s+PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT", sql)
+    if "ON DUPLICATE KEY UPDATE" in sql:
+        sql = sql.replace("ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET")
+        sql = sql.replace("GREATEST(", "MAX(").replace("LEAST(", "MIN(")
+        sql = re.sub(r"VALUES\((\w+)\)", r"excluded.\1", sql)
+    if sql.startswith("DROP INDEX"):
+        sql = re.sub(r"^(DROP INDEX \w+) ON \w+", r"\1", sql)
+    if "DATE_FORMAT(" in sql:
+        sql = re.sub(r"DATE_FORMAT\(([\w.]+), ('[^']*')\)", r"strftime(\2, \1)", sql)
+    if "DATEDIFF(" in sql:
+        sql = re.sub(r"DATEDIFF\(([\w.?]+), ([\w.?]+)\)", r"CAST(julianday(\1) - julianday(\2) AS INTEGER)", sql)
+    return sql
+
+
+# DATE / DECIMAL / TIMESTAMP / DATETIME columns come back as the same Python types mysql-connector returns
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter("DATE", lambda b: date.fromisoformat(b.decode()[:10]))
+sqlite3.register_converter("TIMESTAMP", lambda b: datetime.fromisoformat(b.decode()))
+sqlite3.register_converter("DATETIME", lambda b: datetime.fromisoformat(b.decode()))
+sqlite3.register_converter("DECIMAL", lambda b: Decimal(b.decode()).quantize(Decimal("0.01")))
+
+
+def as_date(value):
+    """A DATE value as a date: sqlite can still hand one back as a 'YYYY-MM-DD' string."""
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+class SQLiteCursor:
+    """sqlite3 cursor that accepts the app's MySQL-style SQL (and cursor(dictionary=True))."""
+
+    def __init__(self, cnx, dictionary=False):
+        self._cnx = cnx
+        self._cur = cnx.cursor()
+        self._dictionary = dictionary
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def execute(self, sql, params=()):
+        if " FOR UPDATE" in sql and not self._cnx.in_transaction:
+            # take the write lock up front so the rows read can't change before we write
+            self._cur.execute("BEGIN IMMEDIATE")
+        translated = to_sqlite(sql)
+        if translated is not None:
+            self._cur.execute(translated, params)
+        return self
+
+    def executemany(self, sql, seq):
+        translated = to_sqlite(sql)
+        if translated is not None:
+            self._cur.executemany(translated, seq)
+        return self
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip((d[0] for d in self._cur.description), row))
+
+    def fetchone(self):
+        return self._row(self._cur.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(r) for r in self._cur.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class SQLiteConnection:
+    def __init__(self, cnx):
+        self._cnx = cnx
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._cnx, dictionary)
+
+
+class MySQLBackend:
+    name = "mysql"
+
+    def __init__(self, config=None):
+        self.config = dict(config or DB_CONFIG)
+
+    def connect(self):
+        return mysql.connector.connect(**self.config)
+
+    def ping(self, raw):
+        _mysql_ping(raw)
+
+    def ensure_database(self):
+        """CREATE DATABASE IF NOT EXISTS, on a connection without a default database."""
+        server = {k: v for k, v in self.config.items() if k != "database"}
+        cnx = mysql.connector.connect(**server)
+        try:
+            cur = cnx.cursor()
+            cur.execute("CREATE DATABASE IF NOT EXISTS `{}` DEFAULT CHARACTER SET 'utf8mb4'"
+                        .format(self.config["database"]))
+            cur.close()
+        finally:
+            cnx.close()
+
+    def describe(self):
+        return f"mysql://{self.config['user']}@{self.config['host']}/{self.config['database']}"
+
+
+class SQLiteBackend:
+    name = "sqlite"
+    _memory_ids = 0
+
+    def __init__(self, path=None, pragmas=SQLITE_PRAGMAS, timeout=30):
+        self.path = path or SQLITE_PATH
+        self.pragmas = pragmas
+        self.timeout = timeout
+        self._keepalive = None
+        if self.path == ":memory:":
+            # a named shared-cache memory database, so every pooled connection
+            # sees the same data; it lives as long as this backend does
+            SQLiteBackend._memory_ids += 1
+            self._uri = f"file:bookstore_mem_{os.getpid()}_{SQLiteBackend._memory_ids}?mode=memory&cache=shared"
+            self._keepalive = self._open()
+        else:
+            self._uri = None
+
+    def _open(self):
+        if self._uri:
+            cnx = sqlite3.connect(self._uri, uri=True, timeout=self.timeout, check_same_thread=False,
+                                  detect_types=sqlite3.PARSE_DECLTYPES)
+        else:
+            cnx = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                                  detect_types=sqlite3.PARSE_DECLTYPES)
+        for pragma in self.pragmas:
+            cnx.execute("PRAGMA " + pragma)
+        # MySQL's POW(); SQLite only has it when built with the math functions
+        cnx.create_function("POW", 2, math.pow, deterministic=True)
+        return cnx
+
+    def connect(self):
+        return SQLiteConnection(self._open())
+
+    def ping(self, raw):
+        _generic_ping(raw)
+
+    def ensure_database(self):
+        """The file is created on first connect; only its directory has to exist."""
+        folder = os.path.dirname(os.path.abspath(self.path))
+        if self._uri is None and not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+
+    def describe(self):
+        return f"sqlite:///{self.path}"
+
+
+BACKENDS = {"mysql": MySQLBackend, "sqlite": SQLiteBackend}
+
+
+class ConnectionPool:
+    """
+    Fixed-size connection pool.
+    - get() reuses an idle connection, opens a new one while under `size`,
+      otherwise waits up to `timeout` seconds for one to be returned.
+    - Idle connections are health-checked on checkout and recycled once
+      older than `recycle` seconds.
+    - A checked-out connection that is garbage-collected without close() is
+      closed and its slot freed, so a leak can't starve the pool.
+    """
+
+    def __init__(self, connect, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 recycle=POOL_RECYCLE, ping=_generic_ping):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self._ping = ping
+        self._idle = deque()        # (raw, created_at)
+        self._open = 0              # idle + checked out
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "misses": 0,            # checkout had to open a new connection
+            "waits": 0,             # checkout had to block for a free slot
+            "wait_time": 0.0,
+            "max_wait": 0.0,
+            "recycled": 0,
+            "failed_pings": 0,
+            "reclaimed": 0,         # dropped without close(); slot freed by the finalizer
+        }
+
+    def get(self):
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        waited = False
+        with self._cond:
+            while not self._idle and self._open >= self.size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise PoolTimeout(f"no connection available after {self.timeout}s")
+                waited = True
+                self._cond.wait(remaining)
+            item = self._idle.pop() if self._idle else None
+            if item is None:
+                self._open += 1
+            waited_for = time.perf_counter() - start
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+            self._stats["wait_time"] += waited_for
+            self._stats["max_wait"] = max(self._stats["max_wait"], waited_for)
+
+        if item is not None:
+            raw, created_at = item
+            if time.time() - created_at > self.recycle:
+                self._count("recycled")
+                self._discard(raw)
+            else:
+                try:
+                    self._ping(raw)
+                    return PooledConnection(self, raw, created_at)
+                except Exception:
+                    self._count("failed_pings")
+                    self._discard(raw)
+
+        # slot is reserved in self._open; open a fresh connection for it
+        self._count("misses")
+        try:
+            raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw, time.time())
+
+    def _count(self, key):
+        with self._cond:
+            self._stats[key] += 1
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _release(self, raw, created_at):
+        # end any open transaction so the next user doesn't inherit a stale snapshot
+        try:
+            raw.rollback()
+        except Exception:
+            self._discard(raw)
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((raw, created_at))
+            self._cond.notify()
+
+    def _reclaim(self, raw):
+        self._discard(raw)
+        with self._cond:
+            self._stats["reclaimed"] += 1
+            self._open -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s["open"] = self._open
+            s["idle"] = len(self._idle)
+            s["size"] = self.size
+        s["avg_wait"] = s["wait_time"] / s["checkouts"] if s["checkouts"] else 0.0
+        return s
+
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                raw, _ = self._idle.pop()
+                self._discard(raw)
+                self._open -= 1
+            self._cond.notify_all()
+
+
+_backend = None
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide backend (BOOKSTORE_BACKEND), creating it on first use."""
+    global _backend
+    if _backend is None:
+        with _pool_lock:
+            if _backend is None:
+                if BACKEND not in BACKENDS:
+                    raise ValueError(f"unknown BOOKSTORE_BACKEND: {BACKEND} (expected one of {', '.join(BACKENDS)})")
+                _backend = BACKENDS[BACKEND]()
+    return _backend
+
+
+def set_backend(backend):
+    """Switch the process to another backend (tests, benchmarks); drops the current pool."""
+    global _backend, _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _backend, _pool = backend, None
+
+
+def connect_raw():
+    """Open a direct (unpooled) connection to the bookstore database."""
+    return get_backend().connect()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        backend = get_backend()
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(backend.connect, ping=backend.ping)
+                start_file_exporter(pool_getter=get_pool)     # no-op unless BOOKSTORE_METRICS_FILE is set
+    return _pool
+
+
+def get_connection():
+    """Check a connection out of the shared pool. Call .close() to return it."""
+    return get_pool().get()
+
+
+def fetch_page(table, key, after=None, page_size=50, where=None, params=(), connect=get_connection):
+    """
+    Keyset (seek) pagination: rows of `table` with key > after, ordered by key.
+    Only page_size rows are ever fetched, however large the table is.
+    `table`, `key` and `where` are trusted SQL fragments; values go in params.
+    Returns (columns, rows, next_after); next_after is None on the last page.
+    """
+    clauses, args = [], list(params)
+    if where:
+        clauses.append(f"({where})")
+    if after is not None:
+        clauses.append(f"{key} > %s")
+        args.append(after)
+    sql = f"SELECT * FROM {table}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY {key} LIMIT %s"
+    # one extra row tells us whether there is a next page
+    args.append(page_size + 1)
+
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, args)
+        columns = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_after = rows[-1][columns.index(key)]
+    else:
+        next_after = None
+    return columns, rows, next_after
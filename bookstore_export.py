@@ -0,0 +1,124 @@
+"""
+bookstore_export.py
+- Streams Reports (or any query) to CSV or Parquet without loading it into memory.
+- Rows come off an unbuffered cursor with fetchmany(batch) - mysql-connector's
+  default cursor reads them from the server socket as they are fetched - and
+  each batch is written out before the next is read, so peak memory depends
+  on the batch size, not on the row count.
+- CSV may be compressed with gzip / bz2 / xz; Parquet supports any codec
+  pyarrow knows (snappy, gzip, zstd, ...). pyarrow is only needed for Parquet.
+Usage:
+    python bookstore_bootstrap.py export reports.csv.gz
+    python bookstore_bootstrap.py export reports.parquet --format parquet --compression zstd
+"""
+
+import bz2
+import csv
+import gzip
+import io
+import lzma
+import tempfile
+from decimal import Decimal
+
+from bookstore_db import get_connection
+
+EXPORT_BATCH = 10000
+REPORTS_QUERY = "SELECT r_no, b_id, c_id, date_of_purchase, quantity, price FROM Reports ORDER BY r_no"
+
+COMPRESSORS = {
+    # each accepts a path or an already-open binary file (which it leaves open)
+    "gzip": lambda target: gzip.GzipFile(target, "wb") if isinstance(target, str)
+                           else gzip.GzipFile(fileobj=target, mode="wb"),
+    "bz2": lambda target: bz2.BZ2File(target, "wb"),
+    "xz": lambda target: lzma.LZMAFile(target, "wb"),
+}
+
+
+def iter_batches(sql=REPORTS_QUERY, params=(), batch=EXPORT_BATCH, connect=get_connection):
+    """Yield (columns, rows) batches of at most `batch` rows from one streaming cursor."""
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        columns = [d[0] for d in cur.description]
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            yield columns, rows
+    finally:
+        cur.close()
+        conn.close()
+
+
+def write_csv(batches, out, compression=None):
+    """Write batches to `out`: a path or an open binary file (left open). Returns the row count."""
+    if compression is not None and compression not in COMPRESSORS:
+        raise ValueError(f"unsupported CSV compression: {compression}")
+    owns = isinstance(out, str)
+    raw = COMPRESSORS[compression](out) if compression else (open(out, "wb") if owns else out)
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    try:
+        writer = csv.writer(text)
+        count, header_done = 0, False
+        for columns, rows in batches:
+            if not header_done:
+                writer.writerow(columns)
+                header_done = True
+            writer.writerows(rows)
+            count += len(rows)
+        return count
+    finally:
+        text.flush()
+        text.detach()
+        if raw is not out:
+            raw.close()
+
+
+def _arrow_column(values):
+    # DECIMAL comes back as Decimal; keep it exact as a decimal128 column
+    import pyarrow as pa
+    if any(isinstance(v, Decimal) for v in values):
+        return pa.array(values, type=pa.decimal128(12, 2))
+    return pa.array(values)
+
+
+def write_parquet(batches, out, compression="snappy"):
+    """Write batches to a Parquet file, one row group per batch."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+    writer, count = None, 0
+    try:
+        for columns, rows in batches:
+            table = pa.table({name: _arrow_column(list(col)) for name, col in zip(columns, zip(*rows))})
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema, compression=compression or "none")
+            elif table.schema != writer.schema:
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            count += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def export_reports(out, fmt="csv", compression=None, batch=EXPORT_BATCH, connect=get_connection):
+    """Stream the whole Reports table to `out`. Returns the number of rows written."""
+    batches = iter_batches(batch=batch, connect=connect)
+    if fmt == "csv":
+        return write_csv(batches, out, compression)
+    if fmt == "parquet":
+        return write_parquet(batches, out, compression or "snappy")
+    raise ValueError(f"unsupported export format: {fmt}")
+
+
+def export_reports_file(fmt="csv", compression=None, batch=EXPORT_BATCH, connect=get_connection):
+    """Export to an anonymous temp file and return it rewound (for download buttons)."""
+    f = tempfile.TemporaryFile()
+    export_reports(f, fmt, compression, batch, connect)
+    f.seek(0)
+    return f
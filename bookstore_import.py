@@ -0,0 +1,385 @@
+"""
+bookstore_import.py
+- Bulk import of Books / Customer / Staff / Author rows from CSV, for
+  onboarding supplier catalogs that are far too big for the one-row forms.
+- The file is read as a stream (csv.reader) and handled `batch` rows at a
+  time: each batch is validated column-by-column with pandas, then upserted
+  with one executemany (or, on MySQL, LOAD DATA LOCAL INFILE into a staging
+  table) and committed every `commit_every` rows.
+- Existing rows with the same primary key are updated, so re-running an
+  import is safe. Rows that fail validation or are refused by the database
+  are collected with their line number and reason instead of aborting the
+  import; write_rejects() saves them as CSV.
+- A books file names each title's authors in its a_name column (several
+  separated by ";"). They are linked through BookAuthor, replacing the
+  title's old authors; names not in Author yet get a new Author row.
+- Its quantity column is a stock count. The upsert never overwrites stock:
+  new titles open with the count, existing ones get an adjustment for the
+  difference (bookstore_inventory; receive / adjust events with the event
+  log on).
+- Its price column is the list price. New titles pick up the promotions
+  running for their genre, and a changed price re-resolves the title's sale
+  price and goes into price_history (bookstore_pricing).
+Usage:
+    python bookstore_bootstrap.py import books catalog.csv [--batch 5000] [--method load]
+"""
+
+import csv
+import os
+import tempfile
+import time
+
+import mysql.connector
+import numpy as np
+import pandas as pd
+
+from bookstore_authors import link_authors, split_authors
+from bookstore_catalog import authors_imported, books_imported
+from bookstore_db import get_backend, get_connection
+from bookstore_inventory import count_stock, open_stock
+from bookstore_pricing import reprice
+from bookstore_purchase import is_retryable
+
+IMPORT_BATCH = 5000
+COMMIT_EVERY = 50000
+
+# table -> columns as (name, kind, max length); the first column is the primary key.
+# kinds: id (integer >= 1), count (integer >= 0), money (>= 0, 2 decimals),
+#        text (required), optional (empty -> NULL),
+#        authors (one or more ";"-separated names, each up to the limit; stored in BookAuthor, not the table),
+#        stock (a count >= 0 that new rows are inserted with; for existing rows it goes through the event log)
+IMPORT_SPECS = {
+    "books": ("Books", [("b_id", "id", None), ("b_name", "text", 100), ("a_name", "authors", 100),
+                        ("genre", "text", 50), ("quantity", "stock", None), ("price", "money", None)]),
+    "customers": ("Customer", [("cust_id", "id", None), ("c_name", "text", 100), ("address", "text", 200),
+                               ("phoneno", "text", 15), ("login_id", "optional", 50)]),
+    "staff": ("Staff", [("s_id", "id", None), ("s_name", "text", 100), ("s_phone", "text", 15),
+                        ("designation", "text", 50)]),
+    "authors": ("Author", [("a_id", "id", None), ("a_name", "text", 100)]),
+}
+
+# optional columns that must name an existing row elsewhere (checked per batch)
+REFERENCES = {("Customer", "login_id"): ("Authentication", "login_id")}
+
+MAX_PRICE = 10 ** 8     # DECIMAL(10,2)
+
+
+def read_batches(source, columns, batch=IMPORT_BATCH):
+    """
+    Stream a CSV (path or text file) as (line_numbers, DataFrame of str,
+    malformed) batches. The header must contain every required column (any
+    order, case-insensitive; unknown columns are ignored). Lines with the
+    wrong number of fields go to `malformed` as (line, reason, fields).
+    """
+    f = open(source, newline="", encoding="utf-8-sig") if isinstance(source, str) else source
+    try:
+        reader = csv.reader(f)
+        header = [h.strip().lower() for h in next(reader, [])]
+        missing = [name for name, kind, _ in columns if name not in header and kind != "optional"]
+        if missing:
+            raise ValueError(f"CSV is missing column(s): {', '.join(missing)}")
+        picks = [(name, header.index(name) if name in header else None) for name, _, _ in columns]
+        width = len(header)
+        lines, rows, malformed = [], [], []
+        for record in reader:
+            if not record:
+                continue
+            if len(record) != width:
+                malformed.append((reader.line_num, f"expected {width} fields, got {len(record)}", record))
+                continue
+            lines.append(reader.line_num)
+            rows.append([record[i] if i is not None else "" for _, i in picks])
+            if len(rows) >= batch:
+                yield np.array(lines), pd.DataFrame(rows, columns=[n for n, _ in picks]), malformed
+                lines, rows, malformed = [], [], []
+        if rows or malformed:
+            yield np.array(lines), pd.DataFrame(rows, columns=[n for n, _ in picks]), malformed
+    finally:
+        if f is not source:
+            f.close()
+
+
+def validate(frame, columns):
+    """
+    Check one batch column by column. Returns (values, reason): the parsed
+    columns and, per row, the first problem found ("" when the row is fine).
+    """
+    reason = pd.Series("", index=frame.index, dtype=object)
+    values = {}
+    for name, kind, limit in columns:
+        text = frame[name].str.strip()
+        if kind in ("id", "count", "stock"):
+            num = pd.to_numeric(text, errors="coerce")
+            bad = num.isna() | (num % 1 != 0) | (num < (1 if kind == "id" else 0)) | (num >= 2 ** 31)
+            problem = f"{name}: not a whole number" + (" >= 1" if kind == "id" else " >= 0")
+            values[name] = num
+        elif kind == "money":
+            num = pd.to_numeric(text, errors="coerce")
+            bad = num.isna() | (num < 0) | (num >= MAX_PRICE)
+            problem = f"{name}: not a valid price"
+            values[name] = num.round(2)
+        elif kind == "authors":
+            names = text.map(split_authors)
+            bad = names.map(lambda n: not n or max(map(len, n)) > limit)
+            problem = f"{name}: no author, or a name longer than {limit} characters"
+            values[name] = names
+        else:
+            bad = text.str.len() > limit
+            problem = f"{name}: longer than {limit} characters"
+            if kind == "text":
+                bad |= text == ""
+                problem = f"{name}: empty or longer than {limit} characters"
+            values[name] = text
+        reason = reason.mask((reason == "") & bad, problem)
+    return pd.DataFrame(values, index=frame.index), reason
+
+
+def _check_references(cur, table, values, reason):
+    # one IN (...) lookup per batch instead of a foreign key error per row
+    for (t, column), (ref_table, ref_column) in REFERENCES.items():
+        if t != table or values.empty:
+            continue
+        given = values[column] != ""
+        wanted = values.loc[given & (reason == ""), column].unique().tolist()
+        found = set()
+        for i in range(0, len(wanted), 1000):
+            part = wanted[i:i + 1000]
+            cur.execute(f"SELECT {ref_column} FROM {ref_table} WHERE {ref_column} IN ({','.join(['%s'] * len(part))})",
+                        part)
+            found.update(r[0] for r in cur.fetchall())
+        missing = given & ~values[column].isin(found)
+        reason = reason.mask((reason == "") & missing, f"{column}: no such {ref_table} entry")
+    return reason
+
+
+def _tuples(values, columns):
+    parts = []
+    for name, kind, _ in columns:
+        if kind in ("id", "count", "stock"):
+            parts.append(values[name].astype(np.int64).tolist())
+        elif kind == "optional":
+            parts.append([v or None for v in values[name].tolist()])
+        else:
+            parts.append(values[name].tolist())
+    return list(zip(*parts))
+
+
+def validate_row(kind, fields):
+    """
+    Check one record (column -> value, e.g. from a form or JSON body) with
+    the same rules as the CSV import. Returns the row tuple in IMPORT_SPECS
+    column order; raises ValueError with the first problem found.
+    """
+    table, columns = IMPORT_SPECS[kind]
+    names = [name for name, _, _ in columns]
+    frame = pd.DataFrame([["" if fields.get(n) is None else str(fields[n]) for n in names]], columns=names)
+    values, reason = validate(frame, columns)
+    if reason.iloc[0]:
+        raise ValueError(reason.iloc[0])
+    return _tuples(values, columns)[0]
+
+
+def stored_columns(columns):
+    """The columns that are written to the table itself (authors go to BookAuthor)."""
+    return [c for c in columns if c[1] != "authors"]
+
+
+def split_row(row, columns):
+    """A validated row -> (the table's values, [author names] or None)."""
+    stored, authors = [], None
+    for value, (_, kind, _) in zip(row, columns):
+        if kind == "authors":
+            authors = value
+        else:
+            stored.append(value)
+    return tuple(stored), authors
+
+
+def _updates(columns):
+    # everything but the key; stock is only written for new rows (see _log_stock)
+    return ", ".join(f"{n} = VALUES({n})" for n, kind, _ in columns[1:] if kind != "stock")
+
+
+def upsert_sql(table, columns):
+    names = [name for name, _, _ in columns]
+    updates = _updates(columns)
+    return (f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join(['%s'] * len(names))}) "
+            f"ON DUPLICATE KEY UPDATE {updates}")
+
+
+def _write_batch(cur, sql, rows, lines):
+    """executemany one batch; if the database refuses it, find the offending rows one at a time."""
+    try:
+        cur.executemany(sql, rows)
+        return []
+    except Exception as e:
+        if is_retryable(e):
+            raise       # a deadlock rolls back the whole transaction, not just this statement
+    # Only the failed statement is undone. Rows that did get in are simply
+    # upserted again below, which is harmless.
+    rejected = []
+    for line, row in zip(lines, rows):
+        try:
+            cur.execute(sql, row)
+        except Exception as e:
+            if is_retryable(e):
+                raise
+            rejected.append((int(line), f"database: {e}", list(row)))
+    return rejected
+
+
+def connect_local_infile():
+    """Unpooled MySQL connection with LOAD DATA LOCAL INFILE enabled (the server needs local_infile=ON too)."""
+    backend = get_backend()
+    if backend.name != "mysql":
+        raise ValueError("LOAD DATA import needs the MySQL backend; use method executemany")
+    return mysql.connector.connect(**backend.config, allow_local_infile=True)
+
+
+def _load_batch(cur, table, columns, sql, rows, lines):
+    """
+    LOAD DATA LOCAL INFILE one batch into a temporary staging table, then
+    upsert it with a single INSERT ... SELECT. REPLACE INTO the real table
+    would delete and re-insert rows, which nulls out Reports.b_id.
+    """
+    stage = f"import_stage_{table.lower()}"
+    cur.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {stage} LIKE {table}")
+    cur.execute(f"DELETE FROM {stage}")
+    fd, path = tempfile.mkstemp(suffix=".csv", prefix="bookstore_import_")
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f, lineterminator="\n").writerows(
+                [["" if v is None else v for v in row] for row in rows])
+        names = [name for name, _, _ in columns]
+        targets = [f"@{n}" if kind == "optional" else n for n, kind, _ in columns]
+        nulls = [f"{n} = NULLIF(@{n}, '')" for n, kind, _ in columns if kind == "optional"]
+        cur.execute(
+            f"LOAD DATA LOCAL INFILE %s REPLACE INTO TABLE {stage} CHARACTER SET utf8mb4 "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' LINES TERMINATED BY '\\n' "
+            f"({', '.join(targets)})" + (f" SET {', '.join(nulls)}" if nulls else ""), (path,))
+        updates = _updates(columns)
+        try:
+            cur.execute(f"INSERT INTO {table} ({', '.join(names)}) SELECT {', '.join(names)} FROM {stage} "
+                        f"ON DUPLICATE KEY UPDATE {updates}")
+            return []
+        except Exception as e:
+            if is_retryable(e):
+                raise
+        return _write_batch(cur, sql, rows, lines)
+    finally:
+        os.remove(path)
+
+
+def _existing(cur, table, key, ids, columns=()):
+    """The rows of `ids` that are already in the table, as {id: (columns...)}."""
+    found = {}
+    for i in range(0, len(ids), 1000):
+        part = ids[i:i + 1000]
+        cur.execute(f"SELECT {', '.join((key, *columns))} FROM {table} "
+                    f"WHERE {key} IN ({','.join(['%s'] * len(part))})", part)
+        found.update((r[0], r[1:]) for r in cur.fetchall())
+    return found
+
+
+def _log_stock(cur, stored, rows, existing, refused):
+    """New titles open with their quantity; existing ones are counted to it (one adjust event when it differs)."""
+    at = next(i for i, (_, kind, _) in enumerate(stored) if kind == "stock")
+    accepted = [r for r in rows if r[0] not in refused]
+    open_stock(cur, [r[0] for r in accepted if r[0] not in existing], "import")
+    count_stock(cur, [(r[0], r[at]) for r in accepted if r[0] in existing], "import")
+
+
+def _log_prices(cur, stored, rows, existing, refused):
+    """New titles and changed list prices are resolved against the running promotions."""
+    at = next(i for i, (name, _, _) in enumerate(stored) if name == "price")
+    accepted = [r for r in rows if r[0] not in refused]
+    changed = {}        # b_id -> the price it sold at before this row
+    for r in accepted:
+        if r[0] in existing:
+            price, sale_price = existing[r[0]]
+            if round(float(price), 2) != round(r[at], 2):
+                changed[r[0]] = price if sale_price is None else sale_price
+    reprice(cur, [r[0] for r in accepted if r[0] not in existing or r[0] in changed], was=changed)
+
+
+def import_csv(kind, source, batch=IMPORT_BATCH, commit_every=COMMIT_EVERY, method="executemany",
+               connect=None, progress=None):
+    """
+    Import a CSV (path or text file) into the table for `kind` (a key of
+    IMPORT_SPECS). method is "executemany" or "load" (MySQL LOAD DATA LOCAL
+    INFILE). progress(imported, rejected) is called after every batch.
+    Returns {"rows", "imported", "rejected": [(line, reason, fields)], "seconds"}.
+    """
+    if kind not in IMPORT_SPECS:
+        raise ValueError(f"unknown import kind: {kind} (expected one of {', '.join(IMPORT_SPECS)})")
+    if method not in ("executemany", "load"):
+        raise ValueError(f"unknown import method: {method}")
+    table, columns = IMPORT_SPECS[kind]
+    if connect is None:
+        connect = connect_local_infile if method == "load" else get_connection
+    stored = stored_columns(columns)
+    has_stock = any(kind == "stock" for _, kind, _ in stored)
+    sql = upsert_sql(table, stored)
+    rejected, imported, pending = [], 0, 0
+    start = time.perf_counter()
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        for lines, frame, malformed in read_batches(source, columns, batch):
+            rejected.extend(malformed)
+            values, reason = validate(frame, columns)
+            reason = _check_references(cur, table, values, reason)
+            ok = (reason == "").to_numpy()
+            rejected.extend(zip(lines[~ok].tolist(), reason[~ok].tolist(), frame[~ok].values.tolist()))
+            rows = [split_row(r, columns) for r in _tuples(values[ok], columns)]
+            if rows:
+                table_rows = [r for r, _ in rows]
+                if has_stock:
+                    # list and effective prices before the upsert, for price_history
+                    existing = _existing(cur, table, stored[0][0], [r[0] for r in table_rows],
+                                         ("price", "sale_price"))
+                if method == "load":
+                    failed = _load_batch(cur, table, stored, sql, table_rows, lines[ok])
+                else:
+                    failed = _write_batch(cur, sql, table_rows, lines[ok])
+                refused = {f[2][0] for f in failed}
+                if len(stored) < len(columns):
+                    link_authors(cur, [(r[0], names) for r, names in rows if r[0] not in refused])
+                if has_stock:
+                    _log_stock(cur, stored, table_rows, existing, refused)
+                    _log_prices(cur, stored, table_rows, existing, refused)
+                rejected.extend(failed)
+                imported += len(rows) - len(failed)
+                pending += len(rows)
+            if pending >= commit_every:
+                conn.commit()
+                pending = 0
+            if progress:
+                progress(imported, len(rejected))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+        if table == "Books":
+            books_imported()
+        elif table == "Author":
+            authors_imported()
+    rejected.sort(key=lambda r: r[0])
+    return {"rows": imported + len(rejected), "imported": imported, "rejected": rejected,
+            "seconds": time.perf_counter() - start}
+
+
+def write_rejects(rejected, out):
+    """Write the rejected-row report (line, reason, original fields) as CSV to a path or text file."""
+    f = open(out, "w", newline="", encoding="utf-8") if isinstance(out, str) else out
+    try:
+        writer = csv.writer(f)
+        writer.writerow(["line", "reason", "fields"])
+        for line, reason, fields in rejected:
+            writer.writerow([line, reason, *fields])
+    finally:
+        if f is not out:
+            f.close()
@@ -0,0 +1,841 @@
+"""
+bookstore_inventory.py
+- Every stock change is an event in inventory_events: receive (new title,
+  restock order), sell, adjust (stock count, correction, CSV import) and
+  return. Events are numbered per title ((b_id, seq) is the primary key),
+  carry the stock after them, and are never updated or deleted.
+- By default a change is written through, in the caller's transaction: one
+  conditional UPDATE of Books.quantity (stock stays >= 0) that also moves
+  Books.stock_seq on, then the event INSERT ... SELECTed from that row. Two
+  buyers can't both take the last copy, and Books.quantity is always the
+  current stock for the catalog, the in-stock filter and the reorder outlook.
+- BOOKSTORE_STOCK_LOG_FIRST=1: sales only append their event, with one
+  conditional INSERT ... SELECT from the previous one, checked against
+  stock_view (each process's stock and seq per title). The compactor folds
+  them into Books.quantity every STOCK_COMPACT_INTERVAL seconds, so it lags
+  by that long. It was slower than writing through on the SQLite stand-in
+  and is unmeasured on MySQL (bookstore_bench.py inventory). Compact before
+  switching back: a write-through change that finds unfolded events fails.
+- shard_stock() opts one title into K stock_slots counters (Books.slots = K):
+  a sale decrements one random slot, a dry slot makes the buyer rebalance
+  all K. Slot sales reach the log and Books.quantity only when the compactor
+  folds them, so until then the catalog shows the stock as of the last fold
+  (stock_view.level() and the reorder outlook read the slots). Not faster
+  than the single-row UPDATE on the SQLite stand-in (bench shards).
+- verify() replays the log and checks every event, snapshot and slot total
+  against it; rebuild() writes the replayed stock back into the snapshot.
+Usage:
+    python bookstore_inventory.py compact | verify | rebuild
+    python bookstore_inventory.py history B_ID [--limit 50]
+    python bookstore_inventory.py shard B_ID --slots 16     # --slots 0: back to the Books row
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+from bookstore_catalog import catalog_cache
+from bookstore_db import DB_ERRORS, fetch_page, get_connection
+
+STOCK_LOG_FIRST = os.environ.get("BOOKSTORE_STOCK_LOG_FIRST", "0") == "1"
+STOCK_COMPACT_INTERVAL = float(os.environ.get("BOOKSTORE_STOCK_COMPACT_INTERVAL", "1"))     # seconds
+COMPACT_BATCH = 1000        # titles folded per transaction
+LOCK_STRIPES = 256          # b_id % LOCK_STRIPES picks a title's lock
+APPEND_RETRIES = 5          # re-reads after an append that didn't go in
+EVENT_KINDS = ("receive", "sell", "adjust", "return")
+IN_CHUNK = 1000
+
+ER_DUP_ENTRY = 1062
+
+
+class StockError(Exception):
+    """A stock change that cannot be made (unknown book, stock would go below zero)."""
+
+
+def _is_duplicate(exc):
+    # another writer took this seq first (or the title is gone: SQLite reports the foreign key the same way)
+    return getattr(exc, "errno", None) == ER_DUP_ENTRY or isinstance(exc, sqlite3.IntegrityError)
+
+
+def _marks(values):
+    return ",".join(["%s"] * len(values))
+
+
+# ---------- the log (caller's cursor and transaction) ----------
+def load_stock(cur, b_id, lock=False):
+    """
+    (stock, seq) after the title's last logged sale, or the Books row with
+    seq 0 when sales are written through (the default); None for an unknown
+    title. lock=True reads the latest committed rows (MySQL's plain
+    reads keep the transaction's first snapshot).
+    """
+    suffix = " FOR UPDATE" if lock else ""
+    if stock_view.log_first:
+        cur.execute("SELECT stock, seq FROM inventory_events WHERE b_id = %s ORDER BY seq DESC LIMIT 1" + suffix,
+                    (b_id,))
+        row = cur.fetchone()
+        if row is not None:
+            return tuple(row)
+    cur.execute("SELECT quantity FROM Books WHERE b_id = %s" + suffix, (b_id,))
+    row = cur.fetchone()
+    return None if row is None else (row[0], 0)
+
+
+def _insert_event(cur, b_id, seq, kind, delta, ref, sharded=False):
+    """
+    Append event seq + 1 after event seq (seq 0: after the snapshot). False
+    if seq is taken, stock < 0 or the title isn't in the mode the caller
+    expects (sharded: Books.slots > 0).
+    """
+    mode = "b.slots > 0" if sharded else "b.slots = 0"
+    if seq:
+        sql = ("INSERT INTO inventory_events (b_id, seq, kind, delta, stock, ref) "
+               "SELECT e.b_id, e.seq + 1, %s, %s, e.stock + %s, %s FROM inventory_events e "
+               f"JOIN Books b ON b.b_id = e.b_id WHERE e.b_id = %s AND e.seq = %s AND e.stock + %s >= 0 AND {mode}")
+        params = (kind, delta, delta, ref, b_id, seq, delta)
+    else:
+        sql = ("INSERT INTO inventory_events (b_id, seq, kind, delta, stock, ref) "
+               f"SELECT b_id, 1, %s, %s, quantity + %s, %s FROM Books b WHERE b_id = %s AND quantity + %s >= 0 "
+               f"AND {mode}")
+        params = (kind, delta, delta, ref, b_id, delta)
+    try:
+        cur.execute(sql, params)
+    except DB_ERRORS as e:
+        if not _is_duplicate(e):
+            raise
+        return False
+    return cur.rowcount == 1
+
+
+def _append(cur, b_id, kind, delta, ref, state, view=None, sharded=False):
+    """
+    Append (kind, delta) after state = (stock, seq), re-reading the title
+    whenever it doesn't go in (counted in view.reloads). Returns the
+    (stock, seq) after the new event.
+    """
+    fresh = False
+    for _ in range(APPEND_RETRIES):
+        if state is None:
+            raise StockError("Book not found.")
+        stock, seq = state
+        if stock + delta >= 0:
+            if _insert_event(cur, b_id, seq, kind, delta, ref, sharded):
+                return stock + delta, seq + 1
+        elif fresh:
+            raise StockError("Not enough stock available.")
+        # stale: another process appended (or received stock we haven't seen)
+        if view is not None:
+            view.reloads += 1
+        state = load_stock(cur, b_id, lock=True)
+        fresh = True
+    raise StockError("Stock of this title keeps changing; please try again.")
+
+
+def _fold(cur, b_id, stock, seq):
+    cur.execute("UPDATE Books SET quantity = %s, stock_seq = %s WHERE b_id = %s AND stock_seq < %s",
+                (stock, seq, b_id, seq))
+
+
+def _write_through(cur, b_id, kind, delta, ref, sharded=False):
+    """
+    Conditional UPDATE of Books.quantity and stock_seq, then the event read
+    from the row it wrote. Goes in only while the stock stays >= 0 and the
+    title is in the mode the caller expects (sharded: Books.slots > 0).
+    Raises StockError.
+    """
+    mode = "slots > 0" if sharded else "slots = 0"
+    cur.execute("UPDATE Books SET quantity = quantity + %s, stock_seq = stock_seq + 1 "
+                f"WHERE b_id = %s AND quantity + %s >= 0 AND {mode}", (delta, b_id, delta))
+    if cur.rowcount != 1:
+        cur.execute("SELECT slots FROM Books WHERE b_id = %s", (b_id,))
+        row = cur.fetchone()
+        if row is None:
+            raise StockError("Book not found.")
+        if bool(row[0]) != sharded:
+            raise StockError("Stock of this title keeps changing; please try again.")
+        raise StockError("Not enough stock available.")
+    try:
+        cur.execute("INSERT INTO inventory_events (b_id, seq, kind, delta, stock, ref) "
+                    "SELECT b_id, stock_seq, %s, %s, quantity, %s FROM Books WHERE b_id = %s", (kind, delta, ref, b_id))
+    except DB_ERRORS as e:
+        if not _is_duplicate(e):
+            raise
+        # sales logged first (BOOKSTORE_STOCK_LOG_FIRST=1) that the row hasn't been compacted up to
+        raise StockError("Stock of this title keeps changing; please try again.") from None
+
+
+def _change(cur, b_id, kind, delta, ref, sharded=False):
+    """
+    One stock change, logged and in Books.quantity by the time the caller
+    commits: written through, or (log-first) appended and folded. Returns
+    the new stock.
+    """
+    if not stock_view.log_first:
+        _write_through(cur, b_id, kind, delta, ref, sharded)
+        return load_stock(cur, b_id)[0]
+    stock, seq = _append(cur, b_id, kind, delta, ref, load_stock(cur, b_id, lock=True), sharded=sharded)
+    _fold(cur, b_id, stock, seq)
+    return stock
+
+
+def record_event(cur, b_id, kind, delta, ref=None):
+    """
+    Log one stock change and bring Books.quantity up to it, inside the
+    caller's transaction; no
+    stock_view lock is needed. For the occasional writers (restock,
+    adjustments, returns). A sharded title has its slot sales settled first
+    and the new stock spread over its slots. Returns the new stock.
+    """
+    if kind not in EVENT_KINDS:
+        raise ValueError(f"unknown stock event: {kind}")
+    slots = _settle(cur, b_id)
+    stock = _change(cur, b_id, kind, delta, ref, sharded=bool(slots))
+    if slots:
+        _respread(cur, b_id, [slot for slot, _, _ in slots], stock)
+    stock_view.forget([b_id])
+    return stock
+
+
+def open_stock(cur, b_ids, ref="new title"):
+    """
+    Log the quantity titles were just inserted with as their first event
+    (receive, seq 1), so the log explains all of their stock.
+    """
+    for i in range(0, len(b_ids), IN_CHUNK):
+        part = b_ids[i:i + IN_CHUNK]
+        cur.execute("INSERT INTO inventory_events (b_id, seq, kind, delta, stock, ref) "
+                    f"SELECT b_id, 1, 'receive', quantity, quantity, %s FROM Books WHERE b_id IN ({_marks(part)}) "
+                    "AND stock_seq = 0", [ref, *part])
+        cur.execute(f"UPDATE Books SET stock_seq = 1 WHERE b_id IN ({_marks(part)}) AND stock_seq = 0", part)
+    stock_view.forget(b_ids)
+
+
+def _latest_many(cur, b_ids):
+    """{b_id: (stock, seq, slots)} like load_stock plus Books.slots, for many titles (one query per IN_CHUNK)."""
+    found = {}
+    for i in range(0, len(b_ids), IN_CHUNK):
+        part = b_ids[i:i + IN_CHUNK]
+        if not stock_view.log_first:
+            cur.execute(f"SELECT b_id, quantity, slots FROM Books WHERE b_id IN ({_marks(part)})", part)
+            found.update((b_id, (quantity, 0, slots)) for b_id, quantity, slots in cur.fetchall())
+            continue
+        cur.execute("SELECT b.b_id, b.quantity, b.slots, e.stock, e.seq FROM Books b LEFT JOIN inventory_events e "
+                    "ON e.b_id = b.b_id AND e.seq = (SELECT MAX(seq) FROM inventory_events x WHERE x.b_id = b.b_id) "
+                    f"WHERE b.b_id IN ({_marks(part)})", part)
+        for b_id, quantity, slots, stock, seq in cur.fetchall():
+            found[b_id] = (quantity, 0, slots) if seq is None else (stock, seq, slots)
+    return found
+
+
+def count_stock(cur, counts, ref="stock count"):
+    """
+    Set [(b_id, counted)] as the titles' stock with one adjust (record_event)
+    each (titles already at their count get none). Used by the CSV import, whose
+    quantity column is a stock count. Returns the number of events.
+    """
+    current = _latest_many(cur, [b for b, _ in counts])
+    events = 0
+    for b_id, counted in counts:
+        # a sharded title's log hasn't seen its latest slot sales yet
+        if b_id in current and (current[b_id][0] != counted or current[b_id][2]):
+            _settle(cur, b_id)
+            state = load_stock(cur, b_id, lock=True)
+            if state is not None and state[0] != counted:
+                record_event(cur, b_id, "adjust", counted - state[0], ref)
+                events += 1
+    return events
+
+
+# ---------- in-memory view (sales) ----------
+class StockChange:
+    """The appends of one transaction; handed to the view only if the block exits normally."""
+
+    def __init__(self, view, slots):
+        self.view = view
+        self.slots = slots          # b_id -> K for the sharded titles
+        self.states = {}
+        self.slot_sales = set()
+        self.row_sales = set()      # written through to Books.quantity (the default)
+
+    def append(self, cur, b_id, kind, delta, ref=None):
+        """Append one event through the view. Returns the new stock; raises StockError."""
+        state = self.states.get(b_id) or self.view.state(cur, b_id)
+        self.states[b_id] = _append(cur, b_id, kind, delta, ref, state, self.view)
+        return self.states[b_id][0]
+
+    def take(self, cur, b_id, qty, ref=None):
+        """
+        Sell qty copies: a stock slot for a sharded title, else a sell event
+        written through to Books.quantity, or only appended (log-first). Raises StockError.
+        """
+        if self.slots.get(b_id):
+            if _take_slot(cur, b_id, self.slots[b_id], qty):
+                self.view.rebalances += 1
+            self.slot_sales.add(b_id)
+        elif self.view.log_first:
+            self.append(cur, b_id, "sell", -qty, ref)
+        else:
+            _write_through(cur, b_id, "sell", -qty, ref)
+            self.row_sales.add(b_id)
+
+    def take_many(self, cur, cart, books, ref=None):
+        """
+        Sell a cart {b_id: qty}. books is {b_id: (quantity, slots)} as read
+        with the caller's locking read of the Books rows. The titles written
+        through go in one conditional bulk UPDATE (and one INSERT ... SELECT
+        of their sell events); sharded and log-first titles one by one.
+        Raises StockError naming the titles short of stock.
+        """
+        self.slots.update((b, books[b][1]) for b in cart if books[b][1])
+        bulk = [] if self.view.log_first else sorted(b for b in cart if not books[b][1])
+        short = [b for b in bulk if books[b][0] < cart[b]]
+        if short:
+            raise StockError(f"Not enough stock available for book {', '.join(map(str, short))}.")
+        if bulk:
+            case = " ".join(["WHEN %s THEN %s"] * len(bulk))
+            qty = [v for b in bulk for v in (b, cart[b])]
+            marks = _marks(bulk)
+            cur.execute(f"UPDATE Books SET quantity = quantity - CASE b_id {case} END, stock_seq = stock_seq + 1 "
+                        f"WHERE b_id IN ({marks}) AND slots = 0 AND quantity >= CASE b_id {case} END",
+                        qty + bulk + qty)
+            if cur.rowcount != len(bulk):
+                raise StockError("Stock of these titles keeps changing; please try again.")
+            try:
+                cur.execute("INSERT INTO inventory_events (b_id, seq, kind, delta, stock, ref) "
+                            f"SELECT b_id, stock_seq, 'sell', -(CASE b_id {case} END), quantity, %s FROM Books "
+                            f"WHERE b_id IN ({marks})", qty + [ref] + bulk)
+            except DB_ERRORS as e:
+                if not _is_duplicate(e):
+                    raise
+                raise StockError("Stock of these titles keeps changing; please try again.") from None
+            self.row_sales.update(bulk)
+        for b in sorted(set(cart) - set(bulk)):
+            try:
+                self.take(cur, b, cart[b], ref)
+            except StockError:
+                raise StockError(f"Not enough stock available for book {b}.") from None
+
+    def level(self, cur, b_id, fresh=False):
+        """Stock as this transaction sees it (fresh: re-read, locking); None for an unknown title."""
+        stock = _slot_stock(cur, b_id) if self.slots.get(b_id) else None
+        if stock is not None:
+            return stock
+        if not self.view.log_first:
+            state = load_stock(cur, b_id, lock=fresh)
+        elif fresh:
+            self.states.pop(b_id, None)
+            state = self.states[b_id] = load_stock(cur, b_id, lock=True)
+        else:
+            state = self.states.get(b_id) or self.view.state(cur, b_id)
+        return None if state is None else state[0]
+
+
+class StockView:
+    """
+    b_id -> (stock, seq) after the title's last event, for the titles this
+    process sells log-first (log_first); empty while sales are written through.
+    """
+
+    def __init__(self, log_first=STOCK_LOG_FIRST):
+        self.log_first = log_first
+        self._states = {}
+        self._dirty = set()         # sold since the last compaction
+        self._slot_dirty = set()    # the same, for sharded titles
+        self._stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._guard = threading.Lock()
+        self.loads = 0
+        self.reloads = 0            # appends that had to re-read the title first
+        self.rebalances = 0         # sales that found their stock slot dry
+
+    def __len__(self):
+        return len(self._states)
+
+    def state(self, cur, b_id):
+        if not self.log_first:
+            return load_stock(cur, b_id)
+        state = self._states.get(b_id)
+        if state is None:
+            state = load_stock(cur, b_id)
+            self.loads += 1
+            if state is not None:
+                with self._guard:
+                    self._states[b_id] = state
+        return state
+
+    @contextmanager
+    def changing(self, b_ids, slots=None):
+        """
+        Lock b_ids for one transaction: yields a StockChange to append with;
+        commit inside the block. If the block raises, nothing is recorded
+        (its appends were rolled back). slots is {b_id: Books.slots} as the
+        caller read it; sharded titles (slots > 0) take no lock here, and
+        when sales are written through none do: the Books row lock orders them.
+        """
+        slots = {b: k for b, k in (slots or {}).items() if k}
+        b_ids = set(b_ids) - set(slots) if self.log_first else ()
+        stripes = [self._stripes[s] for s in sorted({b % LOCK_STRIPES for b in b_ids})]
+        for lock in stripes:
+            lock.acquire()
+        try:
+            change = StockChange(self, slots)
+            yield change
+            with self._guard:
+                self._states.update(change.states)
+                self._dirty.update(change.states)
+                self._slot_dirty.update(change.slot_sales)
+        finally:
+            for lock in reversed(stripes):
+                lock.release()
+        if change.row_sales:
+            catalog_cache.invalidate("Books")
+
+    def level(self, b_id, connect=get_connection):
+        """Exact stock of one title (None if unknown), from memory when this process has it."""
+        state = self._states.get(b_id)
+        if state is None:
+            conn = connect()
+            cur = conn.cursor()
+            try:
+                stock = _slot_stock(cur, b_id)
+                if stock is not None:
+                    return stock
+                state = self.state(cur, b_id)
+            finally:
+                cur.close()
+                conn.close()
+        return None if state is None else state[0]
+
+    def forget(self, b_ids):
+        with self._guard:
+            for b in b_ids:
+                self._states.pop(b, None)
+
+    def clear(self):
+        with self._guard:
+            self._states.clear()
+
+    def compact(self, connect=get_connection):
+        """Fold this process's sales into the log and Books.quantity. Returns the number of titles updated."""
+        with self._guard:
+            dirty, self._dirty = self._dirty, set()
+            slotted, self._slot_dirty = self._slot_dirty, set()
+        try:
+            return ((fold_slots(sorted(slotted), connect) if slotted else 0)
+                    + (fold_stock(sorted(dirty), connect) if dirty else 0))
+        except Exception:
+            with self._guard:
+                self._dirty.update(dirty)
+                self._slot_dirty.update(slotted)
+            raise
+
+    def stats(self):
+        return {"log_first": self.log_first, "titles": len(self._states), "loads": self.loads, "reloads": self.reloads,
+                "rebalances": self.rebalances, "pending_compaction": len(self._dirty) + len(self._slot_dirty)}
+
+
+stock_view = StockView()
+
+
+# ---------- sharded stock (hot titles) ----------
+def _spread(stock, k):
+    """stock split as evenly as it goes over k slots."""
+    return [stock // k + (1 if i < stock % k else 0) for i in range(k)]
+
+
+def _slot_stock(cur, b_id):
+    """Sum of a sharded title's slots; None when it isn't sharded."""
+    cur.execute("SELECT SUM(quantity) FROM stock_slots WHERE b_id = %s", (b_id,))
+    row = cur.fetchone()
+    return None if row is None or row[0] is None else int(row[0])
+
+
+def _take_slot(cur, b_id, slots, qty):
+    """
+    Take qty copies from one random slot. When it has run dry, lock all the
+    title's slots, take qty from their total and spread the rest evenly.
+    Returns True if it had to rebalance; raises StockError.
+    """
+    cur.execute("UPDATE stock_slots SET quantity = quantity - %s, sold = sold + %s "
+                "WHERE b_id = %s AND slot = %s AND quantity >= %s", (qty, qty, b_id, random.randrange(slots), qty))
+    if cur.rowcount == 1:
+        return False
+    cur.execute("SELECT slot, quantity FROM stock_slots WHERE b_id = %s ORDER BY slot FOR UPDATE", (b_id,))
+    rows = cur.fetchall()
+    if not rows:
+        # put back on the log since the caller read Books.slots
+        raise StockError("Stock of this title keeps changing; please try again.")
+    total = sum(quantity for _, quantity in rows)
+    if total < qty:
+        raise StockError("Not enough stock available.")
+    cur.executemany("UPDATE stock_slots SET quantity = %s, sold = sold + %s WHERE b_id = %s AND slot = %s",
+                    [(quantity, qty if i == 0 else 0, b_id, slot)
+                     for i, ((slot, _), quantity) in enumerate(zip(rows, _spread(total - qty, len(rows))))])
+    return True
+
+
+def _respread(cur, b_id, slots, stock):
+    cur.executemany("UPDATE stock_slots SET quantity = %s WHERE b_id = %s AND slot = %s",
+                    [(quantity, b_id, slot) for slot, quantity in zip(slots, _spread(stock, len(slots)))])
+
+
+def _settle(cur, b_id):
+    """
+    Lock a sharded title's slots and log what was sold on them since the
+    last fold as one sell event, taken off Books.quantity too. Returns the
+    slots [(slot, quantity, sold)] as they were, or None for an unsharded title.
+    """
+    cur.execute("SELECT slot, quantity, sold FROM stock_slots WHERE b_id = %s ORDER BY slot FOR UPDATE", (b_id,))
+    rows = cur.fetchall()
+    if not rows:
+        return None
+    sold = sum(r[2] for r in rows)
+    if sold:
+        _change(cur, b_id, "sell", -sold, f"{sold} sold on {len(rows)} stock slots", sharded=True)
+        cur.execute("UPDATE stock_slots SET sold = 0 WHERE b_id = %s", (b_id,))
+    return rows
+
+
+def shard_stock(b_id, slots, connect=get_connection):
+    """
+    Split b_id's stock evenly across `slots` counters (slots <= 1: back to
+    the Books row), in its own transaction. Returns the stock. From then on
+    the title's Books.quantity only moves when its slot sales are folded.
+    """
+    slots = slots if slots > 1 else 0
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        held = _settle(cur, b_id)
+        state = load_stock(cur, b_id, lock=True)
+        if state is None:
+            raise StockError("Book not found.")
+        if held:
+            cur.execute("DELETE FROM stock_slots WHERE b_id = %s", (b_id,))
+        if slots:
+            cur.executemany("INSERT INTO stock_slots (b_id, slot, quantity, sold) VALUES (%s, %s, %s, 0)",
+                            [(b_id, slot, quantity) for slot, quantity in enumerate(_spread(state[0], slots))])
+        cur.execute("UPDATE Books SET slots = %s WHERE b_id = %s", (slots, b_id))
+        _fold(cur, b_id, *state)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    stock_view.forget([b_id])
+    return state[0]
+
+
+def fold_slots(b_ids=None, connect=get_connection):
+    """
+    Log the sales made on the stock slots of b_ids (None: every sharded
+    title) since the last fold, one transaction per title. Returns the
+    number of titles.
+    """
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        if b_ids is None:
+            cur.execute("SELECT DISTINCT b_id FROM stock_slots WHERE sold > 0")
+            b_ids = [r[0] for r in cur.fetchall()]
+        for b_id in b_ids:
+            _settle(cur, b_id)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    if b_ids:
+        catalog_cache.invalidate("Books")
+    return len(b_ids)
+
+
+# ---------- snapshot ----------
+def _fold_many(cur, b_ids):
+    rows = []
+    for i in range(0, len(b_ids), IN_CHUNK):
+        part = b_ids[i:i + IN_CHUNK]
+        cur.execute("SELECT b.b_id, e.stock, e.seq FROM Books b JOIN inventory_events e ON e.b_id = b.b_id "
+                    "AND e.seq = (SELECT MAX(seq) FROM inventory_events x WHERE x.b_id = b.b_id) "
+                    f"WHERE b.b_id IN ({_marks(part)}) AND e.seq > b.stock_seq", part)
+        rows.extend(cur.fetchall())
+    cur.executemany("UPDATE Books SET quantity = %s, stock_seq = %s WHERE b_id = %s AND stock_seq < %s",
+                    [(stock, seq, b_id, seq) for b_id, stock, seq in rows])
+    return len(rows)
+
+
+def fold_stock(b_ids=None, connect=get_connection):
+    """
+    Bring the snapshot of b_ids (None: every title) up to their last event,
+    COMPACT_BATCH titles per transaction. Returns the number of titles updated.
+    """
+    folded = 0
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        if b_ids is not None:
+            for i in range(0, len(b_ids), COMPACT_BATCH):
+                folded += _fold_many(cur, list(b_ids[i:i + COMPACT_BATCH]))
+                conn.commit()
+        else:
+            after = 0
+            while True:
+                cur.execute("SELECT b_id FROM Books WHERE b_id > %s ORDER BY b_id LIMIT %s", (after, COMPACT_BATCH))
+                part = [r[0] for r in cur.fetchall()]
+                if not part:
+                    break
+                folded += _fold_many(cur, part)
+                conn.commit()
+                after = part[-1]
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    if folded:
+        catalog_cache.invalidate("Books")
+    return folded
+
+
+def replay(connect=get_connection):
+    """
+    Replay the whole log, title by title. Returns ({b_id: (stock, seq)} of
+    every title with events, [(b_id, seq, problem)]): seq gaps, an event
+    whose stock isn't the previous stock + delta, stock below zero.
+    """
+    replayed, problems = {}, []
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT b_id, seq, delta, stock FROM inventory_events ORDER BY b_id, seq")
+        current, stock, last = None, 0, 0
+        while True:
+            rows = cur.fetchmany(10000)
+            if not rows:
+                break
+            for b_id, seq, delta, after in rows:
+                if b_id != current:
+                    # the stock before the first event is the opening balance it was appended to
+                    current, stock, last = b_id, after - delta, 0
+                if seq != last + 1:
+                    problems.append((b_id, seq, f"expected seq {last + 1}"))
+                stock += delta
+                if after != stock:
+                    problems.append((b_id, seq, f"stock {after}, replay gives {stock}"))
+                if stock < 0:
+                    problems.append((b_id, seq, f"stock below zero ({stock})"))
+                last = seq
+                replayed[b_id] = (stock, seq)
+    finally:
+        cur.close()
+        conn.close()
+    return replayed, problems
+
+
+def _snapshots(connect):
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT b_id, quantity, stock_seq FROM Books")
+        return {b_id: (quantity, seq) for b_id, quantity, seq in cur.fetchall()}
+    finally:
+        cur.close()
+        conn.close()
+
+
+def verify(connect=get_connection):
+    """
+    Replay the log and compare it with the snapshot and the stock slots.
+    Returns [(b_id, seq, problem)]; empty when every event and every title
+    checks out. A snapshot behind its last event is fine (not compacted yet)
+    as long as the stock it shows is what the log says it was at stock_seq.
+    """
+    replayed, problems = replay(connect)
+    if problems:
+        return problems
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        # stock_seq 0 with events: the snapshot is the opening balance the first event was appended to
+        cur.execute("SELECT b.b_id, b.quantity, b.stock_seq, e.stock FROM Books b "
+                    "LEFT JOIN inventory_events e ON e.b_id = b.b_id AND e.seq = b.stock_seq WHERE b.stock_seq > 0 "
+                    "UNION ALL SELECT b.b_id, b.quantity, 0, e.stock - e.delta FROM Books b "
+                    "JOIN inventory_events e ON e.b_id = b.b_id AND e.seq = 1 WHERE b.stock_seq = 0")
+        for b_id, quantity, stock_seq, stock in cur.fetchall():
+            if stock is None:
+                problems.append((b_id, stock_seq, "snapshot points at a missing event"))
+            elif stock != quantity:
+                problems.append((b_id, stock_seq, f"snapshot {quantity}, log says {stock}"))
+        # slots and log read in one statement: a fold moves stock from "sold" into the log atomically
+        cur.execute("SELECT s.b_id, SUM(s.quantity + s.sold), MAX(b.quantity), "
+                    "(SELECT e.stock FROM inventory_events e WHERE e.b_id = s.b_id ORDER BY e.seq DESC LIMIT 1) "
+                    "FROM stock_slots s JOIN Books b ON b.b_id = s.b_id GROUP BY s.b_id")
+        for b_id, held, quantity, stock in cur.fetchall():
+            stock = quantity if stock is None else stock
+            if held != stock:
+                problems.append((b_id, replayed.get(b_id, (0, 0))[1], f"stock slots hold {held}, log says {stock}"))
+    finally:
+        cur.close()
+        conn.close()
+    return problems
+
+
+def rebuild(connect=get_connection):
+    """Overwrite the snapshot of every title with events with the replayed stock. Returns the titles changed."""
+    replayed, _ = replay(connect)
+    snapshots = _snapshots(connect)
+    changed = [(stock, seq, b_id) for b_id, (stock, seq) in replayed.items() if snapshots.get(b_id) != (stock, seq)]
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        for i in range(0, len(changed), COMPACT_BATCH):
+            cur.executemany("UPDATE Books SET quantity = %s, stock_seq = %s WHERE b_id = %s",
+                            changed[i:i + COMPACT_BATCH])
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    stock_view.clear()
+    if changed:
+        catalog_cache.invalidate("Books")
+    return len(changed)
+
+
+def stock_history(b_id, after=None, page_size=50, connect=get_connection):
+    """Keyset page of one title's events, oldest first: (columns, rows, next_after) like fetch_page."""
+    return fetch_page("inventory_events", "seq", after, page_size, "b_id = %s", (b_id,), connect)
+
+
+def adjust_stock(b_id, delta, reason, connect=get_connection):
+    """An admin correction (damaged copies, a recount) in its own transaction. Returns the new stock."""
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        stock = record_event(cur, b_id, "adjust", delta, reason)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    catalog_cache.invalidate("Books")
+    return stock
+
+
+# ---------- compactor ----------
+class StockCompactor:
+    """Background thread folding stock_view's and the stock slots' sales into Books.quantity."""
+
+    def __init__(self, view, connect=get_connection, interval=STOCK_COMPACT_INTERVAL):
+        self.view = view
+        self.connect = connect
+        self.interval = interval
+        self.folded = 0
+        self.runs = 0
+        self.errors = 0
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        n = self.view.compact(self.connect)
+        self.folded += n
+        self.runs += 1
+        return n
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stock-compactor", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                # the titles stay pending; the next run folds them
+                self.errors += 1
+                self.last_error = e
+
+    def stop(self, flush=True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.run_once()
+
+    def stats(self):
+        return {"folded": self.folded, "runs": self.runs, "errors": self.errors,
+                "last_error": repr(self.last_error) if self.last_error else None, **self.view.stats()}
+
+
+_compactor = None
+_compactor_lock = threading.Lock()
+
+
+def start_compactor():
+    """Process-wide compactor, started once (STOCK_COMPACT_INTERVAL <= 0: never; compact by hand)."""
+    global _compactor
+    with _compactor_lock:
+        if _compactor is None and STOCK_COMPACT_INTERVAL > 0:
+            _compactor = StockCompactor(stock_view).start()
+    return _compactor
+
+
+def shutdown():
+    """Stop the compactor, if one was started, folding what is still pending."""
+    global _compactor
+    with _compactor_lock:
+        if _compactor is not None:
+            _compactor.stop()
+            _compactor = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inventory event log: compact, verify, rebuild, history, shard")
+    parser.add_argument("command", choices=["compact", "verify", "rebuild", "history", "shard"])
+    parser.add_argument("b_id", nargs="?", type=int)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--slots", type=int, default=16,
+                        help="shard: stock slots (0: back to the Books row); Books.quantity then lags until compacted")
+    args = parser.parse_args(argv)
+    if args.command in ("history", "shard") and args.b_id is None:
+        parser.error(f"{args.command} needs a B_ID")
+    if args.command == "compact":
+        print(f"{fold_slots()} sharded title(s) logged, {fold_stock()} title(s) compacted")
+    elif args.command == "verify":
+        problems = verify()
+        for b_id, seq, problem in problems:
+            print(f"b_id {b_id} seq {seq}: {problem}")
+        print(f"{len(problems)} problem(s)")
+        return 1 if problems else 0
+    elif args.command == "rebuild":
+        print(f"{rebuild()} snapshot(s) rewritten from the log")
+    elif args.command == "shard":
+        stock = shard_stock(args.b_id, args.slots)
+        print(f"b_id {args.b_id}: {stock} copies on {args.slots if args.slots > 1 else 'no'} stock slots")
+    else:
+        columns, rows, _ = stock_history(args.b_id, page_size=args.limit)
+        print(columns)
+        for row in rows:
+            print(row)
+        print(f"stock now: {stock_view.level(args.b_id)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
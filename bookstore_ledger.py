@@ -0,0 +1,237 @@
+"""
+bookstore_ledger.py
+- Write-behind purchase pipeline: stock is reserved synchronously (one
+  short UPDATE + commit), while the Reports row and the sales rollups are
+  appended to a durable local journal and written to the database later,
+  in batches, by a background worker.
+- The journal is an SQLite file (WAL) next to the app. An entry is on disk
+  before the buyer is told the purchase went through, so a crash of the app
+  loses nothing: the next worker start replays whatever is still pending.
+  (synchronous=NORMAL survives process crashes; set BOOKSTORE_LEDGER_SYNC=FULL
+  to also survive power loss, at one fsync per purchase.)
+- Replay is exactly-once: the last journal seq applied is stored in
+  ledger_applied in the same transaction as the Reports rows it covers.
+- The only window is between the stock commit and the journal append (no
+  I/O in between): a crash exactly there leaves stock taken without a
+  Reports row - never the other way round.
+- Enabled with BOOKSTORE_WRITE_BEHIND=1; buy() picks the mode.
+Usage:
+    journal = ReportsJournal("ledger.db")
+    worker = LedgerWorker(journal).start()      # replays first, then drains in the background
+    seq, total = purchase_book_deferred(101, 4, 1, journal)
+    worker.stop()                               # flushes what is left
+"""
+
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import date
+from decimal import Decimal
+
+from bookstore_analytics import record_sales_many
+from bookstore_db import get_connection
+from bookstore_purchase import MAX_RETRIES, purchase_book, reserve_stock
+
+WRITE_BEHIND = os.environ.get("BOOKSTORE_WRITE_BEHIND", "0") == "1"
+LEDGER_PATH = os.environ.get("BOOKSTORE_LEDGER_PATH", "bookstore_ledger.db")
+LEDGER_SYNC = os.environ.get("BOOKSTORE_LEDGER_SYNC", "NORMAL")
+LEDGER_BATCH = 500          # journal entries written to Reports per transaction
+LEDGER_INTERVAL = 0.2       # seconds between flushes; longer = bigger batches, more lag
+
+
+class ReportsJournal:
+    """Append-only local queue of pending Reports rows, in an SQLite file."""
+
+    def __init__(self, path=LEDGER_PATH, sync=LEDGER_SYNC):
+        self.path = path
+        self._cnx = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._cnx.execute("PRAGMA journal_mode = WAL")
+        self._cnx.execute(f"PRAGMA synchronous = {sync}")
+        self._cnx.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS entries (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                b_id INTEGER NOT NULL,
+                c_id INTEGER,
+                day TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                price TEXT NOT NULL,
+                genre TEXT NOT NULL
+            );
+        """)
+        self._cnx.execute("INSERT OR IGNORE INTO meta VALUES ('journal_id', ?)", (uuid.uuid4().hex,))
+        self.journal_id = self._cnx.execute("SELECT value FROM meta WHERE key = 'journal_id'").fetchone()[0]
+        self._lock = threading.Lock()
+
+    def append(self, b_id, c_id, day, qty, total, genre):
+        """Durably queue one Reports row; returns its seq."""
+        with self._lock:
+            seq = self._cnx.execute(
+                "INSERT INTO entries (b_id, c_id, day, quantity, price, genre) VALUES (?,?,?,?,?,?)",
+                (b_id, c_id, day.isoformat(), qty, str(total), genre)).lastrowid
+        return seq
+
+    def read(self, after, limit):
+        """Entries with seq > after, oldest first: [(seq, b_id, c_id, day, qty, total, genre)]."""
+        with self._lock:
+            rows = self._cnx.execute(
+                "SELECT seq, b_id, c_id, day, quantity, price, genre FROM entries WHERE seq > ? ORDER BY seq LIMIT ?",
+                (after, limit)).fetchall()
+        return [(seq, b_id, c_id, date.fromisoformat(day), qty, Decimal(price), genre)
+                for seq, b_id, c_id, day, qty, price, genre in rows]
+
+    def trim(self, upto):
+        """Forget entries already applied to the database."""
+        with self._lock:
+            self._cnx.execute("DELETE FROM entries WHERE seq <= ?", (upto,))
+
+    def depth(self):
+        with self._lock:
+            return self._cnx.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._cnx.close()
+
+
+def apply_batch(journal, connect=get_connection, limit=LEDGER_BATCH):
+    """
+    Move up to `limit` pending journal entries into Reports and the rollups
+    in one transaction. Returns the number of entries applied (0 = caught up).
+    """
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        # FOR UPDATE: two workers on the same journal file can't both apply a batch
+        cur.execute("SELECT seq FROM ledger_applied WHERE journal_id = %s FOR UPDATE", (journal.journal_id,))
+        row = cur.fetchone()
+        applied = row[0] if row else 0
+        entries = journal.read(applied, limit)
+        if not entries:
+            conn.rollback()
+            return 0
+        cur.executemany("INSERT INTO Reports (b_id, c_id, date_of_purchase, quantity, price) VALUES (%s,%s,%s,%s,%s)",
+                        [(b_id, c_id, day, qty, total) for _, b_id, c_id, day, qty, total, _ in entries])
+        record_sales_many(cur, [(day, c_id, b_id, genre, qty, total)
+                                for _, b_id, c_id, day, qty, total, genre in entries])
+        last = entries[-1][0]
+        cur.execute("INSERT INTO ledger_applied (journal_id, seq) VALUES (%s, %s) "
+                    "ON DUPLICATE KEY UPDATE seq = VALUES(seq)", (journal.journal_id, last))
+        conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    # after the commit: if we crash before this, replay skips them by seq anyway
+    journal.trim(last)
+    return len(entries)
+
+
+class LedgerWorker:
+    """Background thread draining a ReportsJournal into the database."""
+
+    def __init__(self, journal, connect=get_connection, batch=LEDGER_BATCH, interval=LEDGER_INTERVAL):
+        self.journal = journal
+        self.connect = connect
+        self.batch = batch
+        self.interval = interval
+        self.applied = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def drain(self):
+        """Apply everything pending right now (crash-recovery replay). Returns the entry count."""
+        total = 0
+        while True:
+            n = apply_batch(self.journal, self.connect, self.batch)
+            if n == 0:
+                return total
+            total += n
+            self.applied += n
+            self.batches += 1
+
+    def start(self):
+        self.drain()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ledger-worker", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        # flush on a timer rather than per purchase: at peak traffic each
+        # flush is one big batch instead of many one-row transactions
+        while not self._stop.wait(self.interval):
+            try:
+                self.drain()
+            except Exception as e:
+                # database unavailable: entries stay in the journal; try again later
+                self.errors += 1
+                self.last_error = e
+                self._stop.wait(min(5.0, self.interval * 2 ** min(self.errors, 5)))
+
+    def stop(self, flush=True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.drain()
+
+    def stats(self):
+        return {"applied": self.applied, "batches": self.batches, "pending": self.journal.depth(),
+                "errors": self.errors, "last_error": repr(self.last_error) if self.last_error else None}
+
+
+def purchase_book_deferred(b_id, cust_id, qty, journal, connect=get_connection, retries=MAX_RETRIES):
+    """
+    Reserve stock now, queue the Reports row. Returns (journal seq, total).
+    Raises PurchaseError like purchase_book (nothing is queued then).
+    """
+    total, genre = reserve_stock(b_id, qty, connect, retries)
+    return journal.append(b_id, cust_id, date.today(), qty, total, genre), total
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    """Process-wide (journal, worker), started (and replayed) on first use."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            journal = ReportsJournal()
+            _ledger = (journal, LedgerWorker(journal).start())
+    return _ledger
+
+
+def buy(b_id, cust_id, qty):
+    """
+    Purchase entry point for the UIs: write-behind when BOOKSTORE_WRITE_BEHIND=1,
+    otherwise the synchronous purchase_book. Returns (r_no or None if queued, total).
+    """
+    if WRITE_BEHIND:
+        journal, _ = get_ledger()
+        _, total = purchase_book_deferred(b_id, cust_id, qty, journal)
+        return None, total
+    return purchase_book(b_id, cust_id, qty)
+
+
+def shutdown():
+    """Flush and stop the process-wide worker, if one was started."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is not None:
+            journal, worker = _ledger
+            worker.stop()
+            journal.close()
+            _ledger = None
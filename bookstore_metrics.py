@@ -0,0 +1,324 @@
+"""
+bookstore_metrics.py
+- Query profiler for every statement that goes through the shared pool
+  (bookstore_db wraps pooled cursors in InstrumentedCursor), whichever app
+  issued it: CLI, Streamlit, API or a background worker.
+- Per (caller, statement) it keeps calls, rows, errors, total / max time
+  and a latency histogram. The caller is the nearest app function on the
+  stack (e.g. streamlit_app.view_purchase_history); helpers that only
+  forward a query for someone else are marked @pass_through and skipped.
+  Statements are keyed by their SQL with whitespace collapsed and IN lists
+  folded, so the same query with different values is one entry.
+- Latency covers execute() plus the fetches that read its rows (unbuffered
+  MySQL cursors stream rows during fetch), so a statement is recorded when
+  the cursor runs its next statement, is closed, or its connection goes
+  back to the pool.
+- Statements slower than BOOKSTORE_SLOW_QUERY_MS go to an in-memory slow
+  log (and the "bookstore.slow_query" logger; BOOKSTORE_SLOW_QUERY_LOG
+  writes it to a file).
+- prometheus_text() renders everything in the Prometheus text format; the
+  API serves it on /metrics, write_prometheus() writes it atomically for
+  node_exporter's textfile collector, and BOOKSTORE_METRICS_FILE makes a
+  background thread do that every BOOKSTORE_METRICS_INTERVAL seconds.
+- BOOKSTORE_QUERY_PROFILING=0 turns the wrapping off.
+Usage:
+    from bookstore_metrics import profiler
+    profiler.summary()          # [{"caller", "statement", "calls", "p95_ms", ...}], slowest total first
+    profiler.slow_log()
+"""
+
+import bisect
+import logging
+import os
+import re
+import reprlib
+import sys
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+PROFILING = os.environ.get("BOOKSTORE_QUERY_PROFILING", "1") == "1"
+SLOW_QUERY_MS = float(os.environ.get("BOOKSTORE_SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG = os.environ.get("BOOKSTORE_SLOW_QUERY_LOG")
+SLOW_LOG_SIZE = 200
+METRICS_FILE = os.environ.get("BOOKSTORE_METRICS_FILE")
+METRICS_INTERVAL = float(os.environ.get("BOOKSTORE_METRICS_INTERVAL", "15"))
+
+# histogram bucket upper bounds, seconds (Prometheus' defaults, plus 0.5 ms)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_INFRA_FILES = {os.path.join(APP_DIR, name) for name in ("bookstore_db.py", "bookstore_metrics.py")}
+_PASS_THROUGH = set()
+
+slow_logger = logging.getLogger("bookstore.slow_query")
+if SLOW_QUERY_LOG:
+    _handler = logging.FileHandler(SLOW_QUERY_LOG, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_logger.addHandler(_handler)
+    slow_logger.setLevel(logging.WARNING)
+
+
+def pass_through(fn):
+    """Mark a helper that runs queries on behalf of its caller; profiles credit the caller instead."""
+    _PASS_THROUGH.add(fn.__code__)
+    return fn
+
+
+_code_names = {}      # code object -> "module.function", or None for frames that never count as the caller
+
+
+def _caller_name(code):
+    filename = code.co_filename
+    if not filename.startswith(APP_DIR) or filename in _INFRA_FILES:
+        name = None
+    else:
+        name = f"{os.path.basename(filename)[:-3]}.{code.co_name}"
+    _code_names[code] = name
+    return name
+
+
+def find_caller(depth=2):
+    """'module.function' of the nearest app frame that isn't DB plumbing or a pass-through helper."""
+    frame = sys._getframe(depth)
+    fallback = None
+    while frame is not None:
+        code = frame.f_code
+        name = _code_names[code] if code in _code_names else _caller_name(code)
+        if name is not None:
+            if code not in _PASS_THROUGH and not code.co_name.startswith("<"):
+                return name
+            fallback = fallback or name
+        frame = frame.f_back
+    return fallback or "unknown"
+
+
+_IN_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize(sql):
+    """One key per statement shape: collapsed whitespace, IN (%s, %s, ...) folded to IN (...)."""
+    return _IN_LIST.sub("(...)", _SPACES.sub(" ", sql).strip())
+
+
+class StatementStats:
+    __slots__ = ("calls", "rows", "errors", "total", "max", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.rows = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)     # last one is +Inf
+
+    def quantile(self, q):
+        """Estimated from the histogram (linear within a bucket), in seconds."""
+        if not self.calls:
+            return 0.0
+        rank, seen = q * self.calls, 0
+        for i, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                low = BUCKETS[i - 1] if i else 0.0
+                high = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(low + (high - low) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+
+class QueryProfiler:
+    def __init__(self, slow_ms=SLOW_QUERY_MS, slow_log_size=SLOW_LOG_SIZE):
+        self.enabled = PROFILING
+        self.slow_seconds = slow_ms / 1000
+        self._stats = {}                # (caller, statement) -> StatementStats
+        self._slow = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def record(self, caller, sql, seconds, rows, error=False, params=None):
+        key = (caller, normalize(sql))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = StatementStats()
+            stats.calls += 1
+            stats.rows += max(rows, 0)
+            stats.errors += error
+            stats.total += seconds
+            stats.max = max(stats.max, seconds)
+            stats.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        if seconds >= self.slow_seconds:
+            entry = {"at": time.time(), "ms": round(seconds * 1000, 2), "caller": caller, "statement": key[1],
+                     "params": reprlib.repr(params) if params is not None else "", "rows": rows}
+            self._slow.append(entry)
+            slow_logger.warning("%.1f ms %s rows=%s %s %s", entry["ms"], caller, rows, key[1], entry["params"])
+
+    def summary(self):
+        with self._lock:
+            items = [(key, stats) for key, stats in self._stats.items()]
+            out = [{
+                "caller": caller, "statement": statement, "calls": s.calls, "rows": s.rows, "errors": s.errors,
+                "total_ms": round(s.total * 1000, 2), "mean_ms": round(s.total / s.calls * 1000, 3),
+                "p50_ms": round(s.quantile(0.5) * 1000, 3), "p95_ms": round(s.quantile(0.95) * 1000, 3),
+                "p99_ms": round(s.quantile(0.99) * 1000, 3), "max_ms": round(s.max * 1000, 3),
+            } for (caller, statement), s in items if s.calls]
+        return sorted(out, key=lambda r: r["total_ms"], reverse=True)
+
+    def slow_log(self):
+        return list(reversed(self._slow))
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (s.calls, s.rows, s.errors, s.total, list(s.buckets)) for key, s in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+            self.started = time.time()
+
+
+profiler = QueryProfiler()
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times each statement (execute + its fetches) and counts its rows."""
+
+    def __init__(self, cur, profiler=profiler, open_cursors=None):
+        self._cur = cur
+        self._profiler = profiler
+        self._pending = None            # [caller, sql, params, seconds, rows, error]
+        self._open_cursors = open_cursors   # the connection's set of unclosed cursors, if it tracks them
+        if open_cursors is not None:
+            open_cursors.add(self)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            caller, sql, params, seconds, rows, error = pending
+            self._profiler.record(caller, sql, seconds, rows, error, params)
+
+    def _run(self, method, sql, args):
+        self._finish()
+        caller = find_caller(3)
+        params = args[0] if args else None
+        start = time.perf_counter()
+        try:
+            result = method(sql, *args)
+        except Exception:
+            self._profiler.record(caller, sql, time.perf_counter() - start, 0, True, params)
+            raise
+        seconds = time.perf_counter() - start
+        # DML: affected rows; SELECT: counted as they are fetched
+        rows = self._cur.rowcount if self._cur.description is None else 0
+        self._pending = [caller, sql, params, seconds, rows, False]
+        return result
+
+    def execute(self, sql, *args):
+        return self._run(self._cur.execute, sql, args)
+
+    def executemany(self, sql, *args):
+        return self._run(self._cur.executemany, sql, args)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        if self._pending is not None:
+            self._pending[3] += time.perf_counter() - start
+            if result is not None:
+                self._pending[4] += len(result) if isinstance(result, list) else 1
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cur.fetchone)
+
+    def fetchmany(self, size=1):
+        return self._fetch(self._cur.fetchmany, size)
+
+    def fetchall(self):
+        return self._fetch(self._cur.fetchall)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._finish()
+        if self._open_cursors is not None:
+            self._open_cursors.discard(self)
+        return self._cur.close()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", " ").replace('"', '\\"')
+
+
+def prometheus_text(profiler=profiler, pool=None):
+    """All query metrics (and pool counters, if a pool is given) in the Prometheus text exposition format."""
+    lines = [
+        "# HELP bookstore_query_duration_seconds Statement latency (execute + fetch) by caller and statement.",
+        "# TYPE bookstore_query_duration_seconds histogram",
+    ]
+    rows, errors = [], []
+    for (caller, statement), (calls, nrows, nerrors, total, buckets) in sorted(profiler.snapshot().items()):
+        labels = f'caller="{_label(caller)}",statement="{_label(statement)}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), buckets):
+            cumulative += count
+            lines.append(f'bookstore_query_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"bookstore_query_duration_seconds_sum{{{labels}}} {total:.6f}")
+        lines.append(f"bookstore_query_duration_seconds_count{{{labels}}} {calls}")
+        rows.append(f"bookstore_query_rows_total{{{labels}}} {nrows}")
+        errors.append(f"bookstore_query_errors_total{{{labels}}} {nerrors}")
+    lines += ["# HELP bookstore_query_rows_total Rows returned or affected.",
+              "# TYPE bookstore_query_rows_total counter"]
+    lines += rows
+    lines += ["# HELP bookstore_query_errors_total Statements that raised.",
+              "# TYPE bookstore_query_errors_total counter"]
+    lines += errors
+    lines += ["# HELP bookstore_slow_queries_logged Entries in the slow-query log.",
+              "# TYPE bookstore_slow_queries_logged gauge", f"bookstore_slow_queries_logged {len(profiler.slow_log())}"]
+    if pool is not None:
+        stats = pool.stats()
+        for name in ("checkouts", "misses", "waits", "recycled", "failed_pings", "reclaimed"):
+            lines += [f"# TYPE bookstore_pool_{name}_total counter", f"bookstore_pool_{name}_total {stats[name]}"]
+        lines += ["# TYPE bookstore_pool_wait_seconds_total counter",
+                  f"bookstore_pool_wait_seconds_total {stats['wait_time']:.6f}"]
+        for name in ("open", "idle", "size"):
+            lines += [f"# TYPE bookstore_pool_{name} gauge", f"bookstore_pool_{name} {stats[name]}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path, profiler=profiler, pool=None):
+    """Write prometheus_text() to `path` atomically (write a temp file, then rename)."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text(profiler, pool))
+    os.replace(tmp, path)
+
+
+_exporter = None
+
+
+def start_file_exporter(path=METRICS_FILE, interval=METRICS_INTERVAL, pool_getter=None):
+    """Rewrite the metrics file every `interval` seconds from a daemon thread (once per process)."""
+    global _exporter
+    if not path or _exporter is not None:
+        return _exporter
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_prometheus(path, pool=pool_getter() if pool_getter else None)
+            except OSError as e:
+                slow_logger.warning("metrics export to %s failed: %s", path, e)
+
+    _exporter = threading.Thread(target=run, name="metrics-exporter", daemon=True)
+    _exporter.start()
+    return _exporter
@@ -0,0 +1,433 @@
+"""
+bookstore_pricing.py
+- Price history and scheduled promotions.
+- Books.price is the list price. A promotion takes a percentage or a fixed
+  amount off one title (b_id) or a whole genre, from starts_at until
+  ends_at. Books.sale_price / Books.promo_id hold the resolved result: the
+  price after the best promotion running for the title (NULL: none). Catalog
+  pages show both columns of the Books row they read anyway; checkout fetches
+  both and charges sale_price when it is set, price otherwise (picked in
+  Python: a COALESCE comes back untyped on SQLite). Neither looks at a
+  promotion rule.
+- Resolved prices only change when a window opens or closes, a promotion is
+  ended early, or a list price changes. refresh_promotions() moves the due
+  promotions scheduled -> active -> ended and re-resolves just the titles
+  they cover: one row for a title promotion, the genre's titles for a genre
+  one. The price clock thread runs it at each next boundary (and at least
+  every PROMOTION_POLL seconds, for promotions other processes add).
+- A new title or a list price change is resolved in the writer's own
+  transaction with reprice().
+- Every change of a title's price appends a price_history row (the price it
+  had, the one it has now, the list price and the promotion); price_at()
+  answers "what did b_id cost at <time>".
+Usage:
+    python bookstore_pricing.py refresh | rebuild
+    python bookstore_pricing.py history B_ID [--limit 50]
+"""
+
+import argparse
+import os
+import threading
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+
+from bookstore_catalog import catalog_cache
+from bookstore_db import fetch_page, get_connection
+
+PROMOTION_POLL = float(os.environ.get("BOOKSTORE_PROMOTION_POLL", "60"))     # seconds; <= 0: no price clock
+PROMOTION_KINDS = ("percent", "fixed")
+REPRICE_BATCH = 1000        # titles read / written per statement
+CENT = Decimal("0.01")
+
+
+class PricingError(Exception):
+    """A price or promotion that cannot be set (unknown book, bad amount or window)."""
+
+
+def _now():
+    return datetime.now().replace(microsecond=0)
+
+
+def _as_datetime(value):
+    # MIN() over a DATETIME column has no declared type on SQLite and comes back as text
+    return value if value is None or isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def _marks(values):
+    return ",".join(["%s"] * len(values))
+
+
+def discounted(price, kind, amount):
+    """price after a promotion, rounded half up to the paisa, never below 0."""
+    price, amount = Decimal(str(price)), Decimal(str(amount))
+    off = price * amount / 100 if kind == "percent" else amount
+    return max(price - off, Decimal(0)).quantize(CENT, ROUND_HALF_UP)
+
+
+# ---------- resolving (caller's cursor and transaction) ----------
+def reprice(cur, b_ids=(), genres=(), was=None, now=None):
+    """
+    Re-resolve the sale price of the titles b_ids and every title in
+    `genres` from the active promotions, writing Books.sale_price / promo_id
+    and price_history where the price changed. was: {b_id: price before}
+    for titles whose list price the caller has just changed (they get a
+    history row even when the effective price stays the same). Returns the
+    number of titles repriced.
+    """
+    books = {}
+    b_ids, genres = list(dict.fromkeys(b_ids)), list(dict.fromkeys(genres))
+    query = "SELECT b_id, genre, price, sale_price, promo_id FROM Books WHERE {} IN ({}) FOR UPDATE"
+    for column, values in (("b_id", b_ids), ("genre", genres)):
+        for i in range(0, len(values), REPRICE_BATCH):
+            part = values[i:i + REPRICE_BATCH]
+            cur.execute(query.format(column, _marks(part)), part)
+            books.update((row[0], row[1:]) for row in cur.fetchall())
+    if not books:
+        return 0
+
+    # the promotions that can apply: the genres' own plus the titles' own
+    offers = {}
+    in_genres = sorted({genre for genre, *_ in books.values()})
+    ids = sorted(books)
+    lookups = [("genre", in_genres[i:i + REPRICE_BATCH]) for i in range(0, len(in_genres), REPRICE_BATCH)]
+    lookups += [("b_id", ids[i:i + REPRICE_BATCH]) for i in range(0, len(ids), REPRICE_BATCH)]
+    for column, part in lookups:
+        cur.execute(f"SELECT promo_id, b_id, genre, kind, amount FROM promotions "
+                    f"WHERE state = 'active' AND {column} IN ({_marks(part)})", part)
+        for promo_id, b_id, genre, kind, amount in cur.fetchall():
+            offers.setdefault(b_id if b_id is not None else ("genre", genre), []).append((promo_id, kind, amount))
+
+    at, was = now or _now(), was or {}
+    updates, history = [], []
+    for b_id, (genre, price, sale_price, promo_id) in books.items():
+        best = min(((discounted(price, kind, amount), p_id)
+                    for p_id, kind, amount in offers.get(b_id, []) + offers.get(("genre", genre), [])),
+                   default=(None, None))
+        if best != (sale_price, promo_id):
+            updates.append((best[0], best[1], b_id))
+        before = was[b_id] if b_id in was else (sale_price if sale_price is not None else price)
+        after = best[0] if best[0] is not None else price
+        if b_id in was or after != before:
+            history.append((b_id, at, before, after, price, best[1]))
+    for i in range(0, len(updates), REPRICE_BATCH):
+        cur.executemany("UPDATE Books SET sale_price = %s, promo_id = %s WHERE b_id = %s", updates[i:i + REPRICE_BATCH])
+    for i in range(0, len(history), REPRICE_BATCH):
+        cur.executemany("INSERT INTO price_history (b_id, changed_at, was, price, list_price, promo_id) "
+                        "VALUES (%s,%s,%s,%s,%s,%s)", history[i:i + REPRICE_BATCH])
+    return len(updates)
+
+
+def _due(cur, now):
+    """Promotions whose window has opened or closed by `now`, locked: [(promo_id, b_id, genre, new state)]."""
+    cur.execute("SELECT promo_id, b_id, genre, ends_at FROM promotions "
+                "WHERE state = 'scheduled' AND starts_at <= %s FOR UPDATE", (now,))
+    # one that opened and closed while nobody was looking never applied
+    due = [(p, b, g, "active" if ends > now else "ended") for p, b, g, ends in cur.fetchall()]
+    cur.execute("SELECT promo_id, b_id, genre FROM promotions WHERE state = 'active' AND ends_at <= %s FOR UPDATE",
+                (now,))
+    return due + [(p, b, g, "ended") for p, b, g in cur.fetchall()]
+
+
+def refresh_promotions(now=None, connect=get_connection):
+    """
+    Open and close the promotions due by `now` and re-resolve the titles they
+    cover, in one transaction. Returns (opened, closed, titles repriced).
+    """
+    now = now or _now()
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        due = _due(cur, now)
+        if not due:
+            conn.rollback()
+            return 0, 0, 0
+        cur.executemany("UPDATE promotions SET state = %s WHERE promo_id = %s", [(s, p) for p, _, _, s in due])
+        changed = reprice(cur, [b for _, b, _, _ in due if b is not None],
+                          [g for _, _, g, _ in due if g is not None], now=now)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    if changed:
+        catalog_cache.invalidate("Books")
+    opened = sum(1 for *_, state in due if state == "active")
+    return opened, len(due) - opened, changed
+
+
+def next_boundary(connect=get_connection):
+    """When the next scheduled promotion opens or active one closes (None: nothing pending)."""
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT MIN(starts_at) FROM promotions WHERE state = 'scheduled'")
+        starts = _as_datetime(cur.fetchone()[0])
+        cur.execute("SELECT MIN(ends_at) FROM promotions WHERE state = 'active'")
+        ends = _as_datetime(cur.fetchone()[0])
+    finally:
+        cur.close()
+        conn.close()
+    return min((t for t in (starts, ends) if t is not None), default=None)
+
+
+def rebuild(connect=get_connection, now=None):
+    """
+    Re-resolve every title from the active promotions, REPRICE_BATCH titles
+    per transaction (repair, and the baseline the incremental refresh is
+    measured against). Returns the titles whose sale price was wrong.
+    """
+    changed, after = 0, 0
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        while True:
+            cur.execute("SELECT b_id FROM Books WHERE b_id > %s ORDER BY b_id LIMIT %s", (after, REPRICE_BATCH))
+            ids = [r[0] for r in cur.fetchall()]
+            if not ids:
+                break
+            changed += reprice(cur, ids, now=now)
+            conn.commit()
+            after = ids[-1]
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    if changed:
+        catalog_cache.invalidate("Books")
+    return changed
+
+
+# ---------- list prices and promotions (own transaction) ----------
+def set_price(b_id, price, connect=get_connection):
+    """Change a title's list price; its sale price and history follow in the same transaction."""
+    price = Decimal(str(price)).quantize(CENT, ROUND_HALF_UP)
+    if price < 0:
+        raise PricingError("Price can't be negative.")
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT price, sale_price FROM Books WHERE b_id = %s FOR UPDATE", (b_id,))
+        row = cur.fetchone()
+        if row is None:
+            raise PricingError(f"Book {b_id} not found.")
+        cur.execute("UPDATE Books SET price = %s WHERE b_id = %s", (price, b_id))
+        reprice(cur, [b_id], was={b_id: row[0] if row[1] is None else row[1]})
+        cur.execute("SELECT price, sale_price FROM Books WHERE b_id = %s", (b_id,))
+        listed, sale_price = cur.fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    catalog_cache.invalidate("Books")
+    return listed if sale_price is None else sale_price
+
+
+def add_promotion(name, kind, amount, starts_at, ends_at, b_id=None, genre=None, created_by=None,
+                  connect=get_connection, now=None):
+    """
+    Schedule a promotion on one title (b_id) or a genre; one that has
+    already started applies at once. Returns promo_id.
+    """
+    if (b_id is None) == (not genre):
+        raise PricingError("A promotion is for either one book or one genre.")
+    if kind not in PROMOTION_KINDS:
+        raise PricingError(f"Promotion kind must be one of {', '.join(PROMOTION_KINDS)}.")
+    amount = Decimal(str(amount))
+    if amount <= 0 or (kind == "percent" and amount > 100):
+        raise PricingError("Percent off must be in (0, 100]; a fixed amount off must be positive.")
+    if ends_at <= starts_at:
+        raise PricingError("A promotion must end after it starts.")
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        if b_id is not None:
+            cur.execute("SELECT 1 FROM Books WHERE b_id = %s", (b_id,))
+            if cur.fetchone() is None:
+                raise PricingError(f"Book {b_id} not found.")
+        cur.execute("INSERT INTO promotions (name, b_id, genre, kind, amount, starts_at, ends_at, created_by) "
+                    "VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
+                    (name, b_id, genre or None, kind, amount, starts_at.replace(microsecond=0),
+                     ends_at.replace(microsecond=0), created_by))
+        promo_id = cur.lastrowid
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    refresh_promotions(now, connect)
+    _wake_clock()
+    return promo_id
+
+
+def end_promotion(promo_id, connect=get_connection, now=None):
+    """End a promotion now (a scheduled one never starts). Returns False if it had already ended."""
+    now = now or _now()
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("UPDATE promotions SET ends_at = %s, starts_at = CASE WHEN starts_at > %s THEN %s "
+                    "ELSE starts_at END WHERE promo_id = %s AND state != 'ended'", (now, now, now, promo_id))
+        ended = cur.rowcount == 1
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    if ended:
+        refresh_promotions(now, connect)
+        _wake_clock()
+    return ended
+
+
+def promotions_page(after=None, page_size=50, state=None, connect=get_connection):
+    """Keyset page of promotions (optionally one state): (columns, rows, next_after) like fetch_page."""
+    if state is None:
+        return fetch_page("promotions", "promo_id", after, page_size, connect=connect)
+    return fetch_page("promotions", "promo_id", after, page_size, "state = %s", (state,), connect)
+
+
+def price_history(b_id, after=None, page_size=50, connect=get_connection):
+    """Keyset page of one title's price changes, oldest first."""
+    return fetch_page("price_history", "ph_id", after, page_size, "b_id = %s", (b_id,), connect)
+
+
+def price_at(b_id, when, connect=get_connection):
+    """What b_id sold for at `when`: the last change before it, or what the first change replaced."""
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT price FROM price_history WHERE b_id = %s AND changed_at <= %s "
+                    "ORDER BY changed_at DESC, ph_id DESC LIMIT 1", (b_id, when))
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("SELECT was FROM price_history WHERE b_id = %s ORDER BY changed_at, ph_id LIMIT 1", (b_id,))
+            row = cur.fetchone()
+        if row is None:
+            # never changed: the price it has now
+            cur.execute("SELECT sale_price, price FROM Books WHERE b_id = %s", (b_id,))
+            row = cur.fetchone()
+            row = row and (row[0] if row[0] is not None else row[1],)
+        return row[0] if row else None
+    finally:
+        cur.close()
+        conn.close()
+
+
+# ---------- price clock ----------
+class PriceClock:
+    """Background thread running refresh_promotions() at every promotion boundary."""
+
+    def __init__(self, connect=get_connection, poll=PROMOTION_POLL):
+        self.connect = connect
+        self.poll = poll
+        self.runs = 0
+        self.repriced = 0
+        self.errors = 0
+        self.last_error = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        _, _, changed = refresh_promotions(connect=self.connect)
+        self.repriced += changed
+        self.runs += 1
+        return changed
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="price-clock", daemon=True)
+        self._thread.start()
+        return self
+
+    def wake(self):
+        """Look at the schedule again (a promotion was added or ended)."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self.poll
+            try:
+                self.run_once()
+                boundary = next_boundary(self.connect)
+                if boundary is not None:
+                    wait = min(max((boundary - _now()).total_seconds(), 0), self.poll)
+            except Exception as e:
+                # the promotions stay due; the next run picks them up
+                self.errors += 1
+                self.last_error = e
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {"runs": self.runs, "repriced": self.repriced, "errors": self.errors,
+                "last_error": repr(self.last_error) if self.last_error else None}
+
+
+_clock = None
+_clock_lock = threading.Lock()
+
+
+def start_price_clock():
+    """Process-wide price clock, started once (PROMOTION_POLL <= 0: never; refresh by hand)."""
+    global _clock
+    with _clock_lock:
+        if _clock is None and PROMOTION_POLL > 0:
+            _clock = PriceClock().start()
+    return _clock
+
+
+def _wake_clock():
+    if _clock is not None:
+        _clock.wake()
+
+
+def shutdown():
+    """Stop the price clock, if one was started."""
+    global _clock
+    with _clock_lock:
+        if _clock is not None:
+            _clock.stop()
+            _clock = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Promotions and price history: refresh, rebuild, history")
+    parser.add_argument("command", choices=["refresh", "rebuild", "history"])
+    parser.add_argument("b_id", nargs="?", type=int)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args(argv)
+    if args.command == "refresh":
+        opened, closed, changed = refresh_promotions()
+        print(f"{opened} promotion(s) opened, {closed} closed, {changed} title(s) repriced")
+    elif args.command == "rebuild":
+        print(f"{rebuild()} title(s) had a stale sale price")
+    else:
+        if args.b_id is None:
+            parser.error("history needs a B_ID")
+        columns, rows, _ = price_history(args.b_id, page_size=args.limit)
+        print(columns)
+        for row in rows:
+            print(row)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,208 @@
+"""
+bookstore_purchase.py
+- Single purchase path shared by streamlit_app.buy_book() and
+  bookstore_bootstrap.buy_book_cli().
+- Stock is taken with one conditional UPDATE (quantity >= qty), so two buyers
+  can never both pass the stock check, and logged as a sell event
+  (bookstore_inventory; BOOKSTORE_STOCK_LOG_FIRST=1 only appends the event). A title
+  sharded with bookstore_inventory.shard_stock() (Books.slots > 0) takes
+  from one of its stock slots; its Books.quantity catches up at compaction.
+  r_no comes from AUTO_INCREMENT.
+- Deadlocks / lock-wait timeouts are retried with exponential backoff.
+- checkout_cart() buys several titles in one transaction (Streamlit "Cart").
+- Sales rollups (bookstore_analytics) are updated in the same transaction.
+- reserve_stock() is the synchronous half of the write-behind pipeline in
+  bookstore_ledger: stock only, the Reports row follows from the journal.
+"""
+
+import random
+import time
+from datetime import date
+
+from bookstore_analytics import record_sales
+from bookstore_db import get_connection
+from bookstore_inventory import StockError, stock_view
+
+# MySQL error numbers worth retrying the whole transaction for
+ER_LOCK_WAIT_TIMEOUT = 1205
+ER_LOCK_DEADLOCK = 1213
+RETRYABLE_ERRNOS = (ER_LOCK_WAIT_TIMEOUT, ER_LOCK_DEADLOCK)
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.01     # seconds; doubled on every retry, plus jitter
+
+
+class PurchaseError(Exception):
+    """A purchase that cannot go through (unknown book, not enough stock)."""
+
+
+def is_retryable(exc):
+    return getattr(exc, "errno", None) in RETRYABLE_ERRNOS
+
+
+def with_retry(fn, retries=MAX_RETRIES):
+    """Call fn(); on deadlock / lock timeout sleep with backoff and try again."""
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            time.sleep(BACKOFF_BASE * (2 ** attempt) * (1 + random.random()))
+
+
+def _book(cur, b_id):
+    """
+    (price, genre, slots) of b_id, read before the transaction's first write.
+    The price is the resolved one: the sale price while a promotion runs (bookstore_pricing).
+    """
+    cur.execute("SELECT price, sale_price, genre, slots FROM Books WHERE b_id = %s", (b_id,))
+    row = cur.fetchone()
+    if row is None:
+        raise PurchaseError("Book not found.")
+    price, sale_price, genre, slots = row
+    return (price if sale_price is None else sale_price), genre, slots
+
+
+def _take_stock(cur, stock, b_id, qty, ref):
+    """Sell qty copies inside the caller's transaction (stock: its StockChange)."""
+    try:
+        stock.take(cur, b_id, qty, ref)
+    except StockError as e:
+        raise PurchaseError(str(e)) from None
+
+
+def _purchase_once(connect, b_id, cust_id, qty):
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        price, genre, slots = _book(cur, b_id)
+        with stock_view.changing([b_id], {b_id: slots}) as stock:
+            _take_stock(cur, stock, b_id, qty, f"customer {cust_id}")
+            total = price * qty
+            today = date.today()
+            cur.execute("INSERT INTO Reports (b_id, c_id, date_of_purchase, quantity, price) "
+                        "VALUES (%s,%s,%s,%s,%s)", (b_id, cust_id, today, qty, total))
+            r_no = cur.lastrowid
+            record_sales(cur, today, cust_id, [(b_id, genre, qty, total)])
+            conn.commit()
+        return r_no, total
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def purchase_book(b_id, cust_id, qty, connect=get_connection, retries=MAX_RETRIES):
+    """
+    Buy `qty` copies of b_id for cust_id in one transaction.
+    Returns (r_no, total). Raises PurchaseError if the book is missing or
+    there isn't enough stock.
+    """
+    if qty <= 0:
+        raise PurchaseError("Quantity must be at least 1.")
+    return with_retry(lambda: _purchase_once(connect, b_id, cust_id, qty), retries)
+
+
+def _reserve_once(connect, b_id, qty):
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        price, genre, slots = _book(cur, b_id)
+        with stock_view.changing([b_id], {b_id: slots}) as stock:
+            _take_stock(cur, stock, b_id, qty, "write-behind sale")
+            conn.commit()
+        return price * qty, genre
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def reserve_stock(b_id, qty, connect=get_connection, retries=MAX_RETRIES):
+    """
+    Take `qty` copies of b_id off the shelf and commit, without writing the
+    Reports row (the write-behind ledger in bookstore_ledger does that).
+    Returns (total, genre). Raises PurchaseError like purchase_book.
+    """
+    if qty <= 0:
+        raise PurchaseError("Quantity must be at least 1.")
+    return with_retry(lambda: _reserve_once(connect, b_id, qty), retries)
+
+
+# ---------- cart ----------
+# A cart is a plain {b_id: qty} dict (kept in st.session_state["cart"] by the app).
+def add_to_cart(cart, b_id, qty):
+    if qty <= 0:
+        raise PurchaseError("Quantity must be at least 1.")
+    cart[b_id] = cart.get(b_id, 0) + qty
+    return cart
+
+
+def remove_from_cart(cart, b_id):
+    cart.pop(b_id, None)
+    return cart
+
+
+def _checkout_once(connect, cart, cust_id):
+    ids = sorted(cart)
+    marks = ",".join(["%s"] * len(ids))
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        # log-first titles' view locks before the first write (on SQLite the locking read is one)
+        with stock_view.changing(ids) as stock:
+            # lock every row up front, always in b_id order, so two carts can't deadlock
+            cur.execute(f"SELECT b_id, quantity, slots, price, sale_price, genre FROM Books WHERE b_id IN ({marks}) "
+                        "ORDER BY b_id FOR UPDATE", ids)
+            books = {b_id: (quantity, slots, price if sale_price is None else sale_price, genre)
+                     for b_id, quantity, slots, price, sale_price, genre in cur.fetchall()}
+            missing = [b for b in ids if b not in books]
+            if missing:
+                raise PurchaseError(f"Book not found: {', '.join(map(str, missing))}.")
+            try:
+                stock.take_many(cur, cart, {b: books[b][:2] for b in ids}, f"customer {cust_id} cart")
+            except StockError as e:
+                raise PurchaseError(str(e)) from None
+
+            today = date.today()
+            lines = [(b, cart[b], books[b][2] * cart[b]) for b in ids]
+            cur.executemany("INSERT INTO Reports (b_id, c_id, date_of_purchase, quantity, price) "
+                            "VALUES (%s,%s,%s,%s,%s)", [(b, cust_id, today, qty, total) for b, qty, total in lines])
+            record_sales(cur, today, cust_id, [(b, books[b][3], qty, total) for b, qty, total in lines])
+            conn.commit()
+        return lines, sum(total for _, _, total in lines)
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def checkout_cart(cart, cust_id, connect=get_connection, retries=MAX_RETRIES):
+    """
+    Buy everything in `cart` in one transaction: one locking SELECT in b_id
+    order, one conditional bulk UPDATE of the stock (plus one INSERT of the
+    sell events) and one executemany into Reports.
+    Returns ([(b_id, qty, line_total), ...], total). Nothing is bought if any
+    line fails.
+    """
+    if not cart:
+        raise PurchaseError("Cart is empty.")
+    if any(qty <= 0 for qty in cart.values()):
+        raise PurchaseError("Quantity must be at least 1.")
+    return with_retry(lambda: _checkout_once(connect, dict(cart), cust_id), retries)
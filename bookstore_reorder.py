@@ -0,0 +1,224 @@
+"""
+bookstore_reorder.py
+- Low-stock alerts and restock orders driven by each title's sales velocity.
+- Velocity is an exponentially weighted average of units sold per day
+  (half-life VELOCITY_HALF_LIFE days), kept per book in book_velocity and
+  updated incrementally: record_velocity() is one upsert per purchased
+  title, run by bookstore_analytics inside the purchase transaction (and by
+  the ledger worker per batch). Nothing re-reads Reports.
+    book_velocity (b_id)  rate       EWMA of daily units up to the day before `day`
+                          day        last day with sales
+                          day_units  units sold on `day` so far
+                          first_day  first day with sales (bias correction)
+- stock_outlook() turns those rows plus the stock into days-to-stockout (the
+  slot total for a title on stock slots, whose Books.quantity lags);
+  reorder_suggestions() lists titles that will run out within lead time +
+  safety stock, with the quantity needed to cover REORDER_COVER_DAYS more.
+- check_stock(auto_order=True) files the suggestions as restock_orders
+  (one open order per title at a time); receive_restock() puts the stock on
+  the shelf. BOOKSTORE_AUTO_REORDER=1 makes auto ordering the default.
+Usage:
+    python bookstore_bootstrap.py reorder [--auto]
+"""
+
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from bookstore_catalog import catalog_cache
+from bookstore_db import get_connection
+from bookstore_inventory import record_event
+
+VELOCITY_HALF_LIFE = 14       # days
+DECAY = 0.5 ** (1 / VELOCITY_HALF_LIFE)
+
+REORDER_LEAD_DAYS = int(os.environ.get("BOOKSTORE_REORDER_LEAD_DAYS", "7"))       # supplier delivery time
+REORDER_SAFETY_DAYS = int(os.environ.get("BOOKSTORE_REORDER_SAFETY_DAYS", "3"))
+REORDER_COVER_DAYS = int(os.environ.get("BOOKSTORE_REORDER_COVER_DAYS", "30"))     # stock to hold after a delivery
+AUTO_REORDER = os.environ.get("BOOKSTORE_AUTO_REORDER", "0") == "1"
+REBUILD_BATCH = 50000         # daily rows fetched at a time when rebuilding
+
+# Closing out `day` when a later day's sale arrives: fold its units into the
+# average and decay across the days without sales. On MySQL the assignments
+# run left to right, so rate must come before day_units and day.
+UPSERT_VELOCITY = (
+    "INSERT INTO book_velocity (b_id, rate, day, day_units, first_day) VALUES (%s, 0, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE "
+    f"rate = CASE WHEN VALUES(day) > day THEN rate * POW({DECAY!r}, DATEDIFF(VALUES(day), day)) "
+    f"+ {1 - DECAY!r} * day_units * POW({DECAY!r}, DATEDIFF(VALUES(day), day) - 1) ELSE rate END, "
+    "day_units = CASE WHEN VALUES(day) > day THEN VALUES(day_units) ELSE day_units + VALUES(day_units) END, "
+    "day = GREATEST(day, VALUES(day)), "
+    "first_day = LEAST(first_day, VALUES(first_day))"
+)
+
+
+def record_velocity(cur, sales):
+    """
+    Add sales to book_velocity. sales: [(day, b_id, units)], one entry per
+    (day, b_id), sorted by (day, b_id). Runs on the caller's transaction.
+    """
+    cur.executemany(UPSERT_VELOCITY, [(b_id, day, units, day) for day, b_id, units in sales])
+
+
+def rebuild_velocity(cur, batch=REBUILD_BATCH):
+    """
+    Recompute book_velocity from sales_daily_book (backfill / repair). The
+    daily rows are streamed in (b_id, day) order; only one state per title
+    is kept.
+    """
+    cur.execute("DELETE FROM book_velocity")
+    cur.execute("SELECT day, b_id, units FROM sales_daily_book ORDER BY b_id, day")
+    state = {}
+    while True:
+        rows = cur.fetchmany(batch)
+        if not rows:
+            break
+        for day, b_id, units in rows:
+            day = day if isinstance(day, date) else date.fromisoformat(str(day)[:10])
+            if b_id not in state:
+                state[b_id] = [0.0, day, int(units), day]
+                continue
+            s = state[b_id]
+            gap = (day - s[1]).days
+            s[0] = s[0] * DECAY ** gap + (1 - DECAY) * s[2] * DECAY ** (gap - 1)
+            s[1], s[2] = day, int(units)
+    cur.executemany("INSERT INTO book_velocity (b_id, rate, day, day_units, first_day) VALUES (%s, %s, %s, %s, %s)",
+                    [(b_id, rate, day, units, first) for b_id, (rate, day, units, first) in sorted(state.items())])
+
+
+def velocity(rate, day_units, gap, age):
+    """
+    Units per day from book_velocity columns (scalars or NumPy arrays), as of
+    the end of a day `gap` days after `day` and `age` days after first_day.
+    Corrected for the average's start-up bias, so a title's first days
+    already give its true rate.
+    """
+    gap = np.maximum(gap, 0)
+    raw = rate * DECAY ** (gap + 1) + (1 - DECAY) * day_units * DECAY ** gap
+    return raw / (1 - DECAY ** np.maximum(age + 1, 1))
+
+
+def stock_outlook(today=None, connect=get_connection):
+    """
+    Every title with sales history: b_id, b_name, quantity, velocity (units/day),
+    days_left (inf when it isn't selling), on_order (open restock units).
+    """
+    today = today or date.today()
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        # day offsets come back as integers: no per-row date conversion
+        cur.execute(
+            "SELECT b.b_id, b.b_name, COALESCE(s.units, b.quantity), v.rate, v.day_units, DATEDIFF(%s, v.day), "
+            "DATEDIFF(%s, v.first_day), COALESCE(o.units, 0) FROM book_velocity v JOIN Books b ON b.b_id = v.b_id "
+            "LEFT JOIN (SELECT b_id, SUM(quantity) AS units FROM restock_orders WHERE status = 'open' "
+            "GROUP BY b_id) o ON o.b_id = v.b_id "
+            "LEFT JOIN (SELECT b_id, SUM(quantity) AS units FROM stock_slots GROUP BY b_id) s ON s.b_id = v.b_id",
+            (today, today))
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+    frame = pd.DataFrame(rows, columns=["b_id", "b_name", "quantity", "rate", "day_units", "gap", "age", "on_order"])
+    out = frame[["b_id", "b_name", "quantity", "on_order"]].astype({"quantity": np.int64, "on_order": np.int64})
+    v = velocity(frame["rate"].to_numpy(np.float64), frame["day_units"].to_numpy(np.int64),
+                 frame["gap"].to_numpy(np.int64), frame["age"].to_numpy(np.int64))
+    out["velocity"] = v.round(3)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["days_left"] = np.where(v > 1e-9, out["quantity"] / np.maximum(v, 1e-9), np.inf).round(1)
+    return out.sort_values("days_left", kind="stable").reset_index(drop=True)
+
+
+def reorder_suggestions(today=None, lead_days=REORDER_LEAD_DAYS, safety_days=REORDER_SAFETY_DAYS,
+                        cover_days=REORDER_COVER_DAYS, connect=get_connection):
+    """
+    Titles whose stock, counting open restock orders, runs out within
+    lead_days + safety_days at the current velocity. `order` is what brings
+    them to cover_days of stock after the lead time.
+    """
+    outlook = stock_outlook(today, connect)
+    if outlook.empty:
+        return outlook.assign(order=[])
+    reorder_point = outlook["velocity"] * (lead_days + safety_days)
+    low = outlook[(outlook["quantity"] + outlook["on_order"] <= reorder_point) & (outlook["velocity"] > 0)].copy()
+    need = np.ceil(low["velocity"] * (lead_days + cover_days)) - low["quantity"] - low["on_order"]
+    low["order"] = np.maximum(need, 1).astype(np.int64)
+    return low.reset_index(drop=True)
+
+
+def create_restock_orders(lines, reason="velocity", connect=get_connection):
+    """Open one restock order per (b_id, quantity); titles with an open order are skipped. Returns the count."""
+    if not lines:
+        return 0
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        ids = sorted({b for b, _ in lines})
+        marks = ",".join(["%s"] * len(ids))
+        cur.execute(f"SELECT b_id FROM restock_orders WHERE status = 'open' AND b_id IN ({marks})", ids)
+        open_ids = {r[0] for r in cur.fetchall()}
+        new = [(b, q, reason[:200]) for b, q in sorted(lines) if b not in open_ids]
+        cur.executemany("INSERT INTO restock_orders (b_id, quantity, status, reason) VALUES (%s, %s, 'open', %s)", new)
+        conn.commit()
+        return len(new)
+    finally:
+        cur.close()
+        conn.close()
+
+
+def order_lines(suggestions):
+    """reorder_suggestions() rows as [(b_id, quantity)] for create_restock_orders()."""
+    return [(int(b), int(q)) for b, q in zip(suggestions["b_id"], suggestions["order"])]
+
+
+def check_stock(auto_order=AUTO_REORDER, today=None, connect=get_connection):
+    """
+    Current reorder suggestions; with auto_order, also file them as restock
+    orders. Returns (suggestions, orders created).
+    """
+    suggestions = reorder_suggestions(today, connect=connect)
+    created = 0
+    if auto_order and not suggestions.empty:
+        created = create_restock_orders(order_lines(suggestions), "auto: below reorder point", connect)
+    return suggestions, created
+
+
+def open_orders(connect=get_connection):
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT o.o_id, o.b_id, b.b_name, o.quantity, o.created_at, o.reason FROM restock_orders o "
+                    "LEFT JOIN Books b ON b.b_id = o.b_id WHERE o.status = 'open' ORDER BY o.o_id")
+        columns = [d[0] for d in cur.description]
+        return columns, cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def receive_restock(o_id, connect=get_connection):
+    """Mark an open order received and add its quantity to the title's stock, in one transaction. False if not open."""
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT b_id, quantity FROM restock_orders WHERE o_id = %s AND status = 'open' FOR UPDATE",
+                    (o_id,))
+        row = cur.fetchone()
+        if row is None:
+            conn.rollback()
+            return False
+        b_id, qty = row
+        cur.execute("UPDATE restock_orders SET status = 'received', received_at = CURRENT_TIMESTAMP "
+                    "WHERE o_id = %s", (o_id,))
+        record_event(cur, b_id, "receive", qty, f"restock order {o_id}")
+        conn.commit()
+        catalog_cache.invalidate("Books")
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
@@ -0,0 +1,154 @@
+"""
+bookstore_reporting.py
+- Vectorized sales reporting over Reports for the CLI and Streamlit views.
+- Reports is read in keyset chunks (CHUNK_ROWS rows at a time) and each chunk
+  becomes a typed, columnar DataFrame:
+      r_no int64, b_id int32, c_id int32 (-1 = deleted), day datetime64[D],
+      quantity int32, paise int64 (price in fixed-point paise, no float drift)
+  Both are net of returns (Reports.returned), so refunds need no join.
+- ReportAccumulator folds chunks into totals, revenue per day (with a moving
+  average) and per-customer lifetime value using NumPy/pandas group-bys, so
+  memory is bounded by the chunk size plus the number of days/customers.
+"""
+
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+from bookstore_db import get_connection
+
+CHUNK_ROWS = 100000
+MOVING_AVERAGE_DAYS = 7
+
+REPORT_COLUMNS = ["r_no", "b_id", "c_id", "day", "quantity", "paise"]
+# net of returns: what is left of each purchase, rounded like bookstore_returns.refunded_paise
+_SELECT = ("SELECT r_no, COALESCE(b_id, -1), COALESCE(c_id, -1), date_of_purchase, quantity - returned, "
+           "ROUND(price * 100) - ROUND(ROUND(price * 100) * returned * 1.0 / quantity) FROM Reports")
+
+
+def _column(rows, i, dtype):
+    # one C-level pass per column; transposing with zip(*rows) allocates a
+    # tuple per column and spends most of its time in the garbage collector
+    return np.fromiter(map(itemgetter(i), rows), dtype=dtype, count=len(rows))
+
+
+def _day_column(rows, i):
+    # a chunk only spans a handful of distinct dates: convert those, then broadcast
+    codes, uniques = pd.factorize(_column(rows, i, object))
+    return np.array([str(d)[:10] for d in uniques], dtype="datetime64[D]")[codes]
+
+
+def frame_from_rows(rows):
+    """Turn fetchall() tuples (in REPORT_COLUMNS order) into a typed columnar DataFrame."""
+    return pd.DataFrame({
+        "r_no": _column(rows, 0, np.int64),
+        "b_id": _column(rows, 1, np.int32),
+        "c_id": _column(rows, 2, np.int32),
+        "day": _day_column(rows, 3) if rows else np.empty(0, "datetime64[D]"),
+        "quantity": _column(rows, 4, np.int32),
+        "paise": _column(rows, 5, np.int64),
+    })
+
+
+def iter_report_chunks(where=None, params=(), chunk_rows=CHUNK_ROWS, connect=get_connection):
+    """Yield Reports as typed DataFrames of at most chunk_rows rows, in r_no order."""
+    after = 0
+    while True:
+        sql = _SELECT + " WHERE r_no > %s"
+        if where:
+            sql += f" AND ({where})"
+        sql += " ORDER BY r_no LIMIT %s"
+        conn = connect()
+        cur = conn.cursor()
+        try:
+            cur.execute(sql, (after, *params, chunk_rows))
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+        if not rows:
+            return
+        yield frame_from_rows(rows)
+        if len(rows) < chunk_rows:
+            return
+        after = rows[-1][0]
+
+
+class ReportAccumulator:
+    """Folds report chunks into running aggregates; read totals() / daily() / lifetime_value() at the end."""
+
+    def __init__(self):
+        self.rows = 0
+        self.units = 0
+        self.paise = 0
+        self._daily = []        # per-chunk Series day -> paise, combined lazily
+        self._customers = []    # per-chunk frames c_id -> purchases/units/paise/first/last
+
+    def add(self, frame):
+        self.rows += len(frame)
+        self.units += int(frame["quantity"].sum())
+        self.paise += int(frame["paise"].sum())
+        self._daily.append(frame.groupby("day")["paise"].sum())
+        known = frame[frame["c_id"] >= 0]
+        self._customers.append(known.groupby("c_id").agg(
+            purchases=("r_no", "size"), units=("quantity", "sum"), paise=("paise", "sum"),
+            first=("day", "min"), last=("day", "max")))
+        # fold every so often so the per-chunk pieces never pile up
+        if len(self._daily) >= 16:
+            self._compact()
+        return self
+
+    def _compact(self):
+        if len(self._daily) > 1:
+            self._daily = [pd.concat(self._daily).groupby(level=0).sum()]
+        if len(self._customers) > 1:
+            self._customers = [pd.concat(self._customers).groupby(level=0).agg(
+                {"purchases": "sum", "units": "sum", "paise": "sum", "first": "min", "last": "max"})]
+
+    def daily(self, window=MOVING_AVERAGE_DAYS):
+        """Revenue per calendar day (gaps filled with 0) and its moving average, in rupees."""
+        self._compact()
+        if not self._daily or self._daily[0].empty:
+            return pd.DataFrame(columns=["revenue", "moving_avg"])
+        paise = self._daily[0].sort_index()
+        paise = paise.reindex(pd.date_range(paise.index.min(), paise.index.max(), freq="D"), fill_value=0)
+        out = pd.DataFrame({"revenue": paise / 100})
+        out["moving_avg"] = (paise.rolling(window, min_periods=1).mean() / 100).round(2)
+        out.index.name = "day"
+        return out
+
+    def lifetime_value(self):
+        """Per-customer purchases, units, revenue (rupees) and active span, best first."""
+        self._compact()
+        if not self._customers or self._customers[0].empty:
+            return pd.DataFrame(columns=["purchases", "units", "revenue", "first", "last", "avg_purchase"])
+        ltv = self._customers[0].copy()
+        ltv["revenue"] = ltv.pop("paise") / 100
+        ltv["avg_purchase"] = (ltv["revenue"] / ltv["purchases"]).round(2)
+        return ltv.sort_values("revenue", ascending=False)
+
+    def totals(self):
+        return {
+            "purchases": self.rows,
+            "units": self.units,
+            "revenue": self.paise / 100,
+            "avg_purchase": round(self.paise / self.rows / 100, 2) if self.rows else 0.0,
+        }
+
+
+def summarize(chunks):
+    acc = ReportAccumulator()
+    for frame in chunks:
+        acc.add(frame)
+    return acc
+
+
+def sales_report(connect=get_connection):
+    """Aggregates over all of Reports."""
+    return summarize(iter_report_chunks(connect=connect))
+
+
+def customer_report(cust_id, connect=get_connection):
+    """Aggregates over one customer's purchases (served by the (c_id, r_no) index)."""
+    return summarize(iter_report_chunks("c_id = %s", (cust_id,), connect=connect))
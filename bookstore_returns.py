@@ -0,0 +1,122 @@
+"""
+bookstore_returns.py
+- Returns and refunds. A refund names the purchase it reverses (Reports.r_no)
+  and how many of its copies come back; several partial returns of one
+  purchase add up to at most what was bought.
+- Reports.returned counts the copies of a purchase refunded so far. A refund
+  raises it with one conditional UPDATE (returned + qty <= quantity), so two
+  refunds of the same copies can't both go through: a double click, or a
+  customer and a staff member at once, get one refund and one
+  "already refunded".
+- The same transaction writes the refunds row, puts the copies back on the
+  shelf (bookstore_inventory.record_event) and takes the refund off the
+  rollups (bookstore_analytics.record_refunds). Net totals per book, per day
+  and per customer stay in the rollup rows, and a purchase's own row says
+  how much of it is left, so no view has to match refunds against Reports.
+- Refund amounts are the purchase's price pro rata, in paise, rounded so that
+  refunding every copy gives back exactly the price paid.
+- Customers return their own purchases within RETURN_WINDOW_DAYS; staff can
+  refund any purchase.
+"""
+
+import os
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from bookstore_analytics import record_refunds
+from bookstore_catalog import catalog_cache
+from bookstore_db import as_date, fetch_page, get_connection
+from bookstore_inventory import record_event
+from bookstore_purchase import MAX_RETRIES, with_retry
+
+RETURN_WINDOW_DAYS = int(os.environ.get("BOOKSTORE_RETURN_WINDOW_DAYS", "30"))
+
+
+class RefundError(Exception):
+    """A refund that cannot be made (unknown purchase, nothing left to return, window closed)."""
+
+
+def _paise(price):
+    return int((Decimal(str(price)) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def refunded_paise(paise, quantity, returned):
+    """What the first `returned` of `quantity` copies bought for `paise` are worth, rounded half up."""
+    return (2 * paise * returned + quantity) // (2 * quantity)
+
+
+def _refund_once(connect, r_no, qty, reason, refunded_by, cust_id):
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT b_id, c_id, date_of_purchase, quantity, price, returned FROM Reports WHERE r_no = %s",
+                    (r_no,))
+        row = cur.fetchone()
+        # a customer only sees their own purchases
+        if row is None or (cust_id is not None and row[1] != cust_id):
+            raise RefundError("Purchase not found.")
+        b_id, c_id, bought, quantity, price, returned = row
+        today = date.today()
+        if cust_id is not None and as_date(bought) < today - timedelta(days=RETURN_WINDOW_DAYS):
+            raise RefundError(f"Returns are accepted within {RETURN_WINDOW_DAYS} days of purchase.")
+        if qty > quantity - returned:
+            raise RefundError("This purchase has already been refunded." if returned == quantity else
+                              f"Only {quantity - returned} of the {quantity} copies can still be returned.")
+
+        # the database has the last word: a refund that got in first leaves 0 rows here
+        cur.execute("UPDATE Reports SET returned = returned + %s WHERE r_no = %s AND returned + %s <= quantity",
+                    (qty, r_no, qty))
+        if cur.rowcount != 1:
+            raise RefundError("This purchase has already been refunded.")
+        cur.execute("SELECT returned FROM Reports WHERE r_no = %s", (r_no,))
+        after = cur.fetchone()[0]
+        paid = _paise(price)
+        amount = Decimal(refunded_paise(paid, quantity, after) - refunded_paise(paid, quantity, after - qty)).scaleb(-2)
+        cur.execute("INSERT INTO refunds (r_no, b_id, c_id, day, quantity, amount, reason, refunded_by) "
+                    "VALUES (%s,%s,%s,%s,%s,%s,%s,%s)", (r_no, b_id, c_id, today, qty, amount, reason, refunded_by))
+        rf_no = cur.lastrowid
+
+        genre = None
+        if b_id is not None:
+            # the copies go back on the shelf; a deleted title just gets its money back
+            record_event(cur, b_id, "return", qty, f"refund {rf_no}")
+            cur.execute("SELECT genre FROM Books WHERE b_id = %s", (b_id,))
+            genre = cur.fetchone()[0]
+        record_refunds(cur, today, c_id, [(b_id, genre, qty, amount)])
+        conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    if b_id is not None:
+        catalog_cache.invalidate("Books")
+    return rf_no, amount
+
+
+def refund_purchase(r_no, qty, reason, refunded_by, cust_id=None, connect=get_connection, retries=MAX_RETRIES):
+    """
+    Return qty copies of purchase r_no and refund them, in one transaction.
+    cust_id: a customer's own return (their purchases only, within
+    RETURN_WINDOW_DAYS); None for staff. Returns (rf_no, amount); raises
+    RefundError.
+    """
+    if qty <= 0:
+        raise RefundError("Quantity must be at least 1.")
+    return with_retry(lambda: _refund_once(connect, r_no, qty, reason, refunded_by, cust_id), retries)
+
+
+def return_purchase(r_no, qty, cust_id, login_id, reason=None, connect=get_connection):
+    """A customer's return of their own purchase; see refund_purchase."""
+    return refund_purchase(r_no, qty, reason or "customer return", login_id, cust_id, connect)
+
+
+def refunds_page(after=None, page_size=50, cust_id=None, connect=get_connection):
+    """Keyset page of refunds, newest last: (columns, rows, next_after) like fetch_page."""
+    if cust_id is None:
+        return fetch_page("refunds", "rf_no", after, page_size, connect=connect)
+    return fetch_page("refunds", "rf_no", after, page_size, "c_id = %s", (cust_id,), connect)
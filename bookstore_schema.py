@@ -0,0 +1,519 @@
+"""
+bookstore_schema.py
+- Versioned schema migrations for the bookstore database.
+- Each migration runs once; the applied version is recorded in schema_version.
+  To change the schema, append a new (version, description, statements) entry
+  to MIGRATIONS - never edit one that has already shipped. A statement may
+  also be a function taking the cursor (for data backfills). Seeding the
+  demo data is one of them, so the recorded version alone tells the
+  bootstrap whether there is anything left to do.
+- `python bookstore_schema.py explain` checks that the hot queries of both
+  apps are served by an index: no full table scan in MySQL's EXPLAIN or in
+  SQLite's EXPLAIN QUERY PLAN (the bench's "indexes" scenario runs it).
+- The DDL is MySQL's; the SQLite backend translates it (bookstore_db.to_sqlite).
+"""
+
+import re
+import sys
+
+from bookstore_analytics import rebuild_rollups
+from bookstore_auth import hash_stored_passwords
+from bookstore_authors import author_ids_auto_increment, backfill_book_authors
+from bookstore_db import DB_ERRORS, get_backend, get_connection
+from bookstore_reorder import rebuild_velocity
+
+# ---------- seed data ----------
+# (table, INSERT statement, rows); a table is only seeded while it is empty
+SEED_DATA = [
+    ("Authentication", "INSERT INTO Authentication (login_id, password) VALUES (%s, %s)", [
+        ('chirag', 'admin'),
+        ('prachi', '1234'),
+        ('tirthraj', '1234'),
+        ('smera', '1234'),
+        ('ayush', '1234'),
+        ('sairaj', '1234'),
+        ('sankalp', '1234')
+    ]),
+    ("Customer", "INSERT INTO Customer (cust_id, c_name, address, phoneno, login_id) VALUES (%s, %s, %s, %s, %s)", [
+        (1, 'chirag', 'Mumbai', '9999999999', 'chirag'),
+        (2, 'prachi', 'Pune', '9876543210', 'prachi'),
+        (3, 'tirthraj', 'Delhi', '9123456780', 'tirthraj'),
+        (4, 'smera', 'Chennai', '9988776655', 'smera'),
+        (5, 'ayush', 'Bangalore', '9112233445', 'ayush'),
+        (6, 'sairaj', 'Hyderabad', '9900887766', 'sairaj'),
+        (7, 'sankalp', 'Ahmedabad', '9877898765', 'sankalp')
+    ]),
+    ("Author", "INSERT INTO Author (a_id, a_name) VALUES (%s, %s)", [
+        (1, 'J.K. Rowling'),
+        (2, 'George Orwell'),
+        (3, 'Chetan Bhagat'),
+        (4, 'Jane Austen'),
+        (5, 'Dan Brown'),
+        (6, 'Agatha Christie'),
+        (7, 'Paulo Coelho'),
+        (8, 'Mark Manson'),
+        (9, 'Stephen King'),
+        (10, 'Khaled Hosseini')
+    ]),
+    ("Books", "INSERT INTO Books (b_id, b_name, a_name, genre, quantity, price) VALUES (%s, %s, %s, %s, %s, %s)", [
+        (101, 'Harry Potter', 'J.K. Rowling', 'Fantasy', 10, 499.00),
+        (102, '1984', 'George Orwell', 'Dystopian', 8, 349.00),
+        (103, '2 States', 'Chetan Bhagat', 'Romance', 15, 299.00),
+        (104, 'Pride and Prejudice', 'Jane Austen', 'Classic', 12, 399.00),
+        (105, 'The Da Vinci Code', 'Dan Brown', 'Thriller', 20, 450.00),
+        (106, 'Murder on the Orient Express', 'Agatha Christie', 'Mystery', 14, 375.00),
+        (107, 'The Alchemist', 'Paulo Coelho', 'Philosophy', 18, 320.00),
+        (108, 'You Are Not Alone', 'Mark Manson', 'Self-Help', 22, 299.00),
+        (109, 'The Shining', 'Stephen King', 'Horror', 9, 425.00),
+        (110, 'The Kite Runner', 'Khaled Hosseini', 'Drama', 16, 380.00)
+    ]),
+    ("BookAuthor", "INSERT INTO BookAuthor (b_id, a_id) VALUES (%s, %s)",
+     [(101, 1), (102, 2), (103, 3), (104, 4), (105, 5), (106, 6), (107, 7), (108, 8), (109, 9), (110, 10)]),
+    # Reports (empty initially) - skip
+]
+
+
+def seed_if_empty(cur):
+    """Insert the seed rows into every table that is still empty."""
+    for table, insert, rows in SEED_DATA:
+        cur.execute(f"SELECT 1 FROM {table} LIMIT 1")
+        if cur.fetchone() is None:
+            cur.executemany(insert, rows)
+
+
+MIGRATIONS = [
+    (1, "baseline tables", [
+        """
+        CREATE TABLE IF NOT EXISTS Authentication (
+            login_id VARCHAR(50) PRIMARY KEY,
+            password VARCHAR(100) NOT NULL
+        ) ENGINE=InnoDB;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Customer (
+            cust_id INT PRIMARY KEY,
+            c_name VARCHAR(100) NOT NULL,
+            address VARCHAR(200) NOT NULL,
+            phoneno VARCHAR(15) NOT NULL,
+            login_id VARCHAR(50),
+            FOREIGN KEY (login_id) REFERENCES Authentication(login_id)
+               ON DELETE SET NULL ON UPDATE CASCADE
+        ) ENGINE=InnoDB;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Author (
+            a_id INT PRIMARY KEY,
+            a_name VARCHAR(100) NOT NULL
+        ) ENGINE=InnoDB;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Books (
+            b_id INT PRIMARY KEY,
+            b_name VARCHAR(100) NOT NULL,
+            a_name VARCHAR(100) NOT NULL,
+            genre VARCHAR(50) NOT NULL,
+            quantity INT NOT NULL CHECK (quantity >= 0),
+            price DECIMAL(10,2) NOT NULL CHECK (price >= 0)
+        ) ENGINE=InnoDB;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Staff (
+            s_id INT PRIMARY KEY,
+            s_name VARCHAR(100) NOT NULL,
+            s_phone VARCHAR(15) NOT NULL,
+            designation VARCHAR(50) NOT NULL
+        ) ENGINE=InnoDB;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Reports (
+            r_no INT AUTO_INCREMENT PRIMARY KEY,
+            b_id INT,
+            c_id INT,
+            date_of_purchase DATE NOT NULL,
+            quantity INT NOT NULL CHECK (quantity > 0),
+            price DECIMAL(10,2) NOT NULL CHECK (price >= 0),
+            FOREIGN KEY (b_id) REFERENCES Books(b_id) ON DELETE SET NULL ON UPDATE CASCADE,
+            FOREIGN KEY (c_id) REFERENCES Customer(cust_id) ON DELETE SET NULL ON UPDATE CASCADE
+        ) ENGINE=InnoDB;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS BookAuthor (
+            b_id INT,
+            a_id INT,
+            PRIMARY KEY (b_id, a_id),
+            FOREIGN KEY (b_id) REFERENCES Books(b_id) ON DELETE CASCADE ON UPDATE CASCADE,
+            FOREIGN KEY (a_id) REFERENCES Author(a_id) ON DELETE CASCADE ON UPDATE CASCADE
+        ) ENGINE=InnoDB;
+        """
+    ]),
+    (2, "Reports.r_no AUTO_INCREMENT", [
+        # databases created before the purchase service have a plain INT key
+        "ALTER TABLE Reports MODIFY r_no INT NOT NULL AUTO_INCREMENT",
+    ]),
+    (3, "secondary indexes for history, browsing, reporting and login", [
+        # purchase history: WHERE c_id = ? ORDER BY r_no (keyset pages)
+        "CREATE INDEX idx_reports_cust_rno ON Reports (c_id, r_no)",
+        # per-customer reporting by date range
+        "CREATE INDEX idx_reports_cust_date ON Reports (c_id, date_of_purchase)",
+        # per-book sales / reporting by date range
+        "CREATE INDEX idx_reports_book_date ON Reports (b_id, date_of_purchase)",
+        "CREATE INDEX idx_reports_date ON Reports (date_of_purchase, b_id, quantity, price)",
+        # genre / author browsing, keyset-ordered by b_id
+        "CREATE INDEX idx_books_genre ON Books (genre, b_id)",
+        "CREATE INDEX idx_books_author ON Books (a_name, b_id)",
+        # login -> cust_id without touching the Customer rows
+        "CREATE INDEX idx_customer_login ON Customer (login_id, cust_id)",
+    ]),
+    (4, "sales rollup tables (bookstore_analytics)", [
+        """
+        CREATE TABLE IF NOT EXISTS sales_daily_book (
+            day DATE NOT NULL,
+            b_id INT NOT NULL,
+            genre VARCHAR(50) NOT NULL,
+            units INT NOT NULL,
+            revenue DECIMAL(14,2) NOT NULL,
+            PRIMARY KEY (day, b_id)
+        ) ENGINE=InnoDB;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sales_monthly_book (
+            month DATE NOT NULL,
+            b_id INT NOT NULL,
+            genre VARCHAR(50) NOT NULL,
+            units INT NOT NULL,
+            revenue DECIMAL(14,2) NOT NULL,
+            PRIMARY KEY (month, b_id)
+        ) ENGINE=InnoDB;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS customer_sales (
+            c_id INT PRIMARY KEY,
+            purchases INT NOT NULL,
+            units INT NOT NULL,
+            revenue DECIMAL(14,2) NOT NULL,
+            last_purchase DATE NOT NULL
+        ) ENGINE=InnoDB;
+        """,
+        "CREATE INDEX idx_customer_sales_revenue ON customer_sales (revenue)",
+        # backfill from whatever is already in Reports (refunds only exist from migration 12)
+        lambda cur: rebuild_rollups(cur, refunds=False),
+    ]),
+    # databases seeded before this migration already have rows; it leaves them alone
+    (5, "seed data", [seed_if_empty]),
+    (6, "write-behind ledger high-water marks (bookstore_ledger)", [
+        # last journal seq applied to Reports, per local journal; updated in
+        # the same transaction as the Reports rows, so replay is exactly-once
+        """
+        CREATE TABLE IF NOT EXISTS ledger_applied (
+            journal_id CHAR(32) PRIMARY KEY,
+            seq BIGINT NOT NULL
+        ) ENGINE=InnoDB;
+        """,
+    ]),
+    (7, "hashed passwords and roles (bookstore_auth)", [
+        "ALTER TABLE Authentication MODIFY password VARCHAR(255) NOT NULL",
+        "ALTER TABLE Authentication ADD COLUMN role VARCHAR(20) NOT NULL DEFAULT 'customer'",
+        # the one admin account that used to be hard-coded in the apps
+        "UPDATE Authentication SET role = 'admin' WHERE login_id = 'chirag'",
+        hash_stored_passwords,
+    ]),
+    (8, "sales velocity and restock orders (bookstore_reorder)", [
+        """
+        CREATE TABLE IF NOT EXISTS book_velocity (
+            b_id INT PRIMARY KEY,
+            rate DOUBLE NOT NULL,
+            day DATE NOT NULL,
+            day_units INT NOT NULL,
+            first_day DATE NOT NULL
+        ) ENGINE=InnoDB;
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS restock_orders (
+            o_id INT AUTO_INCREMENT PRIMARY KEY,
+            b_id INT NOT NULL,
+            quantity INT NOT NULL CHECK (quantity > 0),
+            status VARCHAR(20) NOT NULL,
+            reason VARCHAR(200) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            received_at TIMESTAMP NULL,
+            FOREIGN KEY (b_id) REFERENCES Books(b_id) ON DELETE CASCADE ON UPDATE CASCADE
+        ) ENGINE=InnoDB;
+        """,
+        # open orders per title (reorder suggestions, duplicate check)
+        "CREATE INDEX idx_restock_status_book ON restock_orders (status, b_id)",
+        # backfill from the daily rollup
+        rebuild_velocity,
+    ]),
+    (9, "authors only through BookAuthor (bookstore_authors)", [
+        # name -> a_id when forms and imports link authors
+        "CREATE INDEX idx_author_name ON Author (a_name)",
+        # titles whose author was only ever written into Books.a_name
+        backfill_book_authors,
+        # browse by author: WHERE a_id = ? ORDER BY b_id (keyset pages)
+        "CREATE INDEX idx_bookauthor_author ON BookAuthor (a_id, b_id)",
+        "DROP INDEX idx_books_author ON Books",
+        "ALTER TABLE Books DROP COLUMN a_name",
+    ]),
+    (10, "inventory event log; Books.quantity becomes its snapshot (bookstore_inventory)", [
+        # one row per stock change, numbered per title; stock is the level after it
+        """
+        CREATE TABLE IF NOT EXISTS inventory_events (
+            b_id INT NOT NULL,
+            seq INT NOT NULL,
+            kind VARCHAR(10) NOT NULL,
+            delta INT NOT NULL,
+            stock INT NOT NULL CHECK (stock >= 0),
+            ref VARCHAR(100) NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (b_id, seq),
+            FOREIGN KEY (b_id) REFERENCES Books(b_id) ON DELETE CASCADE ON UPDATE CASCADE
+        ) ENGINE=InnoDB;
+        """,
+        # Books.quantity is the stock after event stock_seq; 0 = before the first
+        # event, so existing titles start with their current quantity as the opening balance
+        "ALTER TABLE Books ADD COLUMN stock_seq INT NOT NULL DEFAULT 0",
+    ]),
+    (11, "sharded stock counters for hot titles (bookstore_inventory)", [
+        # sold: units taken from the slot that aren't in inventory_events yet
+        """
+        CREATE TABLE IF NOT EXISTS stock_slots (
+            b_id INT NOT NULL,
+            slot INT NOT NULL,
+            quantity INT NOT NULL CHECK (quantity >= 0),
+            sold INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (b_id, slot),
+            FOREIGN KEY (b_id) REFERENCES Books(b_id) ON DELETE CASCADE ON UPDATE CASCADE
+        ) ENGINE=InnoDB;
+        """,
+        # how many stock_slots rows hold the title's stock; 0 = on the event log
+        "ALTER TABLE Books ADD COLUMN slots INT NOT NULL DEFAULT 0",
+    ]),
+    (12, "returns and refunds (bookstore_returns)", [
+        # one row per refund; a purchase can be returned in several parts
+        """
+        CREATE TABLE IF NOT EXISTS refunds (
+            rf_no INT AUTO_INCREMENT PRIMARY KEY,
+            r_no INT NOT NULL,
+            b_id INT NULL,
+            c_id INT NULL,
+            day DATE NOT NULL,
+            quantity INT NOT NULL CHECK (quantity > 0),
+            amount DECIMAL(10,2) NOT NULL CHECK (amount >= 0),
+            reason VARCHAR(200) NULL,
+            refunded_by VARCHAR(50) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (r_no) REFERENCES Reports(r_no) ON DELETE CASCADE ON UPDATE CASCADE
+        ) ENGINE=InnoDB;
+        """,
+        "CREATE INDEX idx_refunds_purchase ON refunds (r_no)",
+        # a customer's refunds, keyset-paged
+        "CREATE INDEX idx_refunds_customer ON refunds (c_id, rf_no)",
+        # copies of the purchase refunded so far; the guard against refunding twice
+        "ALTER TABLE Reports ADD COLUMN returned INT NOT NULL DEFAULT 0",
+        # rollups hold net units / revenue from here on, with what came back alongside
+        "ALTER TABLE sales_daily_book ADD COLUMN returned_units INT NOT NULL DEFAULT 0",
+        "ALTER TABLE sales_daily_book ADD COLUMN refunds DECIMAL(14,2) NOT NULL DEFAULT 0",
+        "ALTER TABLE sales_monthly_book ADD COLUMN returned_units INT NOT NULL DEFAULT 0",
+        "ALTER TABLE sales_monthly_book ADD COLUMN refunds DECIMAL(14,2) NOT NULL DEFAULT 0",
+        "ALTER TABLE customer_sales ADD COLUMN returned_units INT NOT NULL DEFAULT 0",
+        "ALTER TABLE customer_sales ADD COLUMN refunds DECIMAL(14,2) NOT NULL DEFAULT 0",
+    ]),
+    (13, "promotions, resolved sale prices and price history (bookstore_pricing)", [
+        # one title (b_id) or one genre; state moves scheduled -> active -> ended as the window passes
+        """
+        CREATE TABLE IF NOT EXISTS promotions (
+            promo_id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            b_id INT NULL,
+            genre VARCHAR(50) NULL,
+            kind VARCHAR(10) NOT NULL,
+            amount DECIMAL(10,2) NOT NULL CHECK (amount > 0),
+            starts_at DATETIME NOT NULL,
+            ends_at DATETIME NOT NULL,
+            state VARCHAR(10) NOT NULL DEFAULT 'scheduled',
+            created_by VARCHAR(50) NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            CHECK ((b_id IS NULL) <> (genre IS NULL)),
+            FOREIGN KEY (b_id) REFERENCES Books(b_id) ON DELETE CASCADE ON UPDATE CASCADE
+        ) ENGINE=InnoDB;
+        """,
+        # the next window to open / close, and the active promotions of a title or genre
+        "CREATE INDEX idx_promotions_starts ON promotions (state, starts_at)",
+        "CREATE INDEX idx_promotions_ends ON promotions (state, ends_at)",
+        "CREATE INDEX idx_promotions_book ON promotions (b_id, state)",
+        "CREATE INDEX idx_promotions_genre ON promotions (genre, state)",
+        # one row per change of a title's price: was -> price, from changed_at on
+        """
+        CREATE TABLE IF NOT EXISTS price_history (
+            ph_id INT AUTO_INCREMENT PRIMARY KEY,
+            b_id INT NOT NULL,
+            changed_at DATETIME NOT NULL,
+            was DECIMAL(10,2) NOT NULL,
+            price DECIMAL(10,2) NOT NULL,
+            list_price DECIMAL(10,2) NOT NULL,
+            promo_id INT NULL,
+            FOREIGN KEY (b_id) REFERENCES Books(b_id) ON DELETE CASCADE ON UPDATE CASCADE
+        ) ENGINE=InnoDB;
+        """,
+        "CREATE INDEX idx_price_history_book ON price_history (b_id, changed_at)",
+        # the best running promotion's price; NULL = list price
+        "ALTER TABLE Books ADD COLUMN sale_price DECIMAL(10,2) NULL",
+        "ALTER TABLE Books ADD COLUMN promo_id INT NULL",
+    ]),
+    (14, "Author ids from AUTO_INCREMENT, names matched ignoring case (bookstore_authors)", [
+        # also swaps idx_author_name for idx_author_name_ci, in one transaction on SQLite
+        author_ids_auto_increment,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+SCHEMA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        description VARCHAR(200) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB;
+"""
+
+
+def current_version(cur):
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cur.fetchone()[0]
+
+
+def installed_version(connect=get_connection):
+    """
+    The recorded schema version in one round trip, or None when the database,
+    or its schema_version table, does not exist yet. Used by the bootstrap's
+    fast path: version == LATEST_VERSION means there is nothing to do.
+    """
+    try:
+        cnx = connect()
+    except DB_ERRORS:
+        return None
+    cur = cnx.cursor()
+    try:
+        return current_version(cur)
+    except DB_ERRORS:
+        return None
+    finally:
+        cur.close()
+        cnx.close()
+
+
+def migrate(connect=get_connection, verbose=True):
+    """Apply every migration newer than the recorded version. Returns the new version."""
+    cnx = connect()
+    cur = cnx.cursor()
+    try:
+        cur.execute(SCHEMA_VERSION_DDL)
+        version = current_version(cur)
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            for s in statements:
+                if callable(s):
+                    s(cur)
+                else:
+                    cur.execute(s)
+            cur.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                        (number, description))
+            cnx.commit()
+            version = number
+            if verbose:
+                print(f"  - migration {number}: {description}")
+        return version
+    finally:
+        cur.close()
+        cnx.close()
+
+
+# ---------- index checks ----------
+# (name, query, params) for the statements both apps run on every page view.
+# SELECT * FROM Books WHERE quantity > 0 is left out on purpose: it reads the
+# whole catalog anyway and is served from bookstore_catalog's cache.
+HOT_QUERIES = [
+    ("login", "SELECT a.password, a.role, c.cust_id FROM Authentication a "
+              "LEFT JOIN Customer c ON c.login_id = a.login_id WHERE a.login_id = %s", ("smera",)),
+    ("purchase history page",
+     "SELECT * FROM Reports WHERE (c_id = %s) AND r_no > %s ORDER BY r_no LIMIT %s", (4, 0, 51)),
+    ("reports page", "SELECT * FROM Reports WHERE r_no > %s ORDER BY r_no LIMIT %s", (0, 51)),
+    ("books page", "SELECT * FROM Books WHERE b_id > %s ORDER BY b_id LIMIT %s", (0, 51)),
+    ("books by genre", "SELECT * FROM Books WHERE genre = %s ORDER BY b_id LIMIT %s", ("Fantasy", 51)),
+    ("books by author", "SELECT b.* FROM BookAuthor ba JOIN Books b ON b.b_id = ba.b_id "
+                        "WHERE ba.a_id = %s AND ba.b_id > %s ORDER BY ba.b_id LIMIT %s", (4, 0, 51)),
+    ("author by name", "SELECT a_id, a_name FROM Author WHERE LOWER(a_name) IN (LOWER(%s)) ORDER BY a_id",
+     ("Jane Austen",)),
+    ("authors of a page", "SELECT b_id, a_id FROM BookAuthor WHERE b_id IN (%s, %s) ORDER BY b_id, a_id", (101, 102)),
+    ("purchase price", "SELECT price, sale_price, genre, slots FROM Books WHERE b_id = %s", (101,)),
+    ("stock of a title", "SELECT stock, seq FROM inventory_events WHERE b_id = %s ORDER BY seq DESC LIMIT 1", (101,)),
+    # the SELECT half of the INSERT ... SELECT that appends a stock event
+    ("stock append", "SELECT e.b_id, e.seq + 1, e.stock + %s FROM inventory_events e JOIN Books b ON b.b_id = e.b_id "
+                     "WHERE e.b_id = %s AND e.seq = %s AND e.stock + %s >= 0 AND b.slots = 0", (-1, 101, 1, -1)),
+    ("stock slot take", "SELECT quantity FROM stock_slots WHERE b_id = %s AND slot = %s AND quantity >= %s",
+     (101, 3, 1)),
+    ("next promotion boundary", "SELECT MIN(starts_at) FROM promotions WHERE state = %s", ("scheduled",)),
+    ("refunds of a customer", "SELECT * FROM refunds WHERE (c_id = %s) AND rf_no > %s ORDER BY rf_no LIMIT %s",
+     (4, 0, 51)),
+    ("sales by book",
+     "SELECT SUM(quantity), SUM(price) FROM Reports WHERE b_id = %s AND date_of_purchase >= %s",
+     (101, "2020-01-01")),
+    ("sales by day",
+     "SELECT b_id, SUM(quantity), SUM(price) FROM Reports WHERE date_of_purchase BETWEEN %s AND %s GROUP BY b_id",
+     ("2024-01-01", "2024-01-31")),
+    ("analytics top books",
+     "SELECT b_id, SUM(units), SUM(revenue) FROM sales_daily_book WHERE day >= %s GROUP BY b_id",
+     ("2024-01-01",)),
+    ("analytics genre totals",
+     "SELECT genre, SUM(revenue) FROM sales_monthly_book WHERE month >= %s GROUP BY genre", ("2024-01-01",)),
+    ("analytics top customers", "SELECT * FROM customer_sales ORDER BY revenue DESC LIMIT %s", (10,)),
+]
+
+
+# one table step of SQLite's EXPLAIN QUERY PLAN: "SEARCH b USING INDEX idx (...)", "SCAN Books", ...
+_SQLITE_STEP = re.compile(r"(SCAN|SEARCH) (\w+)(?: USING (?:COVERING )?(?:INDEX (\w+)|(INTEGER PRIMARY KEY)))?")
+
+
+def query_plan(cur, query, params=()):
+    """[(table, access, key)] per table a query reads; key None = no index."""
+    if get_backend().name == "mysql":
+        cur.execute("EXPLAIN " + query, params)
+        return [(row["table"], row["type"], row["key"]) for row in cur.fetchall()]
+    cur.execute("EXPLAIN QUERY PLAN " + query, params)
+    steps = [_SQLITE_STEP.match(row["detail"]) for row in cur.fetchall()]
+    return [(m.group(2), m.group(1), m.group(3) or m.group(4)) for m in steps if m]
+
+
+def explain_hot_queries(connect=get_connection, plans=None):
+    """
+    Plan every hot query; return [(name, table, access type, key)] for full
+    scans. plans, a dict, also gets every query's [(table, access, key)].
+    """
+    cnx = connect()
+    cur = cnx.cursor(dictionary=True)
+    failures = []
+    try:
+        for name, query, params in HOT_QUERIES:
+            steps = query_plan(cur, query, params)
+            if plans is not None:
+                plans[name] = steps
+            for table, access, key in steps:
+                # MySQL's type ALL, or a table read without an index (SQLite: SCAN with no USING)
+                if access == "ALL" or key is None:
+                    failures.append((name, table, access, key))
+    finally:
+        cur.close()
+        cnx.close()
+    return failures
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["explain"]:
+        failures = explain_hot_queries()
+        for name, table, access, key in failures:
+            print(f"FULL SCAN: {name} ({table}: type={access}, key={key})")
+        print(f"{len(HOT_QUERIES) - len({f[0] for f in failures})}/{len(HOT_QUERIES)} hot queries use an index.")
+        sys.exit(1 if failures else 0)
+    else:
+        print("Usage: python bookstore_schema.py explain")
@@ -0,0 +1,263 @@
+"""
+bookstore_search.py
+- In-process inverted index over book title, author names and genre for the
+  customer search box. Works the same on any backend (no FULLTEXT needed).
+- Every query term matches as a prefix ("harr pot" finds "Harry Potter");
+  all terms must match. Hits are ranked by field weight (title > author >
+  genre) with a bonus for whole-word matches.
+- Kept current incrementally: add_book / delete_book update it directly, and
+  every SEARCH_REFRESH seconds the b_ids in Books are compared with the
+  indexed ones, so titles another process added (whatever their b_id) or
+  deleted are picked up. Rows are re-read by primary key, so deleted books
+  never show up in between.
+- Results are filtered for stock after ranking; when the best matches are
+  sold out, search_books() asks the index for more until it has `limit`
+  in-stock rows or the matches run out.
+- Author names come from BookAuthor and bookstore_authors.author_map, so
+  building the index never joins Author row by row.
+"""
+
+import heapq
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from itertools import product
+
+from bookstore_authors import IN_CHUNK, authors_text, with_authors
+from bookstore_db import get_connection
+
+FIELD_WEIGHTS = (3.0, 2.0, 1.0)     # b_name, authors, genre
+EXACT_BONUS = 1.5                   # whole word instead of just a prefix
+MAX_EXPANSIONS = 64                 # index tokens a single prefix may expand to
+MIN_PREFIX = 2                      # shorter terms only match whole words
+SEARCH_REFRESH = float(os.environ.get("BOOKSTORE_SEARCH_REFRESH", "60"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return _WORD.findall(str(text).lower())
+
+
+def _token_weights(b_name, authors, genre):
+    weights = {}
+    for text, w in zip((b_name, authors, genre), FIELD_WEIGHTS):
+        for tok in tokenize(text):
+            weights[tok] = max(weights.get(tok, 0.0), w)
+    return weights
+
+
+class SearchIndex:
+    def __init__(self):
+        self._postings = {}     # token -> {weight: set of b_ids}
+        self._tokens = []       # sorted list of tokens, for prefix ranges
+        self._docs = {}         # b_id -> {token: weight} it was indexed under
+        self._lock = threading.RLock()
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, b_id, b_name, authors, genre):
+        with self._lock:
+            if b_id in self._docs:
+                self.remove(b_id)
+            weights = _token_weights(b_name, authors, genre)
+            for tok, w in weights.items():
+                posting = self._postings.get(tok)
+                if posting is None:
+                    posting = self._postings[tok] = {}
+                    self._tokens.insert(bisect_left(self._tokens, tok), tok)
+                posting.setdefault(w, set()).add(b_id)
+            self._docs[b_id] = weights
+
+    def ids(self):
+        with self._lock:
+            return set(self._docs)
+
+    def remove(self, b_id):
+        with self._lock:
+            for tok, w in self._docs.pop(b_id, {}).items():
+                posting = self._postings[tok]
+                posting[w].discard(b_id)
+                if not posting[w]:
+                    del posting[w]
+                if not posting:
+                    del self._postings[tok]
+                    del self._tokens[bisect_left(self._tokens, tok)]
+
+    def build(self, rows):
+        """Replace the index contents with rows of (b_id, b_name, authors, genre)."""
+        with self._lock:
+            self._postings, self._tokens, self._docs = {}, [], {}
+            postings = self._postings
+            for b_id, b_name, authors, genre in rows:
+                weights = _token_weights(b_name, authors, genre)
+                for tok, w in weights.items():
+                    postings.setdefault(tok, {}).setdefault(w, set()).add(b_id)
+                self._docs[b_id] = weights
+            # sort once instead of inserting token by token
+            self._tokens = sorted(postings)
+            self.built_at = time.monotonic()
+
+    def _term_tiers(self, term):
+        """
+        [(score, [sets of b_ids])] for one query term, best score first: the
+        books whose field weight for an index token starting with `term` is
+        `score` (whole-word matches get EXACT_BONUS). Sets are the index's
+        own, so nothing is copied until a tier is actually needed.
+        """
+        by_score = {}
+        exact = self._postings.get(term)
+        if exact:
+            for w, ids in exact.items():
+                by_score.setdefault(w * EXACT_BONUS, []).append(ids)
+        if len(term) >= MIN_PREFIX:
+            i = bisect_left(self._tokens, term)
+            for tok in self._tokens[i:i + MAX_EXPANSIONS]:
+                if not tok.startswith(term):
+                    break
+                if tok != term:
+                    for w, ids in self._postings[tok].items():
+                        by_score.setdefault(w, []).append(ids)
+        return sorted(by_score.items(), reverse=True)
+
+    def search(self, query, limit=20):
+        """Return up to `limit` (b_id, score) pairs, best first (ties by b_id)."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            per_term = [self._term_tiers(t) for t in terms]
+            if not all(per_term):
+                return []
+            return self._top_hits(per_term, limit)
+
+    def _top_hits(self, per_term, limit):
+        # A book's score is the sum over terms of its best tier score. Walking
+        # tier combinations from the highest total down, the first total a
+        # book shows up under is therefore its real score, so we can stop as
+        # soon as `limit` books are found. All set work happens in C.
+        unions = {}
+
+        def tier_ids(t, k):
+            if (t, k) not in unions:
+                sets = per_term[t][k][1]
+                unions[t, k] = sets[0] if len(sets) == 1 else set().union(*sets)
+            return unions[t, k]
+
+        totals = {}
+        for combo in product(*(range(len(tiers)) for tiers in per_term)):
+            total = sum(per_term[t][k][0] for t, k in enumerate(combo))
+            totals.setdefault(total, []).append(combo)
+
+        hits, emitted = [], set()
+        for total in sorted(totals, reverse=True):
+            found = []
+            for combo in totals[total]:
+                sets = sorted((tier_ids(t, k) for t, k in enumerate(combo)), key=len)
+                found.append(sets[0].intersection(*sets[1:]) if len(sets) > 1 else sets[0])
+            bucket = found[0] if len(found) == 1 else set().union(*found)
+            need = limit - len(hits)
+            for b in heapq.nsmallest(need + len(emitted), bucket):
+                if b not in emitted and len(hits) < limit:
+                    hits.append((b, total))
+                    emitted.add(b)
+            if len(hits) >= limit:
+                break
+        return hits
+
+
+search_index = SearchIndex()
+_refresh_lock = threading.Lock()
+
+
+def _marks(values):
+    return ",".join(["%s"] * len(values))
+
+
+def refresh_index(connect=get_connection, index=search_index):
+    """
+    Build the index on first use. Afterwards, once it is SEARCH_REFRESH old,
+    add the titles Books has and the index doesn't, and drop the ones it no
+    longer has (one b_id-only read of Books; rows only for the new titles).
+    """
+    with _refresh_lock:
+        fresh = index.built_at is not None and time.monotonic() - index.built_at < SEARCH_REFRESH
+        if fresh:
+            return
+        conn = connect()
+        cur = conn.cursor()
+        try:
+            if index.built_at is None:
+                cur.execute("SELECT b_id, b_name, genre FROM Books")
+                books = cur.fetchall()
+                cur.execute("SELECT b_id, a_id FROM BookAuthor")
+                links = cur.fetchall()
+            else:
+                cur.execute("SELECT b_id FROM Books")
+                in_books = {b_id for b_id, in cur.fetchall()}
+                known = index.ids()
+                for b_id in known - in_books:
+                    index.remove(b_id)
+                new = sorted(in_books - known)
+                books, links = [], []
+                for i in range(0, len(new), IN_CHUNK):
+                    part = new[i:i + IN_CHUNK]
+                    cur.execute(f"SELECT b_id, b_name, genre FROM Books WHERE b_id IN ({_marks(part)})", part)
+                    books.extend(cur.fetchall())
+                    cur.execute(f"SELECT b_id, a_id FROM BookAuthor WHERE b_id IN ({_marks(part)})", part)
+                    links.extend(cur.fetchall())
+            author_ids = {}
+            for b_id, a_id in links:
+                author_ids.setdefault(b_id, []).append(a_id)
+            names = authors_text(author_ids, connect)
+            rows = ((b_id, b_name, names.get(b_id, ""), genre) for b_id, b_name, genre in books)
+            if index.built_at is None:
+                index.build(rows)
+            else:
+                for row in rows:
+                    index.add(*row)
+                index.built_at = time.monotonic()
+        finally:
+            cur.close()
+            conn.close()
+
+
+def search_books(query, limit=20, in_stock_only=True, connect=get_connection):
+    """
+    Ranked search over the catalog. Returns (columns, rows) with "authors",
+    best match first. Matches that are sold out (or deleted) are skipped and
+    the next-ranked ones read instead, so up to `limit` rows come back.
+    """
+    refresh_index(connect)
+    columns, rows = None, []
+    want, checked = limit, 0
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        while True:
+            # the top `want` hits start with the top `checked` ones, so only the rest are read
+            ranked = [b for b, _ in search_index.search(query, want)]
+            part = ranked[checked:]
+            if part:
+                sql = f"SELECT * FROM Books WHERE b_id IN ({_marks(part)})"
+                if in_stock_only:
+                    sql += " AND quantity > 0"
+                cur.execute(sql, part)
+                columns = [d[0] for d in cur.description]
+                order = {b: i for i, b in enumerate(part)}
+                key = columns.index("b_id")
+                rows.extend(sorted(cur.fetchall(), key=lambda r: order[r[key]]))
+            checked = len(ranked)
+            if len(rows) >= limit or len(ranked) < want:
+                break
+            want *= 4
+    finally:
+        cur.close()
+        conn.close()
+    if columns is None:
+        return [], []
+    return with_authors(columns, rows[:limit], connect)
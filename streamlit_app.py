@@ -1,26 +1,131 @@
+import io
 import streamlit as st
-import mysql.connector
 import pandas as pd
-from datetime import date
-
-
-# Function to establish database connection
+from datetime import datetime, time
+from bookstore_auth import login, logout as logout_session, session, sessions, create_login
+from bookstore_analytics import top_books, daily_revenue, monthly_revenue, genre_totals, top_customers
+from bookstore_db import DB_ERRORS, get_pool, fetch_page
+from bookstore_authors import author_map, books_by_author, books_page, join_authors, link_authors, split_authors
+from bookstore_catalog import catalog_cache, available_books, author_deleted, book_added, book_deleted
+from bookstore_search import search_books
+from bookstore_export import export_reports_file
+from bookstore_import import IMPORT_BATCH, IMPORT_SPECS, import_csv, write_rejects
+from bookstore_inventory import (STOCK_COMPACT_INTERVAL, StockError, adjust_stock, open_stock, shard_stock,
+                                 start_compactor, stock_history, stock_view)
+from bookstore_ledger import buy
+from bookstore_metrics import pass_through, profiler, prometheus_text
+from bookstore_reporting import sales_report, customer_report
+from bookstore_reorder import (REORDER_COVER_DAYS, REORDER_LEAD_DAYS, REORDER_SAFETY_DAYS, check_stock,
+                              create_restock_orders, open_orders, order_lines, receive_restock)
+from bookstore_pricing import (PROMOTION_KINDS, PricingError, add_promotion, end_promotion, price_history, reprice,
+                               set_price, start_price_clock)
+from bookstore_purchase import checkout_cart, add_to_cart, remove_from_cart, PurchaseError
+from bookstore_returns import RefundError, refund_purchase, return_purchase
+
+
+# The process's connection pool, shared by every session and rerun, the
+# thread that folds logged / slot sales into Books.quantity and the one that opens and
+# closes promotions. Backend and credentials are in bookstore_db.py.
+@st.cache_resource
+def db_pool():
+    start_compactor()
+    start_price_clock()
+    return get_pool()
+
+
+# Function to get a database connection (checked out of the shared pool;
+# connection.close() returns it).
 def get_db_connection():
     try:
-        connection = mysql.connector.connect(
-            host='localhost',
-            database='bookstore',
-            user='root',  # Replace with your MySQL username
-            password='root'  # Replace with your MySQL password
-        )
-        if connection.is_connected():
-            return connection
+        return db_pool().get()
     except Exception as e:
         st.error(f"Error connecting to database: {e}")
         return None
 
 
-# User Login Function
+PAGE_SIZES = [25, 50, 100, 500]
+
+
+# Keyset-paginated table: only the current page is loaded. The start keys of
+# the pages visited so far are kept in st.session_state for "Previous".
+# fetch(after, page_size) -> (columns, rows, next_after) replaces fetch_page
+# for pages that are not a plain table (books with their authors).
+@pass_through
+def paged_table(name, table=None, key=None, where=None, params=(), fetch=None):
+    size = st.selectbox("Rows per page", PAGE_SIZES, key=f"{name}_page_size")
+    pages = st.session_state.setdefault(f"{name}_pages", {"size": size, "stack": [None]})
+    if pages["size"] != size:
+        pages.update(size=size, stack=[None])
+    stack = pages["stack"]
+
+    if fetch is None:
+        columns, rows, next_after = fetch_page(table, key, stack[-1], size, where, params)
+    else:
+        columns, rows, next_after = fetch(stack[-1], size)
+    st.dataframe(pd.DataFrame(rows, columns=columns))
+
+    prev_col, page_col, next_col = st.columns(3)
+    # callbacks move the stack before the rerun the click triggers, so a click loads one page, not two
+    prev_col.button("Previous", key=f"{name}_prev", disabled=len(stack) == 1, on_click=stack.pop)
+    page_col.caption(f"Page {len(stack)}")
+    next_col.button("Next", key=f"{name}_next", disabled=next_after is None, on_click=stack.append,
+                    args=(next_after,))
+    return rows
+
+
+# ---------- session / router ----------
+# Who is logged in lives in st.session_state: the bookstore_auth token, the
+# role and, for customers, cust_id and their Customer row, all filled once
+# at login. A rerun resolves the token in memory (never a query) and then
+# runs exactly one page; logging in or out changes the state and reruns.
+SESSION_KEYS = ("auth_token", "user_role", "cust_id", "customer")
+
+
+def load_customer(cust_id):
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT cust_id, c_name, address, phoneno FROM Customer WHERE cust_id = %s", (cust_id,))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def start_session(token, user):
+    st.session_state.auth_token = token
+    st.session_state.user_role = user["role"]
+    if user["cust_id"] is not None:
+        st.session_state.cust_id = user["cust_id"]
+        st.session_state.customer = load_customer(user["cust_id"])
+
+
+def end_session(message=None):
+    logout_session(st.session_state.get("auth_token"))
+    # pages keep their own state (cart, paging, menus); none of it belongs to the next user
+    st.session_state.clear()
+    if message:
+        st.session_state.flash = message
+
+
+def current_page():
+    """The page function for this rerun: the login form or the dashboard of the session's role."""
+    user = session(st.session_state.get("auth_token"))
+    if user is None:
+        # never logged in, logged out elsewhere, expired, or revoked (their customer was deleted)
+        for key in SESSION_KEYS:
+            st.session_state.pop(key, None)
+        return user_login
+    return admin_dashboard if user["role"] == "admin" else customer_dashboard
+
+
+def run():
+    message = st.session_state.pop("flash", None)
+    if message:
+        st.success(message)
+    current_page()()
+
+
 # User Login Function
 def user_login():
     st.title("Bookstore Management System 📚")
@@ -29,26 +134,12 @@ def user_login():
 
     if st.button("Login"):
         if login_id and password:
-            connection = get_db_connection()
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM authentication WHERE login_id = %s AND password = %s", (login_id, password))
-            user = cursor.fetchone()
-            if user:
-                if login_id == "chirag":  # Admin login
-                    st.session_state.user_role = "admin"
-                    admin_dashboard()
-                else:  # Customer login
-                    st.session_state.user_role = "customer"
-                    cursor.execute("SELECT cust_id FROM customer WHERE login_id = %s", (login_id,))
-                    row = cursor.fetchone()
-                    if row:
-                        st.session_state.cust_id = row['cust_id']  # Store customer ID in session state
-                        customer_dashboard()  # Navigate to the customer dashboard
-                    else:
-                        st.error("Customer record not found.")
-            else:
+            result = login(login_id, password)
+            if result is None:
                 st.error("Invalid credentials.")
-            connection.close()
+            else:
+                start_session(*result)
+                st.rerun()
         else:
             st.error("Please enter both login ID and password.")
 
@@ -58,7 +149,8 @@ def user_login():
 # Admin Dashboard
 def admin_dashboard():
     st.title("Admin Dashboard 🔐")
-    menu = ["Book Management", "Author Management", "Staff Management", "Customer Management", "Reports", "Logout"]
+    menu = ["Book Management", "Author Management", "Staff Management", "Customer Management", "Reports",
+            "Sales Analytics", "Restock", "Refunds", "Promotions", "Bulk Import", "Diagnostics", "Logout"]
     choice = st.sidebar.selectbox("Select an option", menu)
 
     if choice == "Book Management":
@@ -71,14 +163,32 @@ def admin_dashboard():
         customer_management()
     elif choice == "Reports":
         view_reports()
+    elif choice == "Sales Analytics":
+        view_analytics()
+    elif choice == "Restock":
+        restock()
+    elif choice == "Refunds":
+        refunds()
+    elif choice == "Promotions":
+        promotions()
+    elif choice == "Bulk Import":
+        bulk_import()
+    elif choice == "Diagnostics":
+        diagnostics()
     elif choice == "Logout":
         logout()
 
 
+# "Back to Admin Menu" in a section: the admin menu is the sidebar, which is
+# already on the page (calling admin_dashboard() again would draw it twice)
+def back_to_menu():
+    st.info("Pick a section from the menu in the sidebar.")
+
+
 # Book Management
 def book_management():
     st.subheader("Book Management")
-    menu = ["Add Book", "Delete Book", "View All Books", "Back to Admin Menu"]
+    menu = ["Add Book", "Delete Book", "View All Books", "Books by Author", "Stock History", "Back to Admin Menu"]
     choice = st.selectbox("Select an option", menu)
 
     if choice == "Add Book":
@@ -87,8 +197,12 @@ def book_management():
         delete_book()
     elif choice == "View All Books":
         view_books()
+    elif choice == "Books by Author":
+        browse_by_author("admin")
+    elif choice == "Stock History":
+        stock_page()
     elif choice == "Back to Admin Menu":
-        admin_dashboard()
+        back_to_menu()
 
 
 # Add Book
@@ -96,21 +210,29 @@ def add_book():
     st.subheader("Add New Book")
     b_id = st.number_input("Book ID", min_value=1)
     b_name = st.text_input("Book Name")
-    a_name = st.text_input("Author Name")
+    authors = split_authors(st.text_input("Author(s), separated by ;"))
     genre = st.text_input("Genre")
     quantity = st.number_input("Quantity", min_value=1)
     price = st.number_input("Price", min_value=0.01)
 
     if st.button("Add Book"):
-        if b_name and a_name:
+        if b_name and authors:
             connection = get_db_connection()
             cursor = connection.cursor()
-            cursor.execute(
-                "INSERT INTO books (b_id, b_name, a_name, genre, quantity, price) VALUES (%s, %s, %s, %s, %s, %s)",
-                (b_id, b_name, a_name, genre, quantity, price))
-            connection.commit()
-            st.success(f"Book '{b_name}' added successfully!")
-            connection.close()
+            try:
+                cursor.execute(
+                    "INSERT INTO books (b_id, b_name, genre, quantity, price) VALUES (%s, %s, %s, %s, %s)",
+                    (b_id, b_name, genre, quantity, price))
+                link_authors(cursor, [(b_id, authors)])
+                open_stock(cursor, [b_id])
+                reprice(cursor, [b_id])
+                connection.commit()
+                book_added(b_id, b_name, join_authors(authors), genre)
+                st.success(f"Book '{b_name}' added successfully!")
+            except DB_ERRORS as e:
+                st.error(f"Failed to add book: {e}")
+            finally:
+                connection.close()
         else:
             st.error("Please fill in all fields.")
 
@@ -122,20 +244,76 @@ def delete_book():
     if st.button("Delete Book"):
         connection = get_db_connection()
         cursor = connection.cursor()
-        cursor.execute("DELETE FROM books WHERE b_id = %s", (b_id,))
-        connection.commit()
-        st.success(f"Book with ID {b_id} deleted successfully!")
-        connection.close()
+        try:
+            cursor.execute("DELETE FROM books WHERE b_id = %s", (b_id,))
+            connection.commit()
+            book_deleted(b_id)
+            st.success(f"Book with ID {b_id} deleted successfully!")
+        except DB_ERRORS as e:
+            st.error(f"Error deleting book: {e}")
+        finally:
+            connection.close()
+
+
+# Stock History: one title's inventory events, and manual corrections
+def stock_page():
+    st.subheader("Stock History")
+    b_id = int(st.number_input("Book ID", min_value=1, key="stock_book_id"))
+    level = stock_view.level(b_id, get_db_connection)
+    if level is None:
+        st.write("No such book.")
+        return
+    st.caption(f"In stock: {level}")
+    paged_table(f"stock_{b_id}", fetch=lambda after, size: stock_history(b_id, after, size, get_db_connection))
+
+    delta = int(st.number_input("Change (negative to remove copies)", step=1, value=0, key="stock_delta"))
+    reason = st.text_input("Reason", key="stock_reason")
+    if st.button("Record adjustment"):
+        if delta == 0 or not reason:
+            st.error("Enter a non-zero change and a reason.")
+            return
+        try:
+            stock = adjust_stock(b_id, delta, f"admin: {reason}", get_db_connection)
+            st.success(f"Stock of book {b_id} is now {stock}.")
+        except StockError as e:
+            st.error(str(e))
+
+    # a bestseller's stock split across counters, so its buyers don't queue on one Books row
+    slots = int(st.number_input("Stock slots (0: off)", min_value=0, max_value=256, step=1, key="stock_slots"))
+    st.caption("While a title is on stock slots, the catalog shows its stock as of the last compaction "
+               f"(every {STOCK_COMPACT_INTERVAL:g} s).")
+    if st.button("Set stock slots"):
+        try:
+            stock = shard_stock(b_id, slots, get_db_connection)
+            st.success(f"Book {b_id}: {stock} copies on {slots if slots > 1 else 'no'} stock slots.")
+        except (StockError, *DB_ERRORS) as e:
+            st.error(str(e))
 
 
 # View Books
 def view_books():
     st.subheader("View All Books")
-    connection = get_db_connection()
-    query = "SELECT * FROM books"
-    df = pd.read_sql(query, connection)
-    st.dataframe(df)
-    connection.close()
+    paged_table("books", fetch=books_page)
+    stats = catalog_cache.stats()
+    st.caption(f"Catalog cache: {stats['hits']} hits / {stats['misses']} misses "
+               f"({stats['hit_rate']:.0%} hit rate)")
+
+
+# Books by Author: find the author by name in the cached author map, then
+# page through their titles (an index range on BookAuthor, no string scan)
+def browse_by_author(role):
+    st.subheader("Books by Author")
+    text = st.text_input("Author name", key=f"{role}_author_search")
+    if not text.strip():
+        return
+    matches = author_map.matching(text)
+    if not matches:
+        st.write("No authors match that name.")
+        return
+    a_id, a_name = st.selectbox("Author", matches, format_func=lambda m: m[1], key=f"{role}_author_pick")
+    in_stock_only = role == "customer"
+    paged_table(f"{role}_author_{a_id}",
+                fetch=lambda after, size: books_by_author(a_id, after, size, in_stock_only=in_stock_only))
 
 
 # Author Management
@@ -151,7 +329,7 @@ def author_management():
     elif choice == "View All Authors":
         view_authors()
     elif choice == "Back to Admin Menu":
-        admin_dashboard()
+        back_to_menu()
 
 
 # Add Author
@@ -164,10 +342,15 @@ def add_author():
         if a_name:
             connection = get_db_connection()
             cursor = connection.cursor()
-            cursor.execute("INSERT INTO author (a_id, a_name) VALUES (%s, %s)", (a_id, a_name))
-            connection.commit()
-            st.success(f"Author '{a_name}' added successfully!")
-            connection.close()
+            try:
+                cursor.execute("INSERT INTO author (a_id, a_name) VALUES (%s, %s)", (a_id, a_name))
+                connection.commit()
+                author_map.added(a_id, a_name)
+                st.success(f"Author '{a_name}' added successfully!")
+            except DB_ERRORS as e:
+                st.error(f"Failed to add author: {e}")
+            finally:
+                connection.close()
         else:
             st.error("Please enter author name.")
 
@@ -179,20 +362,21 @@ def delete_author():
     if st.button("Delete Author"):
         connection = get_db_connection()
         cursor = connection.cursor()
-        cursor.execute("DELETE FROM author WHERE a_id = %s", (a_id,))
-        connection.commit()
-        st.success(f"Author with ID {a_id} deleted successfully!")
-        connection.close()
+        try:
+            cursor.execute("DELETE FROM author WHERE a_id = %s", (a_id,))
+            connection.commit()
+            author_deleted(a_id)
+            st.success(f"Author with ID {a_id} deleted successfully!")
+        except DB_ERRORS as e:
+            st.error(f"Error deleting author: {e}")
+        finally:
+            connection.close()
 
 
 # View Authors
 def view_authors():
     st.subheader("View All Authors")
-    connection = get_db_connection()
-    query = "SELECT * FROM author"
-    df = pd.read_sql(query, connection)
-    st.dataframe(df)
-    connection.close()
+    paged_table("authors", "author", "a_id")
 
 
 # Staff Management
@@ -208,7 +392,7 @@ def staff_management():
     elif choice == "View All Staff":
         view_staff()
     elif choice == "Back to Admin Menu":
-        admin_dashboard()
+        back_to_menu()
 
 
 # Add Staff
@@ -223,11 +407,15 @@ def add_staff():
         if s_name and s_phone and designation:
             connection = get_db_connection()
             cursor = connection.cursor()
-            cursor.execute("INSERT INTO staff (s_id, s_name, s_phone, designation) VALUES (%s, %s, %s, %s)",
-                           (s_id, s_name, s_phone, designation))
-            connection.commit()
-            st.success(f"Staff '{s_name}' added successfully!")
-            connection.close()
+            try:
+                cursor.execute("INSERT INTO staff (s_id, s_name, s_phone, designation) VALUES (%s, %s, %s, %s)",
+                               (s_id, s_name, s_phone, designation))
+                connection.commit()
+                st.success(f"Staff '{s_name}' added successfully!")
+            except DB_ERRORS as e:
+                st.error(f"Failed to add staff: {e}")
+            finally:
+                connection.close()
         else:
             st.error("Please fill in all fields.")
 
@@ -239,20 +427,20 @@ def delete_staff():
     if st.button("Delete Staff"):
         connection = get_db_connection()
         cursor = connection.cursor()
-        cursor.execute("DELETE FROM staff WHERE s_id = %s", (s_id,))
-        connection.commit()
-        st.success(f"Staff with ID {s_id} deleted successfully!")
-        connection.close()
+        try:
+            cursor.execute("DELETE FROM staff WHERE s_id = %s", (s_id,))
+            connection.commit()
+            st.success(f"Staff with ID {s_id} deleted successfully!")
+        except DB_ERRORS as e:
+            st.error(f"Error deleting staff: {e}")
+        finally:
+            connection.close()
 
 
 # View Staff
 def view_staff():
     st.subheader("View All Staff")
-    connection = get_db_connection()
-    query = "SELECT * FROM staff"
-    df = pd.read_sql(query, connection)
-    st.dataframe(df)
-    connection.close()
+    paged_table("staff", "staff", "s_id")
 
 
 # Customer Management
@@ -268,7 +456,7 @@ def customer_management():
     elif choice == "View All Customers":
         view_customers()
     elif choice == "Back to Admin Menu":
-        admin_dashboard()
+        back_to_menu()
 
 
 # Add Customer
@@ -278,17 +466,23 @@ def add_customer():
     c_name = st.text_input("Customer Name")
     address = st.text_input("Address")
     phoneno = st.text_input("Phone Number")
+    login_id = st.text_input("Login ID (optional)")
+    password = st.text_input("Password", type="password", disabled=not login_id)
 
     if st.button("Add Customer"):
-        if c_name and address and phoneno:
+        if login_id and not password:
+            st.error("Please choose a password for the new login.")
+        elif c_name and address and phoneno:
             connection = get_db_connection()
             cursor = connection.cursor()
             try:
-                cursor.execute("INSERT INTO customer (cust_id, c_name, address, phoneno) VALUES (%s, %s, %s, %s)",
-                               (cust_id, c_name, address, phoneno))
+                if login_id:
+                    create_login(cursor, login_id, password)
+                cursor.execute("INSERT INTO customer (cust_id, c_name, address, phoneno, login_id) "
+                               "VALUES (%s, %s, %s, %s, %s)", (cust_id, c_name, address, phoneno, login_id or None))
                 connection.commit()
                 st.success(f"Customer '{c_name}' added successfully!")
-            except mysql.connector.Error as e:
+            except DB_ERRORS as e:
                 st.error(f"Failed to add customer: {e}")
             finally:
                 connection.close()
@@ -304,10 +498,14 @@ def delete_customer():
         connection = get_db_connection()
         cursor = connection.cursor()
         try:
+            cursor.execute("SELECT login_id FROM customer WHERE cust_id = %s", (cust_id,))
+            row = cursor.fetchone()
             cursor.execute("DELETE FROM customer WHERE cust_id = %s", (cust_id,))
             connection.commit()
+            if row and row[0] is not None:
+                sessions.revoke_user(row[0])    # their open sessions still carry the old cust_id
             st.success(f"Customer with ID {cust_id} deleted successfully!")
-        except mysql.connector.Error as e:
+        except DB_ERRORS as e:
             st.error(f"Error deleting customer: {e}")
         finally:
             connection.close()
@@ -316,34 +514,266 @@ def delete_customer():
 # View Customers
 def view_customers():
     st.subheader("View All Customers")
-    connection = get_db_connection()
-    query = "SELECT * FROM customer"
-    df = pd.read_sql(query, connection)
-    st.dataframe(df)
-    connection.close()
+    paged_table("customers", "customer", "cust_id")
 
 
 
 # Reports
 def view_reports():
     st.subheader("View Reports")
-    connection = get_db_connection()
-    query = "SELECT * FROM reports"
-    df = pd.read_sql(query, connection)
-    st.dataframe(df)
-    connection.close()
+    if st.checkbox("Show sales summary"):
+        report = sales_report()
+        show_report_summary(report)
+        st.write("Top customers by lifetime value")
+        st.dataframe(report.lifetime_value().head(20))
+    export_reports_button()
+    paged_table("reports", "reports", "r_no")
+
+
+EXPORT_FORMATS = {
+    "CSV": ("csv", None, "reports.csv", "text/csv"),
+    "CSV (gzip)": ("csv", "gzip", "reports.csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "snappy", "reports.parquet", "application/octet-stream"),
+}
+
+
+# Export streams Reports to a temp file in batches only when the button is clicked
+def export_reports_button():
+    label = st.selectbox("Export format", list(EXPORT_FORMATS), key="export_format")
+    fmt, compression, file_name, mime = EXPORT_FORMATS[label]
+    st.download_button("Download Reports", data=lambda: export_reports_file(fmt, compression),
+                       file_name=file_name, mime=mime, on_click="ignore")
+
+
+def show_report_summary(report):
+    totals = report.totals()
+    cols = st.columns(4)
+    cols[0].metric("Purchases", totals["purchases"])
+    cols[1].metric("Units", totals["units"])
+    cols[2].metric("Revenue", f"₹{totals['revenue']:,.2f}")
+    cols[3].metric("Avg / purchase", f"₹{totals['avg_purchase']:,.2f}")
+    daily = report.daily()
+    if len(daily):
+        st.line_chart(daily)
+
+
+# Sales Analytics (served from the rollup tables, never from raw Reports)
+def view_analytics():
+    st.subheader("Sales Analytics")
+    days = st.selectbox("Period (days)", [7, 30, 90, 365], index=1)
+    n = st.slider("Top N", min_value=5, max_value=50, value=10)
+
+    columns, rows = daily_revenue(days)
+    st.write("Revenue by day")
+    if rows:
+        st.line_chart(pd.DataFrame(rows, columns=columns).set_index("day")["revenue"].astype(float))
+    else:
+        st.write("No sales in this period.")
+
+    columns, rows = top_books(days, n)
+    st.write(f"Top {n} books")
+    st.dataframe(pd.DataFrame(rows, columns=columns))
+
+    months = max(1, days // 30)
+    columns, rows = genre_totals(months)
+    st.write(f"Revenue by genre (last {months} month(s))")
+    st.bar_chart(pd.DataFrame(rows, columns=columns).set_index("genre")["revenue"].astype(float))
+
+    columns, rows = monthly_revenue(12)
+    st.write("Revenue by month")
+    st.dataframe(pd.DataFrame(rows, columns=columns))
+
+    columns, rows = top_customers(n)
+    st.write(f"Top {n} customers (lifetime)")
+    st.dataframe(pd.DataFrame(rows, columns=columns))
+
+
+# Titles running out at their current sales velocity, and open restock orders
+def restock():
+    st.subheader("Restock")
+    # check_stock reads the whole catalog's sales velocity, so it runs on request
+    # and its result is kept in st.session_state until orders are made from it
+    if st.button("Check stock"):
+        st.session_state.restock_suggestions = check_stock(auto_order=False)[0]
+    suggestions = st.session_state.get("restock_suggestions")
+    if suggestions is None:
+        st.write("Check stock to see the titles that are about to run out.")
+    elif suggestions.empty:
+        st.write("No title is about to run out.")
+    else:
+        st.caption(f"Runs out within {REORDER_LEAD_DAYS + REORDER_SAFETY_DAYS} days (lead time + safety stock); "
+                   f"`order` covers {REORDER_COVER_DAYS} more days.")
+        st.dataframe(suggestions)
+        if st.button("Create restock orders"):
+            created = create_restock_orders(order_lines(suggestions), "admin: reorder suggestion")
+            del st.session_state.restock_suggestions
+            st.success(f"{created} restock order(s) created.")
+
+    columns, rows = open_orders()
+    st.subheader("Open Restock Orders")
+    if not rows:
+        st.write("None.")
+        return
+    st.dataframe(pd.DataFrame(rows, columns=columns))
+    o_id = st.selectbox("Order received", [r[0] for r in rows], key="restock_receive_id")
+    if st.button("Mark received"):
+        if receive_restock(o_id):
+            st.success(f"Order {o_id} received; stock updated.")
+            st.rerun()
+        else:
+            st.error(f"Order {o_id} is no longer open.")
+
+
+# Refund part or all of any purchase; the copies go back into stock
+def refunds():
+    st.subheader("Refund a Purchase")
+    r_no = st.number_input("Report No", min_value=1, key="refund_r_no")
+    qty = st.number_input("Copies returned", min_value=1, key="refund_quantity")
+    reason = st.text_input("Reason", key="refund_reason")
+    if st.button("Refund"):
+        try:
+            rf_no, amount = refund_purchase(r_no, qty, reason or None, session(st.session_state.auth_token)["login_id"])
+            st.success(f"Refund {rf_no}: ₹{float(amount):.2f}")
+        except RefundError as e:
+            st.error(str(e))
+
+    st.subheader("Refunds")
+    paged_table("refunds", "refunds", "rf_no")
+
+
+# List prices, scheduled sales and a title's price history
+def promotions():
+    st.subheader("List Price")
+    b_id = st.number_input("Book ID", min_value=1, key="price_book_id")
+    price = st.number_input("New list price", min_value=0.0, step=0.01, key="price_value")
+    if st.button("Set price"):
+        try:
+            st.success(f"Book {b_id} now sells for ₹{float(set_price(b_id, price)):.2f}")
+        except PricingError as e:
+            st.error(str(e))
+
+    st.subheader("New Promotion")
+    name = st.text_input("Name", key="promo_name")
+    scope = st.radio("For", ["One book", "A genre"], key="promo_scope", horizontal=True)
+    target = (st.number_input("Book ID", min_value=1, key="promo_book_id") if scope == "One book"
+              else st.text_input("Genre", key="promo_genre"))
+    kind = st.selectbox("Discount", PROMOTION_KINDS, key="promo_kind")
+    amount = st.number_input("Percent off" if kind == "percent" else "Amount off (₹)", min_value=0.01, step=1.0,
+                             key="promo_amount")
+    starts = datetime.combine(st.date_input("Starts", key="promo_start_day"),
+                              st.time_input("at", time(0, 0), key="promo_start_time"))
+    ends = datetime.combine(st.date_input("Ends", key="promo_end_day"),
+                            st.time_input("at", time(23, 59), key="promo_end_time"))
+    if st.button("Schedule promotion"):
+        try:
+            b_id, genre = (target, None) if scope == "One book" else (None, target)
+            promo_id = add_promotion(name or "promotion", kind, amount, starts, ends, b_id, genre,
+                                     session(st.session_state.auth_token)["login_id"])
+            st.success(f"Promotion {promo_id} scheduled.")
+        except PricingError as e:
+            st.error(str(e))
+
+    st.subheader("Promotions")
+    paged_table("promotions", "promotions", "promo_id")
+    promo_id = st.number_input("Promotion ID", min_value=1, key="promo_end_id")
+    if st.button("End promotion"):
+        if end_promotion(promo_id):
+            st.success(f"Promotion {promo_id} ended.")
+        else:
+            st.error(f"Promotion {promo_id} is not running or scheduled.")
+
+    st.subheader("Price History")
+    b_id = st.number_input("Book ID", min_value=1, key="price_history_id")
+    paged_table(f"prices_{b_id}", fetch=lambda after, size: price_history(b_id, after, size, get_db_connection))
+
+
+# Query profile of this process (every statement through the pool, from any page or user)
+def diagnostics():
+    st.subheader("Diagnostics")
+    if not profiler.enabled:
+        st.info("Query profiling is off (BOOKSTORE_QUERY_PROFILING=0).")
+        return
+    stats = profiler.summary()
+    st.caption(f"{sum(r['calls'] for r in stats)} statements since "
+               f"{pd.Timestamp(profiler.started, unit='s'):%Y-%m-%d %H:%M:%S} UTC; "
+               f"slow threshold {profiler.slow_seconds * 1000:g} ms.")
+    st.subheader("Statements (by total time)")
+    st.dataframe(pd.DataFrame(stats, columns=["caller", "calls", "total_ms", "mean_ms", "p50_ms", "p95_ms", "p99_ms",
+                                              "max_ms", "rows", "errors", "statement"]))
+
+    st.subheader("Slow Queries")
+    slow = profiler.slow_log()
+    if slow:
+        frame = pd.DataFrame(slow)
+        frame["at"] = pd.to_datetime(frame["at"], unit="s")
+        st.dataframe(frame[["at", "ms", "caller", "rows", "statement", "params"]])
+    else:
+        st.write("None.")
+
+    st.subheader("Connection Pool")
+    st.json(db_pool().stats())
+
+    col1, col2 = st.columns(2)
+    col1.download_button("Download Prometheus metrics", prometheus_text(pool=db_pool()),
+                         file_name="bookstore_metrics.prom", mime="text/plain")
+    if col2.button("Reset statistics"):
+        profiler.reset()
+        st.rerun()
+
+
+# Bulk Import (CSV upload, validated and upserted in batches)
+def bulk_import():
+    st.subheader("Bulk Import")
+    kind = st.selectbox("Import into", list(IMPORT_SPECS))
+    table, columns = IMPORT_SPECS[kind]
+    st.caption("CSV with a header row: " + ", ".join(name for name, _, _ in columns)
+               + ". Rows with an existing ID are updated.")
+    uploaded = st.file_uploader("CSV file", type=["csv"])
+    batch = st.select_slider("Batch size", [500, 1000, IMPORT_BATCH, 20000], value=IMPORT_BATCH)
+
+    if uploaded is not None and st.button("Import"):
+        bar = st.progress(0.0)
+        total = max(uploaded.size, 1)
+
+        def progress(imported, rejected):
+            bar.progress(min(uploaded.tell() / total, 1.0), text=f"{imported} imported, {rejected} rejected")
+
+        text = io.TextIOWrapper(uploaded, encoding="utf-8-sig", newline="")
+        try:
+            result = import_csv(kind, text, batch, progress=progress, connect=get_db_connection)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        bar.progress(1.0)
+        st.success(f"Imported {result['imported']} of {result['rows']} rows into {table} "
+                   f"in {result['seconds']:.1f}s.")
+        if result["rejected"]:
+            st.warning(f"{len(result['rejected'])} rows rejected")
+            st.dataframe(pd.DataFrame([(line, reason) for line, reason, _ in result["rejected"]],
+                                      columns=["line", "reason"]))
+            report = io.StringIO()
+            write_rejects(result["rejected"], report)
+            st.download_button("Download rejected rows", report.getvalue(),
+                               file_name=f"{kind}_rejects.csv", mime="text/csv")
 
 
 # Customer Dashboard
 def customer_dashboard():
     st.title("Customer Dashboard 🛍")
-    menu = ["View Books", "Buy Book", "View Purchase History", "Logout"]
+    customer = st.session_state.get("customer")
+    if customer:
+        st.caption(f"Signed in as {customer['c_name']} ({customer['address']})")
+    menu = ["View Books", "Books by Author", "Buy Book", "Cart", "View Purchase History", "Logout"]
     choice = st.sidebar.selectbox("Select an option", menu)
 
     if choice == "View Books":
         view_books_for_customer()
+    elif choice == "Books by Author":
+        browse_by_author("customer")
     elif choice == "Buy Book":
         buy_book()
+    elif choice == "Cart":
+        view_cart()
     elif choice == "View Purchase History":
         view_purchase_history()
     elif choice == "Logout":
@@ -352,11 +782,16 @@ def customer_dashboard():
 
 def view_books_for_customer():
     st.subheader("View Available Books")
-    connection = get_db_connection()
-    query = "SELECT * FROM books WHERE quantity > 0"
-    df = pd.read_sql(query, connection)
-    st.dataframe(df)
-    connection.close()
+    query = st.text_input("Search by title, author or genre", key="book_search")
+    if query.strip():
+        columns, rows = search_books(query)
+        if rows:
+            st.dataframe(pd.DataFrame(rows, columns=columns))
+        else:
+            st.write("No books match your search.")
+    else:
+        columns, rows = available_books()
+        st.dataframe(pd.DataFrame(rows, columns=columns))
 
 def view_purchase_history():
     if 'cust_id' not in st.session_state:
@@ -364,21 +799,28 @@ def view_purchase_history():
         return
 
     st.subheader("View Purchase History")
-    connection = get_db_connection()
-    query = f"SELECT * FROM reports WHERE c_id = {st.session_state.cust_id}"
-    df = pd.read_sql(query, connection)
-    if df.empty:
+    cust_id = st.session_state.cust_id
+    rows = paged_table(f"history_{cust_id}", "reports", "r_no", "c_id = %s", (cust_id,))
+    if not rows:
         st.write("No purchases yet.")
-    else:
-        st.dataframe(df)
-    connection.close()
+        return
+    show_report_summary(customer_report(cust_id))
+
+    st.subheader("Return a Purchase")
+    r_no = st.number_input("Report No", min_value=1, key="return_r_no")
+    qty = st.number_input("Copies to return", min_value=1, key="return_quantity")
+    reason = st.text_input("Reason (optional)", key="return_reason")
+    if st.button("Return"):
+        try:
+            _, amount = return_purchase(r_no, qty, cust_id, session(st.session_state.auth_token)["login_id"],
+                                        reason or None)
+            st.success(f"Return accepted. Refund: ₹{float(amount):.2f}")
+        except RefundError as e:
+            st.error(str(e))
 
 def logout():
-    del st.session_state.user_role
-    if "cust_id" in st.session_state:
-        del st.session_state.cust_id
-    st.success("Logged out successfully.")
-    user_login()
+    end_session("Logged out successfully.")
+    st.rerun()
 
 
 def buy_book():
@@ -387,36 +829,44 @@ def buy_book():
     qty = st.number_input("Enter quantity", min_value=1, key="buy_quantity")
 
     if st.button("Buy"):
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute("SELECT quantity, price FROM books WHERE b_id = %s", (b_id,))
-        result = cursor.fetchone()
-
-        if result:
-            stock, price = result
-            if qty <= stock:
-                total_price = qty * float(price)
-                today = date.today()
-                cursor.execute(
-                    "INSERT INTO reports (b_id, c_id, date_of_purchase, quantity, price) VALUES (%s, %s, %s, %s, %s)",
-                    (b_id, st.session_state.cust_id, today, qty, total_price)
-                )
+        try:
+            r_no, total_price = buy(b_id, st.session_state.cust_id, qty)
+            st.success(f"Purchase successful! Total: ₹{float(total_price):.2f}")
+            if r_no is None:
+                st.caption("Your receipt will appear in your purchase history in a moment.")
+        except PurchaseError as e:
+            st.error(str(e))
+
+
+# Cart: collect several books, then buy them all in one transaction
+def view_cart():
+    st.subheader("Cart")
+    cart = st.session_state.setdefault("cart", {})
+    b_id = st.number_input("Book ID", min_value=1, key="cart_book_id")
+    qty = st.number_input("Quantity", min_value=1, key="cart_quantity")
+
+    if st.button("Add to Cart"):
+        add_to_cart(cart, int(b_id), int(qty))
+
+    if not cart:
+        st.write("Your cart is empty.")
+        return
 
-                cursor.execute("UPDATE books SET quantity = quantity - %s WHERE b_id = %s", (qty, b_id))
-                connection.commit()
-                st.success(f"Purchase successful! Total: ₹{total_price:.2f}")
-            else:
-                st.error("Not enough stock available.")
-        else:
-            st.error("Book not found.")
-        connection.close()
+    st.dataframe(pd.DataFrame(sorted(cart.items()), columns=["b_id", "quantity"]))
+    remove_id = st.selectbox("Remove a book", sorted(cart), key="cart_remove_id")
+    if st.button("Remove"):
+        remove_from_cart(cart, remove_id)
+        st.rerun()
+
+    if st.button("Checkout"):
+        try:
+            lines, total = checkout_cart(cart, st.session_state.cust_id)
+            cart.clear()
+            st.success(f"Purchased {len(lines)} book(s). Total: ₹{float(total):.2f}")
+        except PurchaseError as e:
+            st.error(str(e))
 
 
 # Run app
 if __name__ == "__main__":
-    if "user_role" not in st.session_state:
-        user_login()
-    elif st.session_state.user_role == "admin":
-        admin_dashboard()
-    else:
-        customer_dashboard()
\ No newline at end of file
+    run()
\ No newline at end of file